@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+'''Benchmarks of the alignment hot paths, in the layout of airspeed velocity
+(asv): ``time_`` methods are timed, ``track_`` methods report a throughput
+in their ``unit`` and ``peakmem_`` methods the peak resident memory.  Inputs
+are seeded synthetic sequences and the demo files of the C library, so runs
+are comparable across releases.  Run them with::
+
+    asv run
+
+or, with no asv installed, against the package on the path with::
+
+    python -m benchmarks [-b REGEX]
+'''
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+'''Run the benchmarks without asv, printing one line per benchmark and
+parameter combination.  ``time_`` benchmarks report the best of ``--repeat``
+timings per call and ``peakmem_`` benchmarks the peak resident memory of a
+forked process running the setup and the benchmark once
+'''
+import argparse
+import importlib
+import inspect
+import itertools
+import os
+import re
+import sys
+import time
+from typing import (
+    List,
+    Optional
+)
+
+MODULES = ('bench_align', 'bench_files', 'bench_render')
+
+PREFIXES = ('time_', 'track_', 'peakmem_')
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1.), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return "%.3g %s" % (seconds/scale, unit)
+    return "%.3g ns" % (seconds*1e9)
+# end def
+
+def format_bytes(size: float) -> str:
+    for unit, scale in (('G', 1 << 30), ('M', 1 << 20), ('k', 1 << 10)):
+        if size >= scale:
+            return "%.3g %s" % (size/scale, unit)
+    return "%d bytes" % size
+# end def
+
+def best_call_time(fn, repeat: int, min_sample: float = 0.05) -> float:
+    '''Best time per call of ``fn`` over ``repeat`` samples of enough calls
+    to last ``min_sample`` seconds
+    '''
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_sample:
+            break
+        number *= 10 if elapsed < min_sample/10 else 2
+    best = elapsed/number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start)/number)
+    return best
+# end def
+
+def peak_memory(cls, name: str, args: tuple) -> Optional[int]:
+    '''Peak resident bytes of a forked process that sets up ``cls`` and
+    runs benchmark ``name`` once, or None where fork is unavailable
+    '''
+    if not hasattr(os, 'fork'):
+        return None
+    import resource
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            bench = cls()
+            if hasattr(bench, 'setup'):
+                bench.setup(*args)
+            getattr(bench, name)(*args)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kilobytes on Linux, bytes on macOS
+            if sys.platform != 'darwin':
+                peak *= 1024
+            os.write(write_fd, str(peak).encode('ascii'))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as fd:
+        out = fd.read()
+    os.waitpid(pid, 0)
+    return int(out) if out else None
+# end def
+
+def benchmarks(module):
+    '''Benchmark classes of ``module`` with their parameter combinations
+    '''
+    for cls_name, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__ != module.__name__:
+            continue
+        names = [name for name in dir(cls) if name.startswith(PREFIXES)]
+        if not names:
+            continue
+        params = getattr(cls, 'params', [])
+        if params and not isinstance(params[0], (list, tuple)):
+            params = [params]
+        yield cls_name, cls, names, list(itertools.product(*params))
+# end def
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                    description=__doc__.split('\n\n')[0])
+    parser.add_argument('-b', '--bench', default='',
+        help="only run benchmarks whose full name matches this regex")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+        help="timing samples per time_ benchmark. default 5")
+    args = parser.parse_args(argv)
+    pattern = re.compile(args.bench)
+
+    for module_name in MODULES:
+        module = importlib.import_module('.' + module_name, __package__)
+        for cls_name, cls, names, combos in benchmarks(module):
+            for combo in combos:
+                full_names = ["%s.%s.%s%s" % (module_name, cls_name, name,
+                                                repr(combo) if combo else '')
+                                for name in names]
+                selected = [(name, full) for name, full in zip(names, full_names)
+                            if pattern.search(full)]
+                if not selected:
+                    continue
+                bench = cls()
+                try:
+                    if hasattr(bench, 'setup'):
+                        bench.setup(*combo)
+                except NotImplementedError:
+                    for _, full in selected:
+                        print("%-70s skipped" % full)
+                    continue
+                for name, full in selected:
+                    method = getattr(bench, name)
+                    if name.startswith('time_'):
+                        value = format_seconds(best_call_time(lambda: method(*combo), args.repeat))
+                    elif name.startswith('track_'):
+                        value = "%.4g %s" % (method(*combo), getattr(method, 'unit', ''))
+                    else:
+                        peak = peak_memory(cls, name, combo)
+                        value = 'n/a' if peak is None else format_bytes(peak)
+                    print("%-70s %s" % (full, value), flush=True)
+                if hasattr(bench, 'teardown'):
+                    bench.teardown(*combo)
+    return 0
+# end def
+
+if __name__ == '__main__':
+    sys.exit(main())
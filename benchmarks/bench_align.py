@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+'''Benchmarks of setting reads and references and of aligning them
+'''
+from ssw import (
+    SSW,
+    force_align,
+    force_align_batch
+)
+
+from .common import (
+    CHROMOSOME_LENGTH,
+    random_sequence,
+    rate,
+    sample_reads
+)
+
+class SetRead:
+    params = [[50, 150, 1000, 10000]]
+    param_names = ['read_length']
+
+    def setup(self, read_length):
+        self.reads = [random_sequence(read_length, seed) for seed in (1, 2)]
+        self.aligner = SSW()
+
+    def time_setRead(self, read_length):
+        # alternate reads so nothing is reused from the last call
+        self.aligner.setRead(self.reads[0])
+        self.aligner.setRead(self.reads[1])
+
+class SetReference:
+    params = [[10_000, 1_000_000, CHROMOSOME_LENGTH]]
+    param_names = ['reference_length']
+    timeout = 120
+
+    def setup(self, reference_length):
+        self.reference = random_sequence(reference_length)
+        self.aligner = SSW()
+
+    def time_setReference(self, reference_length):
+        self.aligner.setReference(self.reference)
+
+    def peakmem_setReference(self, reference_length):
+        self.aligner.setReference(self.reference)
+
+class Align:
+    '''One read against a reference it was drawn from, for each output mode
+    '''
+    params = [[100, 1000], [10_000, 1_000_000], ['score', 'cigar']]
+    param_names = ['read_length', 'reference_length', 'mode']
+    timeout = 120
+
+    def setup(self, read_length, reference_length, mode):
+        self.reference = random_sequence(reference_length)
+        (self.read,), _ = sample_reads(self.reference, 1, read_length)
+        self.aligner = SSW(score_size='auto')
+        self.aligner.setRead(self.read)
+        self.aligner.setReference(self.reference)
+        self.mode = mode
+
+    def time_align(self, read_length, reference_length, mode):
+        self.aligner.align(mode=self.mode)
+
+    def peakmem_align(self, read_length, reference_length, mode):
+        self.aligner.align(mode=self.mode)
+
+    def track_alignments_per_s(self, read_length, reference_length, mode):
+        return rate(lambda: self.aligner.align(mode=self.mode), 1)
+    track_alignments_per_s.unit = 'alignments/s'
+
+    def track_cells_per_s(self, read_length, reference_length, mode):
+        cells = len(self.read)*len(self.reference)
+        return rate(lambda: self.aligner.align(mode=self.mode), cells)
+    track_cells_per_s.unit = 'cell updates/s'
+
+class AlignChromosome:
+    '''A short read against a chromosome scale reference
+    '''
+    timeout = 300
+
+    def setup(self):
+        self.reference = random_sequence(CHROMOSOME_LENGTH)
+        (self.read,), _ = sample_reads(self.reference, 1, 150)
+        self.aligner = SSW()
+        self.aligner.setRead(self.read)
+        self.aligner.setReference(self.reference)
+
+    def time_align(self):
+        self.aligner.align()
+
+    def peakmem_align(self):
+        self.aligner.align()
+
+    def track_cells_per_s(self):
+        cells = len(self.read)*len(self.reference)
+        return rate(self.aligner.align, cells, min_time=1.0)
+    track_cells_per_s.unit = 'cell updates/s'
+
+class ScoreSize:
+    '''A short read scores within the 8 bit kernel, a saturating one
+    overflows it and has to be aligned again by the 16 bit kernel, unless
+    the score size policy starts there
+    '''
+    params = [['byte', 'word', 'both', 'auto', 'adaptive'], ['short', 'saturating']]
+    param_names = ['score_size', 'read']
+
+    def setup(self, score_size, read):
+        if score_size == 'byte' and read == 'saturating':
+            raise NotImplementedError("the 8 bit kernel can't score this read")
+        self.reference = random_sequence(100_000)
+        length = 60 if read == 'short' else 400
+        self.aligner = SSW(score_size=score_size)
+        self.aligner.setRead(self.reference[5000:5000 + length])
+        self.aligner.setReference(self.reference)
+
+    def time_align(self, score_size, read):
+        self.aligner.align()
+
+class AlignBatch:
+    params = [[1, 4]]
+    param_names = ['threads']
+    timeout = 120
+
+    def setup(self, threads):
+        self.reference = random_sequence(20_000)
+        self.reads, _ = sample_reads(self.reference, 200, 150)
+        self.aligner = SSW()
+        self.aligner.setReference(self.reference)
+
+    def time_align_batch(self, threads):
+        self.aligner.align_batch(self.reads, threads=threads)
+
+    def track_alignments_per_s(self, threads):
+        return rate(lambda: self.aligner.align_batch(self.reads, threads=threads),
+                    len(self.reads))
+    track_alignments_per_s.unit = 'alignments/s'
+
+class ForceAlign:
+    params = [[50, 150]]
+    param_names = ['read_length']
+
+    def setup(self, read_length):
+        self.reference = random_sequence(1000)
+        self.reads, _ = sample_reads(self.reference, 1000, read_length)
+        self.references = [self.reference]*len(self.reads)
+
+    def time_force_align(self, read_length):
+        force_align(self.reads[0], self.reference)
+
+    def time_force_align_batch(self, read_length):
+        force_align_batch(self.reads, self.references)
+
+    def track_alignments_per_s(self, read_length):
+        return rate(lambda: force_align_batch(self.reads, self.references),
+                    len(self.reads))
+    track_alignments_per_s.unit = 'alignments/s'
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+'''Benchmarks on the demo files of the C library
+'''
+import io
+import os
+
+from ssw import (
+    SSW,
+    align_file,
+    align_file_sam
+)
+
+from .common import (
+    DEMO_PATH,
+    rate,
+    read_fasta
+)
+
+QUERY_FASTQ = os.path.join(DEMO_PATH, '54mer_hap1_1.100.fastq')
+QUERY_FASTA = os.path.join(DEMO_PATH, '54mer_hap1_1.100.fa')
+TARGET_GZ = os.path.join(DEMO_PATH, 'Virus_genome.fa.gz')
+
+class DemoFiles:
+    '''The 100 54mer reads against the gzipped virus genome, through the
+    streaming file path
+    '''
+
+    def time_align_file(self):
+        for chunk in align_file(QUERY_FASTQ, TARGET_GZ):
+            pass
+
+    def time_align_file_sam(self):
+        align_file_sam(QUERY_FASTQ, TARGET_GZ, io.BytesIO())
+
+class DemoReference:
+    '''The 100 54mer reads against each of the 1 kbp to 100 kbp demo
+    references
+    '''
+    params = [['1k.fa', '10k.fa', '100k.fa']]
+    param_names = ['reference']
+    timeout = 120
+
+    def setup(self, reference):
+        self.reads = [seq for _, seq in read_fasta(QUERY_FASTA)]
+        (_, self.reference), = read_fasta(os.path.join(DEMO_PATH, reference))
+        self.aligner = SSW()
+        self.aligner.setReference(self.reference)
+
+    def time_align_batch(self, reference):
+        self.aligner.align_batch(self.reads)
+
+    def peakmem_align_batch(self, reference):
+        self.aligner.align_batch(self.reads)
+
+    def track_cells_per_s(self, reference):
+        cells = sum(len(read) for read in self.reads)*len(self.reference)
+        return rate(lambda: self.aligner.align_batch(self.reads), cells)
+    track_cells_per_s.unit = 'cell updates/s'
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''Benchmarks of turning alignments into text: BLAST style renderings,
+SAM records and CIGAR strings
+'''
+import io
+
+from ssw import (
+    SAMWriter,
+    SSW,
+    cigar_to_str,
+    force_align,
+    format_force_align,
+    render_alignments
+)
+
+from .common import (
+    random_sequence,
+    rate,
+    sample_reads
+)
+
+class Render:
+    '''1000 alignments of 150 nt reads against a 100 kbp reference
+    '''
+
+    def setup(self):
+        self.reference = random_sequence(100_000)
+        self.reads, _ = sample_reads(self.reference, 1000, 150)
+        aligner = SSW()
+        aligner.setReference(self.reference)
+        self.alignments = []
+        for read in self.reads:
+            aligner.setRead(read)
+            self.alignments.append(aligner.align())
+        self.batch = aligner.align_batch(self.reads)
+        self.names = ['read%d' % i for i in range(len(self.reads))]
+        self.force = force_align(self.reads[0], self.reference[:1000])
+
+    def time_render_alignments(self):
+        render_alignments(self.alignments, self.reference, self.reads)
+
+    def time_render_alignments_to_file(self):
+        render_alignments(self.alignments, self.reference, self.reads, out=io.BytesIO())
+
+    def track_render_alignments_per_s(self):
+        return rate(lambda: render_alignments(self.alignments, self.reference, self.reads),
+                    len(self.alignments))
+    track_render_alignments_per_s.unit = 'alignments/s'
+
+    def time_format_force_align(self):
+        format_force_align(self.reads[0], self.reference[:1000], self.force)
+
+    def time_cigar_to_str(self):
+        cigars, offsets = self.batch.cigars, self.batch.cigar_offsets
+        for i in range(len(self.reads)):
+            cigar_to_str(cigars[offsets[i]:offsets[i + 1]])
+
+    def time_sam_write(self):
+        with SAMWriter(io.BytesIO()) as writer:
+            for name, read, alignment in zip(self.names, self.reads, self.alignments):
+                writer.write(alignment, read, self.reference, name, 'chr')
+
+    def time_sam_write_batch(self):
+        with SAMWriter(io.BytesIO()) as writer:
+            writer.write_batch(self.batch, self.reads, self.reference, self.names, 'chr')
+
+    def track_sam_records_per_s(self):
+        def write():
+            with SAMWriter(io.BytesIO()) as writer:
+                writer.write_batch(self.batch, self.reads, self.reference, self.names, 'chr')
+        return rate(write, len(self.reads))
+    track_sam_records_per_s.unit = 'records/s'
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+'''Seeded synthetic sequences and the demo files of the C library shared by
+the benchmarks, so every run times the same work
+'''
+import os
+import time
+from typing import (
+    Callable,
+    List,
+    Tuple
+)
+
+import numpy as np
+
+SEED = 20180607
+
+DEMO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'ssw', 'lib', 'CSSWL', 'demo')
+
+BASES = np.frombuffer(b'ACGT', dtype=np.uint8)
+
+# length of the chromosome scale reference
+CHROMOSOME_LENGTH = 25_000_000
+
+def random_sequence(length: int, seed: int = SEED) -> str:
+    '''Uniformly random ACGT sequence
+
+    Args:
+        length: number of bases
+        seed: seed of the generator. default SEED
+
+    Returns:
+        the sequence
+    '''
+    rng = np.random.default_rng(seed)
+    return BASES[rng.integers(0, 4, length)].tobytes().decode('ascii')
+# end def
+
+def mutate(seq: str, rate: float, seed: int = SEED) -> str:
+    '''Substitute, insert or delete each base with probability ``rate``,
+    a third of the time each
+
+    Args:
+        seq: sequence to mutate
+        rate: probability of an edit per base
+        seed: seed of the generator. default SEED
+
+    Returns:
+        the mutated sequence
+    '''
+    rng = np.random.default_rng(seed)
+    draws = rng.random(len(seq))
+    picks = rng.integers(0, 4, len(seq))
+    out = []
+    for base, draw, pick in zip(seq, draws.tolist(), picks.tolist()):
+        if draw >= rate:
+            out.append(base)
+        elif draw < rate/3:
+            out.append('ACGT'[pick])
+        elif draw < 2*rate/3:
+            out.append(base + 'ACGT'[pick])
+    return ''.join(out)
+# end def
+
+def sample_reads(   reference: str,
+                    num: int,
+                    length: int,
+                    rate: float = 0.02,
+                    seed: int = SEED) -> Tuple[List[str], List[int]]:
+    '''Reads drawn from random positions of ``reference`` and mutated
+
+    Args:
+        reference: sequence to draw from
+        num: number of reads
+        length: length of each read before mutation
+        rate: edit rate passed to :func:`mutate`. default 0.02
+        seed: seed of the generator. default SEED
+
+    Returns:
+        the reads and their start positions in ``reference``
+    '''
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, len(reference) - length + 1, num).tolist()
+    reads = [mutate(reference[start:start + length], rate, seed + i)
+            for i, start in enumerate(starts)]
+    return reads, starts
+# end def
+
+def read_fasta(path: str) -> List[Tuple[str, str]]:
+    '''Records of a small plain FASTA file such as the demo files
+
+    Returns:
+        list of (name, sequence)
+    '''
+    records = []
+    with open(path) as fd:
+        for line in fd:
+            line = line.strip()
+            if line.startswith('>'):
+                records.append((line[1:].split()[0], []))
+            elif line:
+                records[-1][1].append(line)
+    return [(name, ''.join(lines)) for name, lines in records]
+# end def
+
+def rate(fn: Callable, work: float, min_time: float = 0.2) -> float:
+    '''Throughput of ``fn``, calling it until ``min_time`` seconds pass
+
+    Args:
+        fn: function doing ``work`` units of work per call
+        work: units of work per call
+        min_time: seconds to run for. default 0.2
+
+    Returns:
+        units of work per second
+    '''
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return work*calls/elapsed
+# end def
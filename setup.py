@@ -49,8 +49,10 @@ common_include = ['ssw/lib/CSSWL/src', 'ssw/lib']
 
 if sys.platform == 'win32':
     extra_compile_args = ['']
+    libraries = ['zlib']
 else:
     extra_compile_args = ['-Wno-unused-function']
+    libraries = ['z']
 
 # source files to include in installation for tar.gz
 ssw_files = [rpath(pjoin(root, f), MODULE_PATH) for root, _, files in
@@ -63,8 +65,14 @@ ssw_ext = Extension(
     'ssw.sswpy',
     sources=['ssw/sswpy.pyx',
              'ssw/lib/CSSWL/src/ssw.c',
-             'ssw/lib/str_util.c'],
+             'ssw/lib/CSSWL/src/ssw_sse2.c',
+             'ssw/lib/CSSWL/src/ssw_avx2.c',
+             'ssw/lib/CSSWL/src/ssw_avx512.c',
+             'ssw/lib/str_util.c',
+             'ssw/lib/seq_reader.c',
+             'ssw/lib/edit_dist.c'],
     include_dirs=common_include + [numpy.get_include()],
+    libraries=libraries,
     extra_compile_args=extra_compile_args
 )
 
@@ -106,6 +114,10 @@ setup(
     ext_modules=[ssw_ext],
     include_dirs=numpy.distutils.misc_util.get_numpy_include_dirs(),
     package_data={'ssw': ssw_files},
+    install_requires=['numpy'],
+    entry_points={
+        'console_scripts': ['ssw = ssw.cli:main']
+    },
     description=DESCRIPTION,
     long_description=LONG_DESCRIPTION,
     license=LICENSE,
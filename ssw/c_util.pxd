@@ -1,4 +1,5 @@
 from cpython.ref cimport PyObject
+from cpython.buffer cimport Py_buffer
 from cpython.mem cimport PyMem_Malloc, PyMem_Free
 from libc.string cimport memcpy
 
@@ -23,10 +24,12 @@ cdef extern from "Python.h":
     cdef object PyBytes_FromStringAndSize(const char *, Py_ssize_t)
     cdef char* PyBytes_AsString(object)
 
-    cdef char* PyUnicode_AsUTF8AndSize(object, Py_ssize_t *)
+    cdef const char* PyUnicode_AsUTF8AndSize(object, Py_ssize_t *)
     cdef object PyUnicode_FromString(const char *)
     cdef object PyUnicode_FromStringAndSize(const char *, Py_ssize_t)
-    cdef char* PyUnicode_AsUTF8(object)
+    cdef const char* PyUnicode_AsUTF8(object)
+
+    cdef Py_buffer* PyMemoryView_GET_BUFFER(object)
 
 """
 The following functions take a
@@ -57,14 +60,14 @@ cdef inline object copy_obj_to_cstr_unsafe(    object o1,
         #    raise OSError("copy_obj_to_cstr:")
         c_str2[0] = PyBytes_AsString(o2)
     else:
-        c_str1 = PyUnicode_AsUTF8AndSize(o1, length)
+        c_str1 = <char*> PyUnicode_AsUTF8AndSize(o1, length)
         if c_str1 == NULL:
             raise OSError("copy_obj_to_cstr:")
         b_length = length[0]
         o2 = PyUnicode_FromStringAndSize(<const char *>c_str1, b_length)
         #if o2 == NULL:
         #    raise OSError("copy_obj_to_cstr:")
-        c_str2[0] = PyUnicode_AsUTF8(o2)
+        c_str2[0] = <char*> PyUnicode_AsUTF8(o2)
 
     return o2
 # end def
@@ -97,7 +100,7 @@ cdef inline int copy_obj_to_cstr(object o1,
             return -1
     else:
         obj_type = 0
-        c_str1 = PyUnicode_AsUTF8AndSize(o1, length)
+        c_str1 = <char*> PyUnicode_AsUTF8AndSize(o1, length)
         if c_str1 == NULL:
             #raise OSError("copy_obj_to_cstr:")
             return -1
@@ -177,7 +180,7 @@ cdef inline char* obj_to_cstr(object o1):
             raise TypeError("obj_to_cstr:")
         return c_str1
     else:
-        c_str1 = PyUnicode_AsUTF8AndSize(o1, &length)
+        c_str1 = <char*> PyUnicode_AsUTF8AndSize(o1, &length)
         if c_str1 == NULL:
             raise OSError("obj_to_cstr:")
     return c_str1
@@ -193,7 +196,7 @@ cdef inline char* obj_to_cstr_len(object o1, Py_ssize_t *length):
             raise TypeError("obj_to_cstr: PyBytes_AsStringAndSize error")
         return c_str1
     else:
-        c_str1 = PyUnicode_AsUTF8AndSize(o1, length)
+        c_str1 = <char*> PyUnicode_AsUTF8AndSize(o1, length)
         if c_str1 == NULL:
             raise OSError("obj_to_cstr: PyUnicode_AsUTF8AndSize error")
     return c_str1
@@ -211,3 +214,44 @@ cdef inline char* copy_string(char* in_str, int length):
 cdef inline void copy_string_buffer(char* in_str, char* out_str, int length):
     memcpy(out_str, in_str, length+1)
 
+
+"""
+The following functions take a
+
+o1 - str, bytes or any object supporting the buffer protocol with 1 byte
+    items such as bytearray, memoryview or a NumPy uint8 array
+returns:
+    o2 - o1 itself for str and bytes, otherwise a flat unsigned byte
+        memoryview of o1 that keeps the buffer exported for as long as it
+        is alive. Pass o2 to buffer_to_cstr_len
+
+No data is copied so slices of large buffers are used in place
+"""
+cdef inline object obj_to_buffer(object o1):
+    cdef object view
+    if PyBytes_Check(o1) or isinstance(o1, str):
+        return o1
+    view = memoryview(o1)
+    if view.itemsize != 1:
+        raise TypeError("sequence buffers must have 1 byte items, not {!r}".format(view.format))
+    if not view.c_contiguous:
+        raise ValueError("sequence buffers must be contiguous")
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast('B')
+    return view
+# end def
+
+"""
+Same as obj_to_cstr_len but also takes the memoryviews returned by
+obj_to_buffer
+"""
+cdef inline const char* buffer_to_cstr_len(object o1, Py_ssize_t *length) except NULL:
+    cdef Py_buffer* buf
+    if PyBytes_Check(o1) or isinstance(o1, str):
+        return obj_to_cstr_len(o1, length)
+    buf = PyMemoryView_GET_BUFFER(o1)
+    length[0] = buf.len
+    if buf.buf == NULL:
+        return ""
+    return <const char*> buf.buf
+# end def
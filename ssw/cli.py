@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+'''Command line interface aligning every query read of a FASTA/FASTQ file
+against every target sequence, like the ``ssw_test`` program of the original
+C library.  Output is one tab separated line per alignment with 0-based
+coordinates, or SAM
+'''
+import argparse
+import sys
+from typing import (
+    List,
+    Optional,
+    TextIO
+)
+
+from ssw import (
+    align_file,
+    align_file_sam,
+    cigar_to_str,
+    AlignmentChunk
+)
+
+HEADER = '\t'.join((
+    '#target_name',
+    'query_name',
+    'optimal_score',
+    'sub_optimal_score',
+    'reference_start',
+    'reference_end',
+    'read_start',
+    'read_end',
+    'CIGAR'
+))
+
+def write_chunk(chunk: AlignmentChunk, out: TextIO):
+    res = chunk.alignments
+    cigars = res.cigars
+    cigar_offsets = res.cigar_offsets.tolist()
+    rows = zip(
+        chunk.query_names,
+        res.optimal_score.tolist(),
+        res.sub_optimal_score.tolist(),
+        res.reference_start.tolist(),
+        res.reference_end.tolist(),
+        res.read_start.tolist(),
+        res.read_end.tolist()
+    )
+    lines = []
+    for i, row in enumerate(rows):
+        cigar = cigar_to_str(cigars[cigar_offsets[i]:cigar_offsets[i + 1]])
+        lines.append("%s\t%s\t%d\t%d\t%d\t%d\t%d\t%d\t%s\n" %
+            ((chunk.target_name,) + row + (cigar or '*',)))
+    out.write(''.join(lines))
+# end def
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='ssw',
+        description="Striped Smith-Waterman alignment of every query against "
+                    "every target. Files may be FASTA or FASTQ, gzipped or not"
+    )
+    parser.add_argument('target', help="target (reference) sequence file")
+    parser.add_argument('query', help="query (read) sequence file")
+    parser.add_argument('-m', '--match', type=int, default=2,
+        help="match score. default 2")
+    parser.add_argument('-x', '--mismatch', type=int, default=2,
+        help="mismatch penalty. default 2")
+    parser.add_argument('-o', '--gap-open', type=int, default=3,
+        help="gap open penalty. default 3")
+    parser.add_argument('-e', '--gap-extension', type=int, default=1,
+        help="gap extension penalty. default 1")
+    parser.add_argument('-t', '--threads', type=int, default=1,
+        help="number of alignment threads, 0 for every core. default 1")
+    parser.add_argument('-c', '--chunk-size', type=int, default=4096,
+        help="number of queries aligned per chunk. default 4096")
+    parser.add_argument('--score-size', default='both',
+        choices=('both', 'byte', 'word', 'auto', 'adaptive'),
+        help="striped kernel score size policy. default both")
+    parser.add_argument('--output', default=None,
+        help="output file. default stdout")
+    parser.add_argument('-f', '--format', default='tsv', choices=('tsv', 'sam'),
+        help="output format. default tsv")
+    args = parser.parse_args(argv)
+
+    if args.format == 'sam':
+        out = sys.stdout.buffer if args.output is None else args.output
+        align_file_sam( args.query,
+                        args.target,
+                        out,
+                        match_score=args.match,
+                        mismatch_penalty=args.mismatch,
+                        gap_open=args.gap_open,
+                        gap_extension=args.gap_extension,
+                        chunk_size=args.chunk_size,
+                        threads=args.threads,
+                        score_size=args.score_size)
+        return 0
+
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        out.write(HEADER + '\n')
+        for chunk in align_file(args.query,
+                                args.target,
+                                match_score=args.match,
+                                mismatch_penalty=args.mismatch,
+                                gap_open=args.gap_open,
+                                gap_extension=args.gap_extension,
+                                chunk_size=args.chunk_size,
+                                threads=args.threads,
+                                score_size=args.score_size):
+            write_chunk(chunk, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+# end def
+
+if __name__ == '__main__':
+    sys.exit(main())
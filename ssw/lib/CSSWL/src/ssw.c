@@ -42,7 +42,13 @@
 #include <stdio.h>
 #include <string.h>
 #include <math.h>
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <time.h>
+#endif
 #include "ssw.h"
+#include "ssw_simd.h"
 
 #ifdef __GNUC__
 #define LIKELY(x) __builtin_expect((x),1)
@@ -65,20 +71,15 @@
  */
 #define kroundup32(x) (--(x), (x)|=(x)>>1, (x)|=(x)>>2, (x)|=(x)>>4, (x)|=(x)>>8, (x)|=(x)>>16, ++(x))
 
-typedef struct {
-	uint16_t score;
-	int32_t ref;	 //0-based position
-	int32_t read;    //alignment ending position on read, 0-based
-} alignment_end;
-
 typedef struct {
 	uint32_t* seq;
 	int32_t length;
 } cigar;
 
 struct _profile{
-	__m128i* profile_byte;	// 0: none
-	__m128i* profile_word;	// 0: none
+	void* profile_byte;	// 0: none
+	void* profile_word;	// 0: none
+	const ssw_kernels* kernels;	// instruction set the profiles were built for
 	const int8_t* read;
 	const int8_t* mat;
 	int32_t readLen;
@@ -123,452 +124,8 @@ const uint8_t encoded_ops[] = {
 	0 /* | */, 0 /* } */, 0 /* ~ */, 0 /*  */
 };
 
-/* Generate query profile rearrange query sequence & calculate the weight of match/mismatch. */
-static __m128i* qP_byte (const int8_t* read_num,
-				  const int8_t* mat,
-				  const int32_t readLen,
-				  const int32_t n,	/* the edge length of the squre matrix mat */
-				  uint8_t bias) {
-
-	int32_t segLen = (readLen + 15) / 16; /* Split the 128 bit register into 16 pieces.
-								     Each piece is 8 bit. Split the read into 16 segments.
-								     Calculat 16 segments in parallel.
-								   */
-	__m128i* vProfile = (__m128i*)malloc(n * segLen * sizeof(__m128i));
-	int8_t* t = (int8_t*)vProfile;
-	int32_t nt, i, j, segNum;
-
-	/* Generate query profile rearrange query sequence & calculate the weight of match/mismatch */
-	for (nt = 0; LIKELY(nt < n); nt ++) {
-		for (i = 0; i < segLen; i ++) {
-			j = i;
-			for (segNum = 0; LIKELY(segNum < 16) ; segNum ++) {
-				*t++ = j>= readLen ? bias : mat[nt * n + read_num[j]] + bias;
-				j += segLen;
-			}
-		}
-	}
-	return vProfile;
-}
-
-/* Striped Smith-Waterman
-   Record the highest score of each reference position.
-   Return the alignment score and ending position of the best alignment, 2nd best alignment, etc.
-   Gap begin and gap extension are different.
-   wight_match > 0, all other weights < 0.
-   The returned positions are 0-based.
- */
-static alignment_end* sw_sse2_byte (const int8_t* ref,
-							 int8_t ref_dir,	// 0: forward ref; 1: reverse ref
-							 int32_t refLen,
-							 int32_t readLen,
-							 const uint8_t weight_gapO, /* will be used as - */
-							 const uint8_t weight_gapE, /* will be used as - */
-							 const __m128i* vProfile,
-							 uint8_t terminate,	/* the best alignment score: used to terminate
-												   the matrix calculation when locating the
-												   alignment beginning point. If this score
-												   is set to 0, it will not be used */
-	 						 uint8_t bias,  /* Shift 0 point to a positive value. */
-							 int32_t maskLen) {
-
-// Put the largest number of the 16 numbers in vm into m.
-#define max16(m, vm) (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 8)); \
-					  (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 4)); \
-					  (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 2)); \
-					  (vm) = _mm_max_epu8((vm), _mm_srli_si128((vm), 1)); \
-					  (m) = _mm_extract_epi16((vm), 0)
-
-	uint8_t max = 0;		                     /* the max alignment score */
-	int32_t end_read = readLen - 1;
-	int32_t end_ref = -1; /* 0_based best alignment ending point; Initialized as isn't aligned -1. */
-	int32_t segLen = (readLen + 15) / 16; /* number of segment */
-
-	/* array to record the largest score of each reference position */
-	uint8_t* maxColumn = (uint8_t*) calloc(refLen, 1);
-
-	/* array to record the alignment read ending position of the largest score of each reference position */
-	int32_t* end_read_column = (int32_t*) calloc(refLen, sizeof(int32_t));
-
-	/* Define 16 byte 0 vector. */
-	__m128i vZero = _mm_set1_epi32(0);
-
-	__m128i* pvHStore = (__m128i*) calloc(segLen, sizeof(__m128i));
-	__m128i* pvHLoad = (__m128i*) calloc(segLen, sizeof(__m128i));
-	__m128i* pvE = (__m128i*) calloc(segLen, sizeof(__m128i));
-	__m128i* pvHmax = (__m128i*) calloc(segLen, sizeof(__m128i));
-
-	int32_t i, j;
-	/* 16 byte insertion begin vector */
-	__m128i vGapO = _mm_set1_epi8(weight_gapO);
-
-	/* 16 byte insertion extension vector */
-	__m128i vGapE = _mm_set1_epi8(weight_gapE);
-
-	/* 16 byte bias vector */
-	__m128i vBias = _mm_set1_epi8(bias);
-
-	__m128i vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
-	__m128i vMaxMark = vZero; /* Trace the highest score till the previous column. */
-	__m128i vTemp;
-	int32_t edge, begin = 0, end = refLen, step = 1;
-
-	/* outer loop to process the reference sequence */
-	if (ref_dir == 1) {
-		begin = refLen - 1;
-		end = -1;
-		step = -1;
-	}
-	for (i = begin; LIKELY(i != end); i += step) {
-		int32_t cmp;
-		__m128i e, vF = vZero, vMaxColumn = vZero; /* Initialize F value to 0.
-							   Any errors to vH values will be corrected in the Lazy_F loop.
-							 */
-
-		__m128i vH = pvHStore[segLen - 1];
-		vH = _mm_slli_si128 (vH, 1); /* Shift the 128-bit value in vH left by 1 byte. */
-		const __m128i* vP = vProfile + ref[i] * segLen; /* Right part of the vProfile */
-
-		/* Swap the 2 H buffers. */
-		__m128i* pv = pvHLoad;
-		pvHLoad = pvHStore;
-		pvHStore = pv;
-
-		/* inner loop to process the query sequence */
-		for (j = 0; LIKELY(j < segLen); ++j) {
-			vH = _mm_adds_epu8(vH, _mm_load_si128(vP + j));
-			vH = _mm_subs_epu8(vH, vBias); /* vH will be always > 0 */
-
-			/* Get max from vH, vE and vF. */
-			e = _mm_load_si128(pvE + j);
-			vH = _mm_max_epu8(vH, e);
-			vH = _mm_max_epu8(vH, vF);
-			vMaxColumn = _mm_max_epu8(vMaxColumn, vH);
-
-			/* Save vH values. */
-			_mm_store_si128(pvHStore + j, vH);
-
-			/* Update vE value. */
-			vH = _mm_subs_epu8(vH, vGapO); /* saturation arithmetic, result >= 0 */
-			e = _mm_subs_epu8(e, vGapE);
-			e = _mm_max_epu8(e, vH);
-			_mm_store_si128(pvE + j, e);
-
-			/* Update vF value. */
-			vF = _mm_subs_epu8(vF, vGapE);
-			vF = _mm_max_epu8(vF, vH);
-
-			/* Load the next vH. */
-			vH = _mm_load_si128(pvHLoad + j);
-		}
-
-		/* Lazy_F loop: has been revised to disallow adjecent insertion and then deletion, so don't update E(i, j), learn from SWPS3 */
-        /* reset pointers to the start of the saved data */
-        j = 0;
-        vH = _mm_load_si128 (pvHStore + j);
-
-        /*  the computed vF value is for the given column.  since */
-        /*  we are at the end, we need to shift the vF value over */
-        /*  to the next column. */
-        vF = _mm_slli_si128 (vF, 1);
-        vTemp = _mm_subs_epu8 (vH, vGapO);
-		vTemp = _mm_subs_epu8 (vF, vTemp);
-		vTemp = _mm_cmpeq_epi8 (vTemp, vZero);
-		cmp  = _mm_movemask_epi8 (vTemp);
-
-        while (cmp != 0xffff)
-        {
-            vH = _mm_max_epu8 (vH, vF);
-			vMaxColumn = _mm_max_epu8(vMaxColumn, vH);
-            _mm_store_si128 (pvHStore + j, vH);
-            vF = _mm_subs_epu8 (vF, vGapE);
-            j++;
-            if (j >= segLen)
-            {
-                j = 0;
-                vF = _mm_slli_si128 (vF, 1);
-            }
-            vH = _mm_load_si128 (pvHStore + j);
-
-            vTemp = _mm_subs_epu8 (vH, vGapO);
-            vTemp = _mm_subs_epu8 (vF, vTemp);
-            vTemp = _mm_cmpeq_epi8 (vTemp, vZero);
-            cmp  = _mm_movemask_epi8 (vTemp);
-        }
-
-		vMaxScore = _mm_max_epu8(vMaxScore, vMaxColumn);
-		vTemp = _mm_cmpeq_epi8(vMaxMark, vMaxScore);
-		cmp = _mm_movemask_epi8(vTemp);
-		if (cmp != 0xffff) {
-			uint8_t temp;
-			vMaxMark = vMaxScore;
-			max16(temp, vMaxScore);
-			vMaxScore = vMaxMark;
-
-			if (LIKELY(temp > max)) {
-				max = temp;
-				if (max + bias >= 255) break;	//overflow
-				end_ref = i;
-
-				/* Store the column with the highest alignment score in order to trace the alignment ending position on read. */
-				for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
-			}
-		}
-
-		/* Record the max score of current column. */
-		max16(maxColumn[i], vMaxColumn);
-		if (maxColumn[i] == terminate) break;
-	}
-
-	/* Trace the alignment ending position on read. */
-	uint8_t *t = (uint8_t*)pvHmax;
-	int32_t column_len = segLen * 16;
-	for (i = 0; LIKELY(i < column_len); ++i, ++t) {
-		int32_t temp;
-		if (*t == max) {
-			temp = i / 16 + i % 16 * segLen;
-			if (temp < end_read) end_read = temp;
-		}
-	}
-
-	free(pvHmax);
-	free(pvE);
-	free(pvHLoad);
-	free(pvHStore);
-
-	/* Find the most possible 2nd best alignment. */
-	alignment_end* bests = (alignment_end*) calloc(2, sizeof(alignment_end));
-	bests[0].score = max + bias >= 255 ? 255 : max;
-	bests[0].ref = end_ref;
-	bests[0].read = end_read;
-
-	bests[1].score = 0;
-	bests[1].ref = 0;
-	bests[1].read = 0;
-
-	edge = (end_ref - maskLen) > 0 ? (end_ref - maskLen) : 0;
-	for (i = 0; i < edge; i ++) {
-		if (maxColumn[i] > bests[1].score) {
-			bests[1].score = maxColumn[i];
-			bests[1].ref = i;
-		}
-	}
-	edge = (end_ref + maskLen) > refLen ? refLen : (end_ref + maskLen);
-	for (i = edge + 1; i < refLen; i ++) {
-		if (maxColumn[i] > bests[1].score) {
-			bests[1].score = maxColumn[i];
-			bests[1].ref = i;
-		}
-	}
-
-	free(maxColumn);
-	free(end_read_column);
-	return bests;
-}
-
-static __m128i* qP_word (const int8_t* read_num,
-				  const int8_t* mat,
-				  const int32_t readLen,
-				  const int32_t n) {
-
-	int32_t segLen = (readLen + 7) / 8;
-	__m128i* vProfile = (__m128i*)malloc(n * segLen * sizeof(__m128i));
-	int16_t* t = (int16_t*)vProfile;
-	int32_t nt, i, j;
-	int32_t segNum;
-
-	/* Generate query profile rearrange query sequence & calculate the weight of match/mismatch */
-	for (nt = 0; LIKELY(nt < n); nt ++) {
-		for (i = 0; i < segLen; i ++) {
-			j = i;
-			for (segNum = 0; LIKELY(segNum < 8) ; segNum ++) {
-				*t++ = j>= readLen ? 0 : mat[nt * n + read_num[j]];
-				j += segLen;
-			}
-		}
-	}
-	return vProfile;
-}
-
-static alignment_end* sw_sse2_word (const int8_t* ref,
-							 int8_t ref_dir,	// 0: forward ref; 1: reverse ref
-							 int32_t refLen,
-							 int32_t readLen,
-							 const uint8_t weight_gapO, /* will be used as - */
-							 const uint8_t weight_gapE, /* will be used as - */
-							 const __m128i* vProfile,
-							 uint16_t terminate,
-							 int32_t maskLen) {
-
-#define max8(m, vm) (vm) = _mm_max_epi16((vm), _mm_srli_si128((vm), 8)); \
-					(vm) = _mm_max_epi16((vm), _mm_srli_si128((vm), 4)); \
-					(vm) = _mm_max_epi16((vm), _mm_srli_si128((vm), 2)); \
-					(m) = _mm_extract_epi16((vm), 0)
-
-	uint16_t max = 0;		                     /* the max alignment score */
-	int32_t end_read = readLen - 1;
-	int32_t end_ref = 0; /* 1_based best alignment ending point; Initialized as isn't aligned - 0. */
-	int32_t segLen = (readLen + 7) / 8; /* number of segment */
-
-	/* array to record the largest score of each reference position */
-	uint16_t* maxColumn = (uint16_t*) calloc(refLen, 2);
-
-	/* array to record the alignment read ending position of the largest score of each reference position */
-	int32_t* end_read_column = (int32_t*) calloc(refLen, sizeof(int32_t));
-
-	/* Define 16 byte 0 vector. */
-	__m128i vZero = _mm_set1_epi32(0);
-
-	__m128i* pvHStore = (__m128i*) calloc(segLen, sizeof(__m128i));
-	__m128i* pvHLoad = (__m128i*) calloc(segLen, sizeof(__m128i));
-	__m128i* pvE = (__m128i*) calloc(segLen, sizeof(__m128i));
-	__m128i* pvHmax = (__m128i*) calloc(segLen, sizeof(__m128i));
-
-	int32_t i, j, k;
-	/* 16 byte insertion begin vector */
-	__m128i vGapO = _mm_set1_epi16(weight_gapO);
-
-	/* 16 byte insertion extension vector */
-	__m128i vGapE = _mm_set1_epi16(weight_gapE);
-
-	__m128i vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
-	__m128i vMaxMark = vZero; /* Trace the highest score till the previous column. */
-	__m128i vTemp;
-	int32_t edge, begin = 0, end = refLen, step = 1;
-
-	/* outer loop to process the reference sequence */
-	if (ref_dir == 1) {
-		begin = refLen - 1;
-		end = -1;
-		step = -1;
-	}
-	for (i = begin; LIKELY(i != end); i += step) {
-		int32_t cmp;
-		__m128i e, vF = vZero; /* Initialize F value to 0.
-							   Any errors to vH values will be corrected in the Lazy_F loop.
-							 */
-		__m128i vH = pvHStore[segLen - 1];
-		vH = _mm_slli_si128 (vH, 2); /* Shift the 128-bit value in vH left by 2 byte. */
-
-		/* Swap the 2 H buffers. */
-		__m128i* pv = pvHLoad;
-
-		__m128i vMaxColumn = vZero; /* vMaxColumn is used to record the max values of column i. */
-
-		const __m128i* vP = vProfile + ref[i] * segLen; /* Right part of the vProfile */
-		pvHLoad = pvHStore;
-		pvHStore = pv;
-
-		/* inner loop to process the query sequence */
-		for (j = 0; LIKELY(j < segLen); j ++) {
-			vH = _mm_adds_epi16(vH, _mm_load_si128(vP + j));
-
-			/* Get max from vH, vE and vF. */
-			e = _mm_load_si128(pvE + j);
-			vH = _mm_max_epi16(vH, e);
-			vH = _mm_max_epi16(vH, vF);
-			vMaxColumn = _mm_max_epi16(vMaxColumn, vH);
-
-			/* Save vH values. */
-			_mm_store_si128(pvHStore + j, vH);
-
-			/* Update vE value. */
-			vH = _mm_subs_epu16(vH, vGapO); /* saturation arithmetic, result >= 0 */
-			e = _mm_subs_epu16(e, vGapE);
-			e = _mm_max_epi16(e, vH);
-			_mm_store_si128(pvE + j, e);
-
-			/* Update vF value. */
-			vF = _mm_subs_epu16(vF, vGapE);
-			vF = _mm_max_epi16(vF, vH);
-
-			/* Load the next vH. */
-			vH = _mm_load_si128(pvHLoad + j);
-		}
-
-		/* Lazy_F loop: has been revised to disallow adjecent insertion and then deletion, so don't update E(i, j), learn from SWPS3 */
-		for (k = 0; LIKELY(k < 8); ++k) {
-			vF = _mm_slli_si128 (vF, 2);
-			for (j = 0; LIKELY(j < segLen); ++j) {
-				vH = _mm_load_si128(pvHStore + j);
-				vH = _mm_max_epi16(vH, vF);
-				vMaxColumn = _mm_max_epi16(vMaxColumn, vH); //newly added line
-				_mm_store_si128(pvHStore + j, vH);
-				vH = _mm_subs_epu16(vH, vGapO);
-				vF = _mm_subs_epu16(vF, vGapE);
-				if (UNLIKELY(! _mm_movemask_epi8(_mm_cmpgt_epi16(vF, vH)))) goto end;
-			}
-		}
-
-end:
-		vMaxScore = _mm_max_epi16(vMaxScore, vMaxColumn);
-		vTemp = _mm_cmpeq_epi16(vMaxMark, vMaxScore);
-		cmp = _mm_movemask_epi8(vTemp);
-		if (cmp != 0xffff) {
-			uint16_t temp;
-			vMaxMark = vMaxScore;
-			max8(temp, vMaxScore);
-			vMaxScore = vMaxMark;
-
-			if (LIKELY(temp > max)) {
-				max = temp;
-				end_ref = i;
-				for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
-			}
-		}
-
-		/* Record the max score of current column. */
-		max8(maxColumn[i], vMaxColumn);
-		if (maxColumn[i] == terminate) break;
-	}
-
-	/* Trace the alignment ending position on read. */
-	uint16_t *t = (uint16_t*)pvHmax;
-	int32_t column_len = segLen * 8;
-	for (i = 0; LIKELY(i < column_len); ++i, ++t) {
-		int32_t temp;
-		if (*t == max) {
-			temp = i / 8 + i % 8 * segLen;
-			if (temp < end_read) end_read = temp;
-		}
-	}
-
-	free(pvHmax);
-	free(pvE);
-	free(pvHLoad);
-	free(pvHStore);
-
-	/* Find the most possible 2nd best alignment. */
-	alignment_end* bests = (alignment_end*) calloc(2, sizeof(alignment_end));
-	bests[0].score = max;
-	bests[0].ref = end_ref;
-	bests[0].read = end_read;
-
-	bests[1].score = 0;
-	bests[1].ref = 0;
-	bests[1].read = 0;
-
-	edge = (end_ref - maskLen) > 0 ? (end_ref - maskLen) : 0;
-	for (i = 0; i < edge; i ++) {
-		if (maxColumn[i] > bests[1].score) {
-			bests[1].score = maxColumn[i];
-			bests[1].ref = i;
-		}
-	}
-	edge = (end_ref + maskLen) > refLen ? refLen : (end_ref + maskLen);
-	for (i = edge; i < refLen; i ++) {
-		if (maxColumn[i] > bests[1].score) {
-			bests[1].score = maxColumn[i];
-			bests[1].ref = i;
-		}
-	}
-
-	free(maxColumn);
-	free(end_read_column);
-	return bests;
-}
-
-static cigar* banded_sw (const int8_t* ref,
+/* Returns the length of the cigar, which is left in ws->cigar, or -1. */
+static int32_t banded_sw (const int8_t* ref,
 				 const int8_t* read,
 				 int32_t refLen,
 				 int32_t readLen,
@@ -577,38 +134,26 @@ static cigar* banded_sw (const int8_t* ref,
 				 const uint32_t weight_gapE,  /* will be used as - */
 				 int32_t band_width,
 				 const int8_t* mat,	/* pointer to the weight matrix */
-				 int32_t n) {
+				 int32_t n,
+				 s_workspace* ws) {
 
-	uint32_t *c = (uint32_t*)malloc(16 * sizeof(uint32_t)), *c1;
-	int32_t i, j, e, f, temp1, temp2, s = 16, s1 = 8, l, max = 0;
-	int64_t s2 = 1024;
+	/* a run per traceback step at most, plus the final M */
+	uint32_t *c = (uint32_t*)ssw_reserve(ws, &ws->cigar, (readLen + refLen + 2) * sizeof(uint32_t));
+	int32_t i, j, e, f, temp1, temp2, s, l, max = 0;
 	char op, prev_op;
 	int32_t width, width_d, *h_b, *e_b, *h_c;
 	int8_t *direction, *direction_line;
-	cigar* result = (cigar*)malloc(sizeof(cigar));
-	h_b = (int32_t*)malloc(s1 * sizeof(int32_t));
-	e_b = (int32_t*)malloc(s1 * sizeof(int32_t));
-	h_c = (int32_t*)malloc(s1 * sizeof(int32_t));
-	direction = (int8_t*)malloc(s2 * sizeof(int8_t));
 
+	if (c == 0) return -1;
 	do {
 		width = band_width * 2 + 3, width_d = band_width * 2 + 1;
-		while (width >= s1) {
-			++s1;
-			kroundup32(s1);
-			h_b = (int32_t*)realloc(h_b, s1 * sizeof(int32_t));
-			e_b = (int32_t*)realloc(e_b, s1 * sizeof(int32_t));
-			h_c = (int32_t*)realloc(h_c, s1 * sizeof(int32_t));
-		}
-		while (width_d * readLen * 3 >= s2) {
-			++s2;
-			kroundup32(s2);
-			if (s2 < 0) {
-				fprintf(stderr, "Alignment score and position are not consensus.\n");
-				exit(1);
-			}
-			direction = (int8_t*)realloc(direction, s2 * sizeof(int8_t));
-		}
+		if (ws->stats) ws->stats->cells[SSW_PHASE_CIGAR] += (uint64_t)width_d * readLen;
+		/* the three rows of the band, then the direction matrix */
+		h_b = (int32_t*)ssw_reserve(ws, &ws->band, 3 * (width + 1) * sizeof(int32_t) + (int64_t)width_d * readLen * 3);
+		if (h_b == 0) return -1;
+		e_b = h_b + width + 1;
+		h_c = e_b + width + 1;
+		direction = (int8_t*)(h_c + width + 1);
 		direction_line = direction;
 		for (j = 1; LIKELY(j < width - 1); j ++) h_b[j] = 0;
 		for (i = 0; LIKELY(i < readLen); i ++) {
@@ -650,9 +195,17 @@ static cigar* banded_sw (const int8_t* ref,
 			}
 			for (j = 1; j <= u; j ++) h_b[j] = h_c[j];
 		}
+		if (max < score && band_width >= readLen && band_width >= refLen) {
+			/* The band already covers the whole matrix, so widening it again
+			   can't reach the score of the striped pass. */
+			fprintf(stderr, "Alignment score and position are not consensus.\n");
+			return -1;
+		}
 		band_width *= 2;
+		if (ws->stats && max < score) ++ws->stats->band_widenings;
 	} while (LIKELY(max < score));
 	band_width /= 2;
+	if (ws->stats && (uint64_t)band_width > ws->stats->band_max) ws->stats->band_max = band_width;
 
 	// trace back
 	i = readLen - 1;
@@ -695,71 +248,153 @@ static cigar* banded_sw (const int8_t* ref,
 				break;
 			default:
 				fprintf(stderr, "Trace back error: %d.\n", direction_line[temp1 - 1]);
-				free(direction);
-				free(h_c);
-				free(e_b);
-				free(h_b);
-				free(c);
-				free(result);
-				return 0;
+				return -1;
 		}
 		if (op == prev_op) ++e;
 		else {
-			++l;
-			while (l >= s) {
-				++s;
-				kroundup32(s);
-				c = (uint32_t*)realloc(c, s * sizeof(uint32_t));
-			}
-			c[l - 1] = to_cigar_int(e, prev_op);
+			c[l++] = to_cigar_int(e, prev_op);
 			prev_op = op;
 			e = 1;
 		}
 	}
 	if (op == 'M') {
-		++l;
-		while (l >= s) {
-			++s;
-			kroundup32(s);
-			c = (uint32_t*)realloc(c, s * sizeof(uint32_t));
-		}
-		c[l - 1] = to_cigar_int(e + 1, op);
+		c[l++] = to_cigar_int(e + 1, op);
 	}else {
-		l += 2;
-		while (l >= s) {
-			++s;
-			kroundup32(s);
-			c = (uint32_t*)realloc(c, s * sizeof(uint32_t));
-		}
-		c[l - 2] = to_cigar_int(e, op);
-		c[l - 1] = to_cigar_int(1, 'M');
+		c[l++] = to_cigar_int(e, op);
+		c[l++] = to_cigar_int(1, 'M');
 	}
 
 	// reverse cigar
-	c1 = (uint32_t*)malloc(l * sizeof(uint32_t));
 	s = 0;
 	e = l - 1;
-	while (LIKELY(s <= e)) {
-		c1[s] = c[e];
-		c1[e] = c[s];
+	while (LIKELY(s < e)) {
+		uint32_t t = c[s];
+		c[s] = c[e];
+		c[e] = t;
 		++ s;
 		-- e;
 	}
+	return l;
+}
+
+/* Global alignment of read and ref with affine gaps, for the alignments of
+   ssw_align_anchor whose first and last operations may be gaps, which
+   banded_sw can't start or end with.  Ties prefer a match, then a deletion.
+   Returns 0 if the score of the alignment is not score or out of memory. */
+static cigar* anchor_path (const int8_t* ref,
+				 const int8_t* read,
+				 int32_t refLen,
+				 int32_t readLen,
+				 int32_t score,
+				 const int32_t weight_gapO,
+				 const int32_t weight_gapE,
+				 const int8_t* mat,
+				 int32_t n) {
+
+	/* per cell: bits 0-1 where H came from (0 match, 1 D, 2 I), bit 2 D
+	   extends a D, bit 3 I extends an I */
+	uint8_t* direction = (uint8_t*)malloc((int64_t)readLen * refLen + 1);
+	int32_t* h = (int32_t*)malloc((refLen + 1) * sizeof(int32_t));	/* h[j + 1]: H of the row above, then this one */
+	int32_t* ins = (int32_t*)malloc((refLen + 1) * sizeof(int32_t));	/* I of the row above, then this one */
+	uint32_t* c = (uint32_t*)malloc((readLen + refLen + 1) * sizeof(uint32_t)), *c1;
+	cigar* result = (cigar*)malloc(sizeof(cigar));
+	int32_t i, j, l = 0, state = 0, neg = INT32_MIN / 2;
+	char op, prev_op = 0;
+	uint32_t length = 0;
+
+	if (direction == 0 || h == 0 || ins == 0 || c == 0 || result == 0) goto fail;
+	h[0] = 0;
+	for (j = 0; j < refLen; ++j) {
+		h[j + 1] = -(weight_gapO + j * weight_gapE);
+		ins[j + 1] = neg;
+	}
+	for (i = 0; i < readLen; ++i) {
+		int32_t diag = h[0], del = neg;
+		uint8_t* d = direction + (int64_t)i * refLen;
+		h[0] = -(weight_gapO + i * weight_gapE);
+		for (j = 0; j < refLen; ++j) {
+			int32_t m = diag + mat[ref[j] * n + read[i]], best, up = h[j + 1];
+			uint8_t dir = 0;
+			if (del - weight_gapE >= h[j] - weight_gapO) {
+				del -= weight_gapE;
+				dir |= 4;
+			} else del = h[j] - weight_gapO;
+			if (ins[j + 1] - weight_gapE >= up - weight_gapO) {
+				ins[j + 1] -= weight_gapE;
+				dir |= 8;
+			} else ins[j + 1] = up - weight_gapO;
+			best = m;
+			if (del > best) {
+				best = del;
+				dir |= 1;
+			}
+			if (ins[j + 1] > best) {
+				best = ins[j + 1];
+				dir = (dir & ~3) | 2;
+			}
+			d[j] = dir;
+			diag = up;
+			h[j + 1] = best;
+		}
+	}
+	if (h[refLen] != score) goto fail;
+
+	/* trace back from the last cell, collecting the operations backwards */
+	i = readLen - 1;
+	j = refLen - 1;
+	while (i >= 0 || j >= 0) {
+		if (i < 0) op = 'D';
+		else if (j < 0) op = 'I';
+		else {
+			uint8_t dir = direction[(int64_t)i * refLen + j];
+			if (state == 0) state = dir & 3;
+			if (state == 0) op = 'M';
+			else if (state == 1) {
+				op = 'D';
+				if (!(dir & 4)) state = 0;
+			} else {
+				op = 'I';
+				if (!(dir & 8)) state = 0;
+			}
+		}
+		if (op != 'I') --j;
+		if (op != 'D') --i;
+		if (op == 'M') state = 0;
+		if (op != prev_op && prev_op) {
+			c[l++] = to_cigar_int(length, prev_op);
+			length = 0;
+		}
+		prev_op = op;
+		++length;
+	}
+	if (prev_op) c[l++] = to_cigar_int(length, prev_op);
+
+	c1 = (uint32_t*)malloc((l > 0 ? l : 1) * sizeof(uint32_t));
+	if (c1 == 0) goto fail;
+	for (i = 0; i < l; ++i) c1[i] = c[l - 1 - i];
 	result->seq = c1;
 	result->length = l;
-
 	free(direction);
-	free(h_c);
-	free(e_b);
-	free(h_b);
+	free(h);
+	free(ins);
 	free(c);
 	return result;
+
+fail:
+	free(direction);
+	free(h);
+	free(ins);
+	free(c);
+	free(result);
+	return 0;
 }
 
-static int8_t* seq_reverse(const int8_t* seq, int32_t end)	/* end is 0-based alignment ending position */
+/* Reverse seq up to end into reverse, or a new array if reverse is 0. */
+static int8_t* seq_reverse(const int8_t* seq, int32_t end, int8_t* reverse)	/* end is 0-based alignment ending position */
 {
-	int8_t* reverse = (int8_t*)calloc(end + 1, sizeof(int8_t));
 	int32_t start = 0;
+	if (reverse == 0) reverse = (int8_t*)calloc(end + 1, sizeof(int8_t));
+	if (reverse == 0) return 0;
 	while (LIKELY(start <= end)) {
 		reverse[start] = seq[end];
 		reverse[end] = seq[start];
@@ -769,10 +404,99 @@ static int8_t* seq_reverse(const int8_t* seq, int32_t end)	/* end is 0-based ali
 	return reverse;
 }
 
+/* Kernels and profiles of one alignment. */
+typedef struct {
+	const void* profile_byte;
+	const void* profile_word;
+	void* narrow_byte;	// profiles built for this alignment only
+	void* narrow_word;
+} ssw_run;
+
+/* Kernels used by new profiles, picked on first use. */
+static const ssw_kernels* ssw_active_kernels = 0;
+
+static const ssw_kernels* ssw_find_kernels (const char* name) {
+	if (strcmp(name, "sse2") == 0) return &ssw_kernels_sse2;
+#if SSW_HAVE_AVX
+	__builtin_cpu_init();
+	if (strcmp(name, "avx2") == 0) return __builtin_cpu_supports("avx2") ? &ssw_kernels_avx2 : 0;
+	if (strcmp(name, "avx512") == 0) return __builtin_cpu_supports("avx512bw") ? &ssw_kernels_avx512 : 0;
+#endif
+	return 0;
+}
+
+/* The widest kernels the CPU supports, unless the SSW_SIMD environment
+   variable names others. */
+static const ssw_kernels* ssw_get_kernels (void) {
+	const ssw_kernels* k = ssw_active_kernels;
+	if (UNLIKELY(k == 0)) {
+		const char* name = getenv("SSW_SIMD");
+		if (name && *name) k = ssw_find_kernels(name);
+		if (k == 0) k = ssw_find_kernels("avx512");
+		if (k == 0) k = ssw_find_kernels("avx2");
+		if (k == 0) k = &ssw_kernels_sse2;
+		ssw_active_kernels = k;
+	}
+	return k;
+}
+
+const char* ssw_simd_backend (void) {
+	return ssw_get_kernels()->name;
+}
+
+int ssw_simd_set_backend (const char* name) {
+	const ssw_kernels* k = ssw_find_kernels(name);
+	if (k == 0) return -1;
+	ssw_active_kernels = k;
+	return 0;
+}
+
+size_t ssw_profile_size (const s_profile* p) {
+	/* profiles wider than 16 bytes carry a padding mask row */
+	size_t width = p->kernels->width, rows = p->n + (width > 16), size = 0;
+	if (p->profile_byte) size += rows * ((p->readLen + width - 1) / width) * width;
+	if (p->profile_word) size += rows * ((p->readLen + width / 2 - 1) / (width / 2)) * width;
+	return size;
+}
+
+/* Pick the kernels and profiles to align prof with.  The lazy F loop of the
+   kernels is only exact when the gap open penalty is larger than the
+   extension one.  Otherwise its results depend on the vector width, so keep
+   them those of the SSE2 kernels. */
+static const ssw_kernels* ssw_run_init (ssw_run* run, const s_profile* prof, uint8_t weight_gapO, uint8_t weight_gapE) {
+	const ssw_kernels* k = prof->kernels;
+	run->profile_byte = prof->profile_byte;
+	run->profile_word = prof->profile_word;
+	run->narrow_byte = run->narrow_word = 0;
+	if (k->width > 16 && weight_gapO <= weight_gapE) {
+		k = &ssw_kernels_sse2;
+		if (prof->profile_byte) run->profile_byte = run->narrow_byte = k->qP_byte(prof->read, prof->mat, prof->readLen, prof->n, prof->bias, 0, 0);
+		if (prof->profile_word) run->profile_word = run->narrow_word = k->qP_word(prof->read, prof->mat, prof->readLen, prof->n, 0, 0);
+	}
+	return k;
+}
+
+static void ssw_run_free (ssw_run* run) {
+	if (run->narrow_byte) _mm_free(run->narrow_byte);
+	if (run->narrow_word) _mm_free(run->narrow_word);
+}
+
+/* Wider kernels only pay off once the read fills a few segments per lane,
+   so short reads step down to narrower ones. */
+static const ssw_kernels* ssw_fit_kernels (const ssw_kernels* k, int32_t readLen) {
+#if SSW_HAVE_AVX
+	if (k == &ssw_kernels_avx512 && readLen < 4 * k->width) k = &ssw_kernels_avx2;
+	if (k == &ssw_kernels_avx2 && readLen < 4 * k->width) k = &ssw_kernels_sse2;
+#endif
+	return k;
+}
+
 s_profile* ssw_init (const int8_t* read, const int32_t readLen, const int8_t* mat, const int32_t n, const int8_t score_size) {
 	s_profile* p = (s_profile*)calloc(1, sizeof(struct _profile));
+	const ssw_kernels* k = ssw_fit_kernels(ssw_get_kernels(), readLen);
 	p->profile_byte = 0;
 	p->profile_word = 0;
+	p->kernels = k;
 	p->bias = 0;
 
 	if (score_size == 0 || score_size == 2) {
@@ -782,9 +506,9 @@ s_profile* ssw_init (const int8_t* read, const int32_t readLen, const int8_t* ma
 		bias = abs(bias);
 
 		p->bias = bias;
-		p->profile_byte = qP_byte (read, mat, readLen, n, bias);
+		p->profile_byte = k->qP_byte (read, mat, readLen, n, bias, 0, 0);
 	}
-	if (score_size == 1 || score_size == 2) p->profile_word = qP_word (read, mat, readLen, n);
+	if (score_size == 1 || score_size == 2) p->profile_word = k->qP_word (read, mat, readLen, n, 0, 0);
 	p->read = read;
 	p->mat = mat;
 	p->readLen = readLen;
@@ -793,55 +517,196 @@ s_profile* ssw_init (const int8_t* read, const int32_t readLen, const int8_t* ma
 }
 
 void init_destroy (s_profile* p) {
-	free(p->profile_byte);
-	free(p->profile_word);
+	_mm_free(p->profile_byte);
+	_mm_free(p->profile_word);
 	free(p);
 }
 
-s_align* ssw_align (const s_profile* prof,
-					const int8_t* ref,
-				  	int32_t refLen,
-				  	const uint8_t weight_gapO,
-				  	const uint8_t weight_gapE,
-					const uint8_t flag,	//  (from high to low) bit 5: return the best alignment beginning position; 6: if (ref_end1 - ref_begin1 <= filterd) && (read_end1 - read_begin1 <= filterd), return cigar; 7: if max score >= filters, return cigar; 8: always return cigar; if 6 & 7 are both setted, only return cigar when both filter fulfilled
-					const uint16_t filters,
-					const int32_t filterd,
-					const int32_t maskLen) {
+void* ssw_reserve (s_workspace* ws, ssw_buffer* b, size_t size) {
+	if (UNLIKELY(b->size < size || b->data == 0)) {
+		size_t grown = b->size ? b->size : 64;
+		void* data;
+		while (grown < size) grown *= 2;
+		data = _mm_malloc(grown, 64);
+		if (data == 0) return 0;
+		if (b->data) _mm_free(b->data);
+		ws->size += grown - b->size;
+		if (ws->size > ws->peak) ws->peak = ws->size;
+		b->data = data;
+		b->size = grown;
+	}
+	return b->data;
+}
 
-	alignment_end* bests = 0, *bests_reverse = 0;
-	__m128i* vP = 0;
-	int32_t word = 0, band_width = 0, readLen = prof->readLen;
-	int8_t* read_reverse = 0;
-	cigar* path;
-	s_align* r = (s_align*)calloc(1, sizeof(s_align));
+s_workspace* ssw_workspace_init (void) {
+	return (s_workspace*)calloc(1, sizeof(s_workspace));
+}
+
+void ssw_workspace_forget (s_workspace* ws) {
+	int32_t i;
+	for (i = 0; i < SSW_REVERSE_CACHE; ++i) ws->reverse[i].readLen = 0;
+	ws->reverse_next = 0;
+}
+
+static void ssw_buffer_free (ssw_buffer* b) {
+	if (b->data) _mm_free(b->data);
+	b->data = 0;
+	b->size = 0;
+}
+
+void ssw_workspace_release (s_workspace* ws) {
+	int32_t i;
+	ssw_buffer_free(&ws->vectors);
+	ssw_buffer_free(&ws->columns);
+	ssw_buffer_free(&ws->read);
+	ssw_buffer_free(&ws->band);
+	ssw_buffer_free(&ws->cigar);
+	for (i = 0; i < SSW_REVERSE_CACHE; ++i) ssw_buffer_free(&ws->reverse[i].profile);
+	ssw_workspace_forget(ws);
+	ws->size = 0;
+}
+
+void ssw_workspace_destroy (s_workspace* ws) {
+	if (ws == 0) return;
+	ssw_workspace_release(ws);
+	free(ws);
+}
+
+size_t ssw_workspace_size (const s_workspace* ws, size_t* peak) {
+	if (peak) *peak = ws->peak;
+	return ws->size;
+}
+
+size_t ssw_workspace_reverse_hits (const s_workspace* ws, size_t* misses) {
+	if (misses) *misses = ws->reverse_misses;
+	return ws->reverse_hits;
+}
+
+void ssw_workspace_set_stats (s_workspace* ws, s_stats* stats) {
+	ws->stats = stats;
+}
+
+void ssw_stats_add (s_stats* to, const s_stats* from) {
+	int32_t i;
+	for (i = 0; i < SSW_PHASES; ++i) {
+		to->calls[i] += from->calls[i];
+		to->nanos[i] += from->nanos[i];
+		to->cells[i] += from->cells[i];
+	}
+	to->saturations += from->saturations;
+	to->reverse_profiles += from->reverse_profiles;
+	to->band_widenings += from->band_widenings;
+	if (from->band_max > to->band_max) to->band_max = from->band_max;
+	if (from->buffer_peak > to->buffer_peak) to->buffer_peak = from->buffer_peak;
+}
+
+uint64_t ssw_clock_ns (void) {
+#ifdef _WIN32
+	LARGE_INTEGER count, frequency;
+	QueryPerformanceCounter(&count);
+	QueryPerformanceFrequency(&frequency);
+	return (uint64_t)(count.QuadPart / frequency.QuadPart * 1000000000 + count.QuadPart % frequency.QuadPart * 1000000000 / frequency.QuadPart);
+#else
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+#endif
+}
+
+/* End a phase of ssw_align_ws begun at start, which searched cells cells. */
+static void stats_phase (s_stats* stats, int32_t phase, uint64_t start, uint64_t cells) {
+	++stats->calls[phase];
+	stats->nanos[phase] += ssw_clock_ns() - start;
+	stats->cells[phase] += cells;
+}
+
+/* Profile for the reverse pass over the first readLen bases of the read of
+   prof, from the cache of ws or built into its next entry. */
+static const void* reverse_profile (s_workspace* ws, const ssw_kernels* k, const s_profile* prof, int32_t readLen, int8_t word) {
+	ssw_reverse* e;
+	int8_t* read_reverse;
+	void* vP;
+	int32_t i;
+	for (i = 0; i < SSW_REVERSE_CACHE; ++i) {
+		e = &ws->reverse[i];
+		if (e->readLen == readLen && e->prof == prof && e->kernels == k && e->word == word) {
+			++ws->reverse_hits;
+			return e->profile.data;
+		}
+	}
+	read_reverse = (int8_t*)ssw_reserve(ws, &ws->read, readLen);
+	if (read_reverse == 0) return 0;
+	seq_reverse(prof->read, readLen - 1, read_reverse);
+	e = &ws->reverse[ws->reverse_next];
+	e->readLen = 0;
+	if (word == 0) vP = k->qP_byte(read_reverse, prof->mat, readLen, prof->n, prof->bias, ws, &e->profile);
+	else vP = k->qP_word(read_reverse, prof->mat, readLen, prof->n, ws, &e->profile);
+	if (vP == 0) return 0;
+	e->prof = prof;
+	e->kernels = k;
+	e->readLen = readLen;
+	e->word = word;
+	ws->reverse_next = (ws->reverse_next + 1) % SSW_REVERSE_CACHE;
+	++ws->reverse_misses;
+	if (ws->stats) ++ws->stats->reverse_profiles;
+	return vP;
+}
+
+const s_align* ssw_align_ws (const s_profile* prof,
+							 const int8_t* ref,
+							 int32_t refLen,
+							 const uint8_t weight_gapO,
+							 const uint8_t weight_gapE,
+							 const uint8_t flag,
+							 const uint16_t filters,
+							 const int32_t filterd,
+							 const int32_t maskLen,
+							 s_workspace* ws) {
+
+	alignment_end bests[2], *found = 0;
+	ssw_run run;
+	const ssw_kernels* k = ssw_run_init(&run, prof, weight_gapO, weight_gapE);
+	const void* profile_byte = run.profile_byte, *profile_word = run.profile_word;
+	const void* vP = 0;
+	int32_t word = 0, band_width = 0, readLen = prof->readLen, cigarLen;
+	s_align* r = &ws->result;
+	s_stats* stats = ws->stats;
+	uint64_t start = stats ? ssw_clock_ns() : 0, cells = (uint64_t)readLen * refLen;
+	memset(r, 0, sizeof(s_align));
 	r->ref_begin1 = -1;
 	r->read_begin1 = -1;
-	r->cigar = 0;
-	r->cigarLen = 0;
 	if (maskLen < 15) {
 		fprintf(stderr, "When maskLen < 15, the function ssw_align doesn't return 2nd best alignment information.\n");
 	}
 
 	// Find the alignment scores and ending positions
-	if (prof->profile_byte) {
-		bests = sw_sse2_byte(ref, 0, refLen, readLen, weight_gapO, weight_gapE, prof->profile_byte, -1, prof->bias, maskLen);
-		if (prof->profile_word && bests[0].score == 255) {
-			free(bests);
-			bests = sw_sse2_word(ref, 0, refLen, readLen, weight_gapO, weight_gapE, prof->profile_word, -1, maskLen);
+	if (profile_byte) {
+		found = k->sw_byte(ref, 0, refLen, readLen, weight_gapO, weight_gapE, profile_byte, -1, prof->bias, maskLen, 0, ws, bests);
+		if (found && profile_word && bests[0].score == 255) {
+			found = k->sw_word(ref, 0, refLen, readLen, weight_gapO, weight_gapE, profile_word, -1, maskLen, 0, ws, bests);
 			word = 1;
-		} else if (bests[0].score == 255) {
+			if (stats) {
+				++stats->saturations;
+				cells *= 2;
+			}
+		} else if (found && bests[0].score == 255) {
 			fprintf(stderr, "Please set 2 to the score_size parameter of the function ssw_init, otherwise the alignment results will be incorrect.\n");
-			free(r);
-			return NULL;
+			r = NULL;
+			goto end;
 		}
-	}else if (prof->profile_word) {
-		bests = sw_sse2_word(ref, 0, refLen, readLen, weight_gapO, weight_gapE, prof->profile_word, -1, maskLen);
+	}else if (profile_word) {
+		found = k->sw_word(ref, 0, refLen, readLen, weight_gapO, weight_gapE, profile_word, -1, maskLen, 0, ws, bests);
 		word = 1;
 	}else {
 		fprintf(stderr, "Please call the function ssw_init before ssw_align.\n");
-		free(r);
-		return NULL;
+		r = NULL;
+		goto end;
+	}
+	if (found == 0) {
+		r = NULL;
+		goto end;
 	}
+	if (stats) stats_phase(stats, SSW_PHASE_FORWARD, start, cells);
 	r->score1 = bests[0].score;
 	r->ref_end1 = bests[0].ref;
 	r->read_end1 = bests[0].read;
@@ -852,41 +717,443 @@ s_align* ssw_align (const s_profile* prof,
 		r->score2 = 0;
 		r->ref_end2 = -1;
 	}
-	free(bests);
-	if (flag == 0 || (flag == 2 && r->score1 < filters)) goto end;
+	if (flag == 0 || ((flag & 8) == 0 && (flag & 2) != 0 && r->score1 < filters)) goto end;
 
 	// Find the beginning position of the best alignment.
-	read_reverse = seq_reverse(prof->read, r->read_end1);
-	if (word == 0) {
-		vP = qP_byte(read_reverse, prof->mat, r->read_end1 + 1, prof->n, prof->bias);
-		bests_reverse = sw_sse2_byte(ref, 1, r->ref_end1 + 1, r->read_end1 + 1, weight_gapO, weight_gapE, vP, r->score1, prof->bias, maskLen);
-	} else {
-		vP = qP_word(read_reverse, prof->mat, r->read_end1 + 1, prof->n);
-		bests_reverse = sw_sse2_word(ref, 1, r->ref_end1 + 1, r->read_end1 + 1, weight_gapO, weight_gapE, vP, r->score1, maskLen);
+	if (stats) start = ssw_clock_ns();
+	vP = reverse_profile(ws, k, prof, r->read_end1 + 1, word);
+	if (vP == 0) found = 0;
+	else if (word == 0) found = k->sw_byte(ref, 1, r->ref_end1 + 1, r->read_end1 + 1, weight_gapO, weight_gapE, vP, r->score1, prof->bias, maskLen, 0, ws, bests);
+	else found = k->sw_word(ref, 1, r->ref_end1 + 1, r->read_end1 + 1, weight_gapO, weight_gapE, vP, r->score1, maskLen, 0, ws, bests);
+	if (found == 0) {
+		r = NULL;
+		goto end;
 	}
-	free(vP);
-	free(read_reverse);
-	r->ref_begin1 = bests_reverse[0].ref;
-	r->read_begin1 = r->read_end1 - bests_reverse[0].read;
-	free(bests_reverse);
+	if (stats) stats_phase(stats, SSW_PHASE_REVERSE, start, (uint64_t)(r->read_end1 + 1) * (r->ref_end1 + 1));
+	r->ref_begin1 = bests[0].ref;
+	r->read_begin1 = r->read_end1 - bests[0].read;
 	if ((7&flag) == 0 || ((2&flag) != 0 && r->score1 < filters) || ((4&flag) != 0 && (r->ref_end1 - r->ref_begin1 > filterd || r->read_end1 - r->read_begin1 > filterd))) goto end;
 
 	// Generate cigar.
 	refLen = r->ref_end1 - r->ref_begin1 + 1;
 	readLen = r->read_end1 - r->read_begin1 + 1;
 	band_width = abs(refLen - readLen) + 1;
-	path = banded_sw(ref + r->ref_begin1, prof->read + r->read_begin1, refLen, readLen, r->score1, weight_gapO, weight_gapE, band_width, prof->mat, prof->n);
-	if (path == 0) {
+	if (stats) start = ssw_clock_ns();
+	cigarLen = banded_sw(ref + r->ref_begin1, prof->read + r->read_begin1, refLen, readLen, r->score1, weight_gapO, weight_gapE, band_width, prof->mat, prof->n, ws);
+	if (cigarLen < 0) r = NULL;
+	else {
+		r->cigar = (uint32_t*)ws->cigar.data;
+		r->cigarLen = cigarLen;
+		if (stats) stats_phase(stats, SSW_PHASE_CIGAR, start, 0);
+	}
+
+end:
+	ssw_run_free(&run);
+	if (stats && ws->peak > stats->buffer_peak) stats->buffer_peak = ws->peak;
+	return r;
+}
+
+s_align* ssw_align (const s_profile* prof,
+					const int8_t* ref,
+				  	int32_t refLen,
+				  	const uint8_t weight_gapO,
+				  	const uint8_t weight_gapE,
+					const uint8_t flag,	//  (from high to low) bit 5: return the best alignment beginning position; 6: if (ref_end1 - ref_begin1 <= filterd) && (read_end1 - read_begin1 <= filterd), return cigar; 7: if max score >= filters, return cigar; 8: always return cigar; if 6 & 7 are both setted, only return cigar when both filter fulfilled
+					const uint16_t filters,
+					const int32_t filterd,
+					const int32_t maskLen) {
+
+	s_workspace ws;
+	const s_align* found;
+	s_align* r = 0;
+	memset(&ws, 0, sizeof(s_workspace));
+	found = ssw_align_ws(prof, ref, refLen, weight_gapO, weight_gapE, flag, filters, filterd, maskLen, &ws);
+	if (found) r = (s_align*)malloc(sizeof(s_align));
+	if (r) {
+		*r = *found;
+		if (found->cigarLen > 0) {
+			r->cigar = (uint32_t*)malloc(found->cigarLen * sizeof(uint32_t));
+			if (r->cigar) memcpy(r->cigar, found->cigar, found->cigarLen * sizeof(uint32_t));
+			else {
+				free(r);
+				r = 0;
+			}
+		}
+	}
+	ssw_workspace_release(&ws);
+	return r;
+}
+
+s_align* ssw_align_anchor (const s_profile* prof,
+						   const int8_t* ref,
+						   int32_t refLen,
+						   const uint8_t weight_gapO,
+						   const uint8_t weight_gapE,
+						   const uint8_t flag,
+						   const uint16_t filters,
+						   const int32_t filterd,
+						   const int32_t anchor) {
+
+	const ssw_kernels* k = prof->kernels;
+	/* a gap is reopened rather than extended when that costs less, so
+	   extending costs at most opening.  Using that cost throughout keeps the
+	   anchored boundaries, the lazy F loop and anchor_path in agreement */
+	const uint8_t gapE = weight_gapE < weight_gapO ? weight_gapE : weight_gapO;
+	int32_t readLen = prof->readLen, max_match = 0, best, begin_ref = -1, begin_read = -1, i;
+	int32_t reverse_anchor = SSW_ANCHOR_READ_START | SSW_ANCHOR_REF_START;
+	int8_t* read_reverse = 0;
+	void* vP;
+	cigar* path;
+	s_align* r;
+
+	for (i = 0; i < prof->n * prof->n; ++i) if (prof->mat[i] > max_match) max_match = prof->mat[i];
+	if ((int64_t)max_match * readLen >= 0x3FFF) {
+		fprintf(stderr, "The read is too long for 16 bit anchored alignment.\n");
+		return 0;
+	}
+	r = (s_align*)calloc(1, sizeof(s_align));
+	vP = k->qP_anchor(prof->read, prof->mat, readLen, prof->n);
+	if (r == 0 || vP == 0) {
 		free(r);
-		r = NULL;
+		_mm_free(vP);
+		return 0;
 	}
-	else {
-		r->cigar = path->seq;
-		r->cigarLen = path->length;
-		free(path);
+	r->ref_begin1 = r->read_begin1 = -1;
+	r->ref_end1 = r->read_end1 = r->ref_end2 = -1;
+
+	// Find the alignment score and ending position
+	best = k->sw_anchor(ref, 0, refLen, readLen, weight_gapO, gapE, vP, anchor, INT32_MAX, &r->ref_end1, &r->read_end1);
+	_mm_free(vP);
+	if (best <= 0) {
+		r->ref_end1 = r->read_end1 = -1;
+		return r;
+	}
+	r->score1 = best;
+	if (flag == 0 || ((flag & 8) == 0 && (flag & 2) != 0 && r->score1 < filters)) return r;
+
+	// Find the beginning position: the same alignment read backwards from its end, where both starts are anchored
+	if (anchor & SSW_ANCHOR_READ_START) reverse_anchor |= SSW_ANCHOR_READ_END;
+	if (anchor & SSW_ANCHOR_REF_START) reverse_anchor |= SSW_ANCHOR_REF_END;
+	read_reverse = seq_reverse(prof->read, r->read_end1, 0);
+	vP = read_reverse ? k->qP_anchor(read_reverse, prof->mat, r->read_end1 + 1, prof->n) : 0;
+	if (vP == 0) {
+		free(read_reverse);
+		align_destroy(r);
+		return 0;
+	}
+	best = k->sw_anchor(ref, 1, r->ref_end1 + 1, r->read_end1 + 1, weight_gapO, gapE, vP, reverse_anchor, r->score1, &begin_ref, &begin_read);
+	_mm_free(vP);
+	free(read_reverse);
+	if (best != r->score1) {
+		fprintf(stderr, "Alignment score and position are not consensus.\n");
+		align_destroy(r);
+		return 0;
+	}
+	r->ref_begin1 = begin_ref;
+	r->read_begin1 = r->read_end1 - begin_read;
+	if ((7&flag) == 0 || ((2&flag) != 0 && r->score1 < filters) || ((4&flag) != 0 && (r->ref_end1 - r->ref_begin1 > filterd || r->read_end1 - r->read_begin1 > filterd))) return r;
+
+	// Generate cigar.
+	path = anchor_path(ref + r->ref_begin1, prof->read + r->read_begin1, r->ref_end1 - r->ref_begin1 + 1,
+					   r->read_end1 - r->read_begin1 + 1, r->score1, weight_gapO, gapE, prof->mat, prof->n);
+	if (path == 0) {
+		align_destroy(r);
+		return 0;
+	}
+	r->cigar = path->seq;
+	r->cigarLen = path->length;
+	free(path);
+	return r;
+}
+
+int32_t ssw_column_max (const s_profile* prof,
+						const int8_t* ref,
+						int32_t refLen,
+						const uint8_t weight_gapO,
+						const uint8_t weight_gapE,
+						uint16_t* column) {
+
+	alignment_end bests[2];
+	s_workspace ws;
+	ssw_run run;
+	const ssw_kernels* k = ssw_run_init(&run, prof, weight_gapO, weight_gapE);
+	int32_t i, max = -1;
+
+	memset(&ws, 0, sizeof(s_workspace));
+	if (run.profile_byte) {
+		uint8_t* column_byte = (uint8_t*)ssw_reserve(&ws, &ws.columns, refLen > 0 ? refLen : 1);
+		if (column_byte && k->sw_byte(ref, 0, refLen, prof->readLen, weight_gapO, weight_gapE, run.profile_byte, -1, prof->bias, 15, column_byte, &ws, bests)) {
+			if (bests[0].score != 255) {
+				for (i = 0; i < refLen; ++i) column[i] = column_byte[i];
+				max = bests[0].score;
+			}
+		}
+		if (max < 0 && ! run.profile_word) goto end;
+	}
+	if (max < 0 && run.profile_word) {
+		if (k->sw_word(ref, 0, refLen, prof->readLen, weight_gapO, weight_gapE, run.profile_word, -1, 15, column, &ws, bests)) max = bests[0].score;
 	}
 
 end:
+	ssw_workspace_release(&ws);
+	ssw_run_free(&run);
+	return max;
+}
+
+typedef struct {
+	int32_t length;
+	int32_t index;
+} read_order;
+
+static int read_order_cmp (const void* a, const void* b) {
+	const read_order* x = (const read_order*)a, *y = (const read_order*)b;
+	if (x->length != y->length) return x->length < y->length ? -1 : 1;
+	return x->index < y->index ? -1 : x->index > y->index;
+}
+
+int32_t ssw_score_batch (const int8_t** reads,
+						 const int32_t* readLens,
+						 int32_t num,
+						 const int8_t* ref,
+						 int32_t refLen,
+						 const int8_t* mat,
+						 int32_t n,
+						 const uint8_t weight_gapO,
+						 const uint8_t weight_gapE,
+						 uint16_t* score,
+						 int32_t* ref_end,
+						 int32_t* read_end) {
+
+	const ssw_kernels* k = ssw_get_kernels();
+	int32_t lanes = k->width, bias = 0, i, j, group, num_word = 0;
+	read_order* order = (read_order*)malloc((num > 0 ? num : 1) * sizeof(read_order));
+	int32_t* word = (int32_t*)malloc((num > 0 ? num : 1) * sizeof(int32_t));
+	const int8_t** group_reads = (const int8_t**)malloc(lanes * sizeof(int8_t*));
+	int32_t* group_lens = (int32_t*)malloc(lanes * sizeof(int32_t));
+	alignment_end* ends = (alignment_end*)malloc(lanes * sizeof(alignment_end));
+	if (order == 0 || word == 0 || group_reads == 0 || group_lens == 0 || ends == 0) {
+		free(order);
+		free(word);
+		free(group_reads);
+		free(group_lens);
+		free(ends);
+		return -1;
+	}
+
+	for (i = 0; i < n*n; i++) if (mat[i] < bias) bias = mat[i];
+	bias = abs(bias);
+
+	/* Group reads of similar length so the lanes of a group finish together. */
+	for (i = 0; i < num; ++i) {
+		order[i].length = readLens[i];
+		order[i].index = i;
+	}
+	qsort(order, num, sizeof(read_order), read_order_cmp);
+
+	for (i = 0; i < num; i += lanes) {
+		group = num - i < lanes ? num - i : lanes;
+		for (j = 0; j < group; ++j) {
+			group_reads[j] = reads[order[i + j].index];
+			group_lens[j] = order[i + j].length;
+		}
+		k->inter_byte(group_reads, group_lens, group, ref, refLen, mat, n, weight_gapO, weight_gapE, bias, ends);
+		for (j = 0; j < group; ++j) {
+			int32_t r = order[i + j].index;
+			if (ends[j].score == 255) {	// overflowed, score again with words
+				word[num_word++] = r;
+				continue;
+			}
+			score[r] = ends[j].score;
+			ref_end[r] = ends[j].ref;
+			read_end[r] = ends[j].read;
+		}
+	}
+
+	lanes /= 2;
+	for (i = 0; i < num_word; i += lanes) {
+		group = num_word - i < lanes ? num_word - i : lanes;
+		for (j = 0; j < group; ++j) {
+			group_reads[j] = reads[word[i + j]];
+			group_lens[j] = readLens[word[i + j]];
+		}
+		k->inter_word(group_reads, group_lens, group, ref, refLen, mat, n, weight_gapO, weight_gapE, ends);
+		for (j = 0; j < group; ++j) {
+			score[word[i + j]] = ends[j].score;
+			ref_end[word[i + j]] = ends[j].ref;
+			read_end[word[i + j]] = ends[j].read;
+		}
+	}
+
+	free(order);
+	free(word);
+	free(group_reads);
+	free(group_lens);
+	free(ends);
+	return 0;
+}
+
+/* Best ungapped score ending at each reference position, one diagonal per
+   16 bit lane: H(i, j) = max(0, H(i - 1, j - 1) + mat(read[i], ref[j])) with
+   the read laid out straight, so H(i - 1, j - 1) of a whole vector is one
+   unaligned load of the previous column shifted by a lane.  Scores must fit
+   in 15 bits. */
+static int32_t ungapped_word (const int8_t* read,
+							  int32_t readLen,
+							  const int8_t* ref,
+							  int32_t refLen,
+							  const int8_t* mat,
+							  int32_t n,
+							  int32_t* column,
+							  int32_t* end_ref,
+							  int32_t* end_read) {
+
+	int32_t segLen = (readLen + 7) / 8 * 8, best = 0, i, j, c;
+	int16_t* profile = (int16_t*)malloc((n * segLen + 2 * (segLen + 8)) * sizeof(int16_t));
+	int16_t* pvHLoad, *pvHStore, *swap;
+	__m128i vZero = _mm_setzero_si128();
+	if (profile == 0) return -1;
+
+	/* padding lanes score low enough to stay at 0 */
+	for (c = 0; c < n; ++c)
+		for (i = 0; i < segLen; ++i)
+			profile[c * segLen + i] = i < readLen ? mat[read[i] * n + c] : -0x4000;
+	/* lane -1 of both columns stays 0 and feeds the first read base */
+	pvHLoad = profile + n * segLen + 8;
+	pvHStore = pvHLoad + segLen + 8;
+	memset(pvHLoad - 8, 0, 2 * (segLen + 8) * sizeof(int16_t));
+
+	for (j = 0; j < refLen; ++j) {
+		const int16_t* p = profile + ref[j] * segLen;
+		__m128i vMax = vZero;
+		int16_t max;
+		for (i = 0; i < segLen; i += 8) {
+			__m128i vH = _mm_loadu_si128((const __m128i*)(pvHLoad + i - 1));
+			vH = _mm_max_epi16(_mm_adds_epi16(vH, _mm_loadu_si128((const __m128i*)(p + i))), vZero);
+			_mm_storeu_si128((__m128i*)(pvHStore + i), vH);
+			vMax = _mm_max_epi16(vMax, vH);
+		}
+		vMax = _mm_max_epi16(vMax, _mm_srli_si128(vMax, 8));
+		vMax = _mm_max_epi16(vMax, _mm_srli_si128(vMax, 4));
+		vMax = _mm_max_epi16(vMax, _mm_srli_si128(vMax, 2));
+		max = (int16_t)_mm_extract_epi16(vMax, 0);
+		column[j] = max;
+		if (max > best) {
+			best = max;
+			*end_ref = j;
+			for (i = 0; pvHStore[i] != max; ++i);
+			*end_read = i;
+		}
+		swap = pvHLoad;
+		pvHLoad = pvHStore;
+		pvHStore = swap;
+	}
+	free(profile);
+	return best;
+}
+
+/* ungapped_word for scores too high for 16 bits, updating one column in
+   place from the last read base down */
+static int32_t ungapped_scalar (const int8_t* read,
+								int32_t readLen,
+								const int8_t* ref,
+								int32_t refLen,
+								const int8_t* mat,
+								int32_t n,
+								int32_t* column,
+								int32_t* end_ref,
+								int32_t* end_read) {
+
+	int32_t best = 0, i, j;
+	int32_t* h = (int32_t*)calloc(readLen + 1, sizeof(int32_t));	/* h[i + 1] is H(i, j) */
+	if (h == 0) return -1;
+	for (j = 0; j < refLen; ++j) {
+		int32_t max = 0;
+		for (i = readLen - 1; i >= 0; --i) {
+			h[i + 1] = h[i] + mat[read[i] * n + ref[j]];
+			if (h[i + 1] < 0) h[i + 1] = 0;
+			if (h[i + 1] > max) max = h[i + 1];
+		}
+		column[j] = max;
+		if (max > best) {
+			best = max;
+			*end_ref = j;
+			for (i = 0; h[i + 1] != max; ++i);
+			*end_read = i;
+		}
+	}
+	free(h);
+	return best;
+}
+
+s_align* ssw_ungapped (const int8_t* read,
+					   int32_t readLen,
+					   const int8_t* ref,
+					   int32_t refLen,
+					   const int8_t* mat,
+					   int32_t n,
+					   const int32_t maskLen) {
+
+	int32_t max_match = 0, best, i, edge, sum, end_ref = -1, end_read = -1;
+	int32_t* column = (int32_t*)malloc((refLen > 0 ? refLen : 1) * sizeof(int32_t));
+	s_align* r = (s_align*)calloc(1, sizeof(s_align));
+	if (column == 0 || r == 0) {
+		free(column);
+		free(r);
+		return 0;
+	}
+	r->ref_begin1 = r->read_begin1 = -1;
+	r->ref_end1 = r->read_end1 = r->ref_end2 = -1;
+
+	for (i = 0; i < n * n; ++i) if (mat[i] > max_match) max_match = mat[i];
+	if ((int64_t)max_match * readLen < 0x7FFF)
+		best = ungapped_word(read, readLen, ref, refLen, mat, n, column, &end_ref, &end_read);
+	else
+		best = ungapped_scalar(read, readLen, ref, refLen, mat, n, column, &end_ref, &end_read);
+	if (best < 0) {
+		free(column);
+		free(r);
+		return 0;
+	}
+	r->score1 = best;
+	if (best == 0) {
+		free(column);
+		return r;
+	}
+	r->ref_end1 = end_ref;
+	r->read_end1 = end_read;
+
+	/* the segment starts where the sum back from its end first reaches the
+	   score, as found by the reverse pass of ssw_align */
+	for (i = 0, sum = 0; sum != best; ++i) sum += mat[read[end_read - i] * n + ref[end_ref - i]];
+	r->ref_begin1 = end_ref - i + 1;
+	r->read_begin1 = end_read - i + 1;
+	r->cigar = (uint32_t*)malloc(sizeof(uint32_t));
+	if (r->cigar == 0) {
+		free(column);
+		free(r);
+		return 0;
+	}
+	r->cigar[0] = to_cigar_int(i, 'M');
+	r->cigarLen = 1;
+
+	/* 2nd best outside the mask, as in the striped kernels */
+	if (maskLen >= 15) {
+		edge = end_ref - maskLen > 0 ? end_ref - maskLen : 0;
+		for (i = 0; i < edge; ++i) {
+			if (column[i] > r->score2) {
+				r->score2 = column[i];
+				r->ref_end2 = i;
+			}
+		}
+		edge = end_ref + maskLen > refLen ? refLen : end_ref + maskLen;
+		for (i = edge + 1; i < refLen; ++i) {
+			if (column[i] > r->score2) {
+				r->score2 = column[i];
+				r->ref_end2 = i;
+			}
+		}
+	}
+	free(column);
 	return r;
 }
 
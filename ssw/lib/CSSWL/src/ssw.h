@@ -31,6 +31,40 @@ extern const uint8_t encoded_ops[];
 struct _profile;
 typedef struct _profile s_profile;
 
+/*!	@typedef	buffers reused by ssw_align_ws from one alignment to the next	*/
+struct _workspace;
+typedef struct _workspace s_workspace;
+
+/*!	@typedef	phases of ssw_align_ws counted in s_stats: the forward pass finding the best end, the reverse pass
+				finding the start, building its profile when not cached, and banded_sw finding the cigar	*/
+enum {
+	SSW_PHASE_FORWARD,
+	SSW_PHASE_REVERSE,
+	SSW_PHASE_CIGAR,
+	SSW_PHASES
+};
+
+/*!	@typedef	counters of ssw_align_ws, kept for a workspace given one with ssw_workspace_set_stats
+	@field	calls	times each phase ran
+	@field	nanos	nanoseconds spent in each phase
+	@field	cells	dynamic programming cells searched by each phase; the passes may stop early
+	@field	saturations	forward passes of the 8 bit kernel that overflowed and were run again with the 16 bit one
+	@field	reverse_profiles	reverse pass profiles built rather than found in the workspace
+	@field	band_widenings	times banded_sw doubled its band to reach the alignment score
+	@field	band_max	widest band of banded_sw, cells each side of the diagonal
+	@field	buffer_peak	most bytes the buffers of the workspace held
+*/
+typedef struct {
+	uint64_t calls[SSW_PHASES];
+	uint64_t nanos[SSW_PHASES];
+	uint64_t cells[SSW_PHASES];
+	uint64_t saturations;
+	uint64_t reverse_profiles;
+	uint64_t band_widenings;
+	uint64_t band_max;
+	uint64_t buffer_peak;
+} s_stats;
+
 /*!	@typedef	structure of the alignment result
 	@field	score1	the best alignment score
 	@field	score2	sub-optimal alignment score
@@ -82,6 +116,126 @@ s_profile* ssw_init (const int8_t* read, const int32_t readLen, const int8_t* ma
 */
 void init_destroy (s_profile* p);
 
+/*!	@function	Name of the widest instruction set used by profiles created from now on: "sse2", "avx2" or "avx512".  The
+				widest one the CPU supports is picked on first use unless the SSW_SIMD environment variable names another
+				supported one.  Profiles of reads shorter than four vectors use the next narrower instruction set.
+*/
+const char* ssw_simd_backend (void);
+
+/*!	@function	Use the named instruction set for profiles created from now on.  Existing profiles keep theirs.
+	@param	name	"sse2", "avx2" or "avx512"
+	@return	0 on success, -1 if the name is unknown or the CPU does not support it
+*/
+int ssw_simd_set_backend (const char* name);
+
+/*!	@function	Find the column maxima of the score matrix: the best score of any alignment ending at each position
+				of the target sequence, as used for the 2nd best alignment of ssw_align.
+	@param	prof	pointer to the query profile structure
+	@param	ref	pointer to the target sequence, as for ssw_align
+	@param	refLen	length of the target sequence
+	@param	weight_gapO	the absolute value of the gap open penalty
+	@param	weight_gapE	the absolute value of the gap extension penalty
+	@param	column	array of refLen elements that gets the column maxima
+	@return	the best alignment score, or -1 if it overflowed a profile built with score_size 0 or out of memory
+*/
+int32_t ssw_column_max (const s_profile* prof,
+						const int8_t* ref,
+						int32_t refLen,
+						const uint8_t weight_gapO,
+						const uint8_t weight_gapE,
+						uint16_t* column);
+
+/*!	@function	Score many reads against one reference, packing a different read into each SIMD lane.  Faster than
+				ssw_init and ssw_align per read when the reads are short, since no lane is spent on padding.  Scores are
+				exact for any gap penalties.
+	@param	reads	pointers to the reads, encoded like the read of ssw_init
+	@param	readLens	lengths of the reads
+	@param	num	number of reads
+	@param	ref	pointer to the target sequence, encoded like the ref of ssw_align
+	@param	refLen	length of the target sequence
+	@param	mat	pointer to the substitution matrix, as for ssw_init
+	@param	n	the square root of the number of elements in mat
+	@param	weight_gapO	the absolute value of the gap open penalty
+	@param	weight_gapE	the absolute value of the gap extension penalty
+	@param	score	gets the best alignment score of each read
+	@param	ref_end	gets the 0-based reference position where each best alignment ends, -1 when its score is 0
+	@param	read_end	gets the 0-based read position where each best alignment ends
+	@return	0 on success, -1 if out of memory
+*/
+int32_t ssw_score_batch (const int8_t** reads,
+						 const int32_t* readLens,
+						 int32_t num,
+						 const int8_t* ref,
+						 int32_t refLen,
+						 const int8_t* mat,
+						 int32_t n,
+						 const uint8_t weight_gapO,
+						 const uint8_t weight_gapE,
+						 uint16_t* score,
+						 int32_t* ref_end,
+						 int32_t* read_end);
+
+/*!	@function	Do ungapped local alignment: find the best scoring diagonal segment of the read and the target sequence.
+				Much faster than ssw_align with a prohibitive gap open penalty, and the result is filled in the same way
+				with a single M operation as the cigar.  Without a positive score all positions are -1.
+	@param	read	pointer to the read, encoded like the read of ssw_init
+	@param	readLen	length of the read
+	@param	ref	pointer to the target sequence, encoded like the ref of ssw_align
+	@param	refLen	length of the target sequence
+	@param	mat	pointer to the substitution matrix, as for ssw_init
+	@param	n	the square root of the number of elements in mat
+	@param	maskLen	as for ssw_align
+	@return	pointer to the alignment result structure, to be released with align_destroy, or 0 if out of memory
+*/
+s_align* ssw_ungapped (const int8_t* read,
+					   int32_t readLen,
+					   const int8_t* ref,
+					   int32_t refLen,
+					   const int8_t* mat,
+					   int32_t n,
+					   const int32_t maskLen);
+
+/*!	@defined	anchors of ssw_align_anchor: the alignment has to start or end at the first or last base of the read
+				or of the target sequence */
+#define SSW_ANCHOR_READ_START 1
+#define SSW_ANCHOR_READ_END 2
+#define SSW_ANCHOR_REF_START 4
+#define SSW_ANCHOR_REF_END 8
+
+/*!	@function	Do alignment with some ends anchored, in the dynamic programming itself rather than by filtering local
+				alignments: SSW_ANCHOR_READ_START | SSW_ANCHOR_READ_END aligns the whole read (semi-global),
+				SSW_ANCHOR_REF_START starts the alignment at the first base of the target sequence and SSW_ANCHOR_REF_END
+				ends it at the last one.  Ends that are not anchored are local.  Anchored ends may be gaps, so the cigar
+				can start or end with I or D.  Uses 16 bit kernels whatever the score_size of the profile.  A
+				weight_gapE above weight_gapO is taken as weight_gapO, the cost of reopening the gap instead.
+	@param	prof	pointer to the query profile structure
+	@param	ref	pointer to the target sequence, as for ssw_align
+	@param	refLen	length of the target sequence
+	@param	weight_gapO	the absolute value of gap open penalty
+	@param	weight_gapE	the absolute value of gap extension penalty
+	@param	flag	as for ssw_align
+	@param	filters	as for ssw_align
+	@param	filterd	as for ssw_align
+	@param	anchor	bitwise or of SSW_ANCHOR_* flags
+	@return	pointer to the alignment result structure, with score2 0 and ref_end2 -1.  When no anchored alignment scores
+			above 0 the score is 0 and all positions are -1.  0 if out of memory or the read is too long for 16 bit
+			scores, which needs the largest score of mat times readLen to stay below 16383.
+*/
+s_align* ssw_align_anchor (const s_profile* prof,
+						   const int8_t* ref,
+						   int32_t refLen,
+						   const uint8_t weight_gapO,
+						   const uint8_t weight_gapE,
+						   const uint8_t flag,
+						   const uint16_t filters,
+						   const int32_t filterd,
+						   const int32_t anchor);
+
+/*!	@function	Number of bytes held by the striped byte and word query profiles of a profile.
+	@param	p	pointer to the query profile structure
+*/
+size_t ssw_profile_size (const s_profile* p);
+
 // @function	ssw alignment.
 /*!	@function	Do Striped Smith-Waterman alignment.
 	@param	prof	pointer to the query profile structure
@@ -125,6 +279,76 @@ s_align* ssw_align (const s_profile* prof,
 					const int32_t filterd,
 					const int32_t maskLen);
 
+/*!	@function	Create an empty workspace for ssw_align_ws.
+	@return	pointer to the workspace, or 0 if out of memory
+*/
+s_workspace* ssw_workspace_init (void);
+
+/*!	@function	Release a workspace and the buffers it holds.
+	@param	ws	pointer to the workspace
+*/
+void ssw_workspace_destroy (s_workspace* ws);
+
+/*!	@function	Drop the reverse pass profiles a workspace holds.  They are keyed by the address of the profile they were
+				built for, so call this before aligning in ws with a profile that may reuse the address of one destroyed
+				since it was last aligned in ws.
+	@param	ws	pointer to the workspace
+*/
+void ssw_workspace_forget (s_workspace* ws);
+
+/*!	@function	Free the buffers of a workspace, keeping its high-water mark.
+	@param	ws	pointer to the workspace
+*/
+void ssw_workspace_release (s_workspace* ws);
+
+/*!	@function	Number of bytes the buffers of a workspace hold now, and at most so far.
+	@param	ws	pointer to the workspace
+	@param	peak	if not 0, gets the high-water mark
+	@return	bytes held now
+*/
+size_t ssw_workspace_size (const s_workspace* ws, size_t* peak);
+
+/*!	@function	Number of reverse pass profiles a workspace found in its cache, and built.
+	@param	ws	pointer to the workspace
+	@param	misses	if not 0, gets the number built
+	@return	number found
+*/
+size_t ssw_workspace_reverse_hits (const s_workspace* ws, size_t* misses);
+
+/*!	@function	Count the alignments of a workspace in stats, or stop counting.  Counting reads the clock around each
+				phase; otherwise it costs a test per phase.
+	@param	ws	pointer to the workspace
+	@param	stats	counters to add to, or 0
+*/
+void ssw_workspace_set_stats (s_workspace* ws, s_stats* stats);
+
+/*!	@function	Add the counters of from to to, keeping the largest band_max and buffer_peak.
+*/
+void ssw_stats_add (s_stats* to, const s_stats* from);
+
+/*!	@function	Monotonic clock of s_stats.
+	@return	nanoseconds since an arbitrary start
+*/
+uint64_t ssw_clock_ns (void);
+
+/*!	@function	ssw_align without allocating: the kernel vectors, column maxima, reversed read, banded_sw matrices and
+				the result all live in ws, whose buffers only grow when a longer read or reference needs it.  The reverse
+				pass profiles of the last few read prefixes are kept in ws too and reused; see ssw_workspace_forget.
+	@param	ws	pointer to the workspace; one alignment at a time
+	@return	pointer to the alignment result structure held by ws, with its cigar, valid until the next call with ws; do not
+			pass it to align_destroy.  0 on the same errors as ssw_align or if out of memory
+*/
+const s_align* ssw_align_ws (const s_profile* prof,
+							 const int8_t* ref,
+							 int32_t refLen,
+							 const uint8_t weight_gapO,
+							 const uint8_t weight_gapE,
+							 const uint8_t flag,
+							 const uint16_t filters,
+							 const int32_t filterd,
+							 const int32_t maskLen,
+							 s_workspace* ws);
+
 /*!	@function	Release the memory allocated by function ssw_align.
 	@param	a	pointer to the alignment result structure
 */
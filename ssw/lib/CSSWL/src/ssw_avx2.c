@@ -0,0 +1,84 @@
+/*
+ *  ssw_avx2.c
+ *
+ *  AVX2 instantiation of the striped kernels: 32 byte or 16 word lanes.
+ *  Only used when the CPU reports AVX2 at run time.
+ *
+ */
+
+#include "ssw_simd.h"
+
+#if SSW_HAVE_AVX
+
+#if defined(__clang__)
+#pragma clang attribute push (__attribute__((target("avx2"))), apply_to=function)
+#else
+#pragma GCC push_options
+#pragma GCC target("avx2")
+#endif
+
+#include <immintrin.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define LIKELY(x) __builtin_expect((x),1)
+#define UNLIKELY(x) __builtin_expect((x),0)
+
+typedef __m256i vec_t;
+#define VBYTES 32
+#define SSW_KERNEL(f) f##_avx2
+#define SSW_KERNELS ssw_kernels_avx2
+#define SSW_KERNEL_NAME "avx2"
+
+#define V_ZERO() _mm256_setzero_si256()
+#define V_SET1_8(x) _mm256_set1_epi8(x)
+#define V_SET1_16(x) _mm256_set1_epi16(x)
+#define V_LOAD(p) _mm256_load_si256(p)
+#define V_STORE(p, v) _mm256_store_si256((p), (v))
+#define V_ADDS_U8(a, b) _mm256_adds_epu8((a), (b))
+#define V_SUBS_U8(a, b) _mm256_subs_epu8((a), (b))
+#define V_MAX_U8(a, b) _mm256_max_epu8((a), (b))
+#define V_ADDS_I16(a, b) _mm256_adds_epi16((a), (b))
+#define V_SUBS_U16(a, b) _mm256_subs_epu16((a), (b))
+#define V_SUBS_I16(a, b) _mm256_subs_epi16((a), (b))
+#define V_MAX_I16(a, b) _mm256_max_epi16((a), (b))
+#define V_AND(a, b) _mm256_and_si256((a), (b))
+/* byte shifts only work within 128 bit lanes, so carry the top of the low
+   lane into the high lane */
+#define V_SHL(v, n) _mm256_alignr_epi8((v), _mm256_permute2x128_si256((v), (v), 0x08), 16 - (n))
+#define V_SHL8(v) V_SHL((v), 1)
+#define V_SHL16(v) V_SHL((v), 2)
+#define V_ALL_EQ_U8(a, b) ((uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi8((a), (b))) == 0xffffffffu)
+#define V_ALL_EQ_I16(a, b) ((uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi16((a), (b))) == 0xffffffffu)
+#define V_ANY_GT_I16(a, b) (_mm256_movemask_epi8(_mm256_cmpgt_epi16((a), (b))) != 0)
+
+static inline uint8_t hmax_u8_avx2(__m256i v) {
+	__m128i vm = _mm_max_epu8(_mm256_castsi256_si128(v), _mm256_extracti128_si256(v, 1));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 8));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 4));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 2));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 1));
+	return (uint8_t)_mm_extract_epi16(vm, 0);
+}
+
+static inline uint16_t hmax_i16_avx2(__m256i v) {
+	__m128i vm = _mm_max_epi16(_mm256_castsi256_si128(v), _mm256_extracti128_si256(v, 1));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 8));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 4));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 2));
+	return (uint16_t)_mm_extract_epi16(vm, 0);
+}
+
+#define V_HMAX_U8(v) hmax_u8_avx2(v)
+#define V_HMAX_I16(v) hmax_i16_avx2(v)
+
+#include "ssw_kernel.h"
+
+#if defined(__clang__)
+#pragma clang attribute pop
+#else
+#pragma GCC pop_options
+#endif
+
+#endif	// SSW_HAVE_AVX
@@ -0,0 +1,86 @@
+/*
+ *  ssw_avx512.c
+ *
+ *  AVX-512BW instantiation of the striped kernels: 64 byte or 32 word
+ *  lanes.  Only used when the CPU reports AVX-512BW at run time.
+ *
+ */
+
+#include "ssw_simd.h"
+
+#if SSW_HAVE_AVX
+
+#if defined(__clang__)
+#pragma clang attribute push (__attribute__((target("avx512f,avx512bw"))), apply_to=function)
+#else
+#pragma GCC push_options
+#pragma GCC target("avx512f,avx512bw")
+#endif
+
+#include <immintrin.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define LIKELY(x) __builtin_expect((x),1)
+#define UNLIKELY(x) __builtin_expect((x),0)
+
+typedef __m512i vec_t;
+#define VBYTES 64
+#define SSW_KERNEL(f) f##_avx512
+#define SSW_KERNELS ssw_kernels_avx512
+#define SSW_KERNEL_NAME "avx512"
+
+#define V_ZERO() _mm512_setzero_si512()
+#define V_SET1_8(x) _mm512_set1_epi8(x)
+#define V_SET1_16(x) _mm512_set1_epi16(x)
+#define V_LOAD(p) _mm512_load_si512(p)
+#define V_STORE(p, v) _mm512_store_si512((p), (v))
+#define V_ADDS_U8(a, b) _mm512_adds_epu8((a), (b))
+#define V_SUBS_U8(a, b) _mm512_subs_epu8((a), (b))
+#define V_MAX_U8(a, b) _mm512_max_epu8((a), (b))
+#define V_ADDS_I16(a, b) _mm512_adds_epi16((a), (b))
+#define V_SUBS_U16(a, b) _mm512_subs_epu16((a), (b))
+#define V_SUBS_I16(a, b) _mm512_subs_epi16((a), (b))
+#define V_MAX_I16(a, b) _mm512_max_epi16((a), (b))
+#define V_AND(a, b) _mm512_and_si512((a), (b))
+/* byte shifts only work within 128 bit lanes, so carry the top of each
+   lane into the next one */
+#define V_SHL(v, n) _mm512_alignr_epi8((v), _mm512_alignr_epi32((v), _mm512_setzero_si512(), 12), 16 - (n))
+#define V_SHL8(v) V_SHL((v), 1)
+#define V_SHL16(v) V_SHL((v), 2)
+#define V_ALL_EQ_U8(a, b) (_mm512_cmpeq_epi8_mask((a), (b)) == 0xffffffffffffffffull)
+#define V_ALL_EQ_I16(a, b) (_mm512_cmpeq_epi16_mask((a), (b)) == 0xffffffffu)
+#define V_ANY_GT_I16(a, b) (_mm512_cmpgt_epi16_mask((a), (b)) != 0)
+
+static inline uint8_t hmax_u8_avx512(__m512i v) {
+	__m256i v2 = _mm256_max_epu8(_mm512_castsi512_si256(v), _mm512_extracti64x4_epi64(v, 1));
+	__m128i vm = _mm_max_epu8(_mm256_castsi256_si128(v2), _mm256_extracti128_si256(v2, 1));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 8));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 4));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 2));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 1));
+	return (uint8_t)_mm_extract_epi16(vm, 0);
+}
+
+static inline uint16_t hmax_i16_avx512(__m512i v) {
+	__m256i v2 = _mm256_max_epi16(_mm512_castsi512_si256(v), _mm512_extracti64x4_epi64(v, 1));
+	__m128i vm = _mm_max_epi16(_mm256_castsi256_si128(v2), _mm256_extracti128_si256(v2, 1));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 8));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 4));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 2));
+	return (uint16_t)_mm_extract_epi16(vm, 0);
+}
+
+#define V_HMAX_U8(v) hmax_u8_avx512(v)
+#define V_HMAX_I16(v) hmax_i16_avx512(v)
+
+#include "ssw_kernel.h"
+
+#if defined(__clang__)
+#pragma clang attribute pop
+#else
+#pragma GCC pop_options
+#endif
+
+#endif	// SSW_HAVE_AVX
@@ -0,0 +1,868 @@
+/*
+ *  ssw_kernel.h
+ *
+ *  Striped query profiles, Smith-Waterman kernels and inter-sequence
+ *  kernels written once against a small set of vector macros.  The including file defines the macros for
+ *  one instruction set and then includes this file, which defines the
+ *  functions and the ssw_kernels table SSW_KERNELS:
+ *
+ *	vec_t			vector type
+ *	VBYTES			vector width in bytes
+ *	SSW_KERNEL(f)	name of kernel function f for this instruction set
+ *	V_ZERO()		all zero vector
+ *	V_SET1_8(x), V_SET1_16(x)	broadcast a byte or a word
+ *	V_LOAD(p), V_STORE(p, v)	aligned load and store
+ *	V_ADDS_U8, V_SUBS_U8, V_MAX_U8		unsigned saturated byte arithmetic
+ *	V_ADDS_I16, V_SUBS_U16, V_SUBS_I16, V_MAX_I16	word arithmetic
+ *	V_SHL8(v), V_SHL16(v)	shift the whole vector up by one byte or word lane
+ *	V_ALL_EQ_U8(a, b), V_ALL_EQ_I16(a, b)	true if every lane is equal
+ *	V_ANY_GT_I16(a, b)	true if any lane of a is greater than b
+ *	V_HMAX_U8(v), V_HMAX_I16(v)	largest lane
+ *	V_AND(a, b)		bitwise and
+ *
+ *  The kernels follow the SSE2 originals of Mengyao Zhao step by step, so
+ *  every instruction set returns the same scores and positions.
+ *
+ *  Read positions past the end of the read are padding.  Their cells extend
+ *  the last read base diagonally, so they copy its scores into the column
+ *  maxima of the following columns: one column per padding position.  SSE2
+ *  profiles have at most 15 such positions, which the maskLen >= 15 of the
+ *  2nd best search hides.  Wider profiles have up to 63, so they carry a
+ *  mask of the positions an SSE2 profile would have, stored in front of the
+ *  profile, and leave the other ones out of the column maxima.
+ *
+ */
+
+#define LANES8 VBYTES
+#define LANES16 (VBYTES / 2)
+
+#if VBYTES > 16
+#define PAD_MASK 1
+#define MASK_COLUMN(v, j) V_AND((v), V_LOAD(pvMask + (j)))
+#else
+#define PAD_MASK 0
+#define MASK_COLUMN(v, j) (v)
+#endif
+
+/* Allocate n zeroed vectors. */
+static vec_t* SSW_KERNEL(valloc) (int32_t n) {
+	vec_t* v = (vec_t*)_mm_malloc((n > 0 ? n : 1) * sizeof(vec_t), VBYTES);
+	if (v) memset(v, 0, (n > 0 ? n : 1) * sizeof(vec_t));
+	return v;
+}
+
+/* Generate query profile rearrange query sequence & calculate the weight of match/mismatch. */
+static void* SSW_KERNEL(qP_byte) (const int8_t* read_num,
+				  const int8_t* mat,
+				  const int32_t readLen,
+				  const int32_t n,	/* the edge length of the squre matrix mat */
+				  uint8_t bias,
+				  s_workspace* ws,	/* if not 0, the profile goes in its buffer b */
+				  ssw_buffer* b) {
+
+	int32_t segLen = (readLen + LANES8 - 1) / LANES8; /* Split the register into LANES8 pieces.
+								     Each piece is 8 bit. Split the read into LANES8 segments.
+								     Calculate LANES8 segments in parallel.
+								   */
+	vec_t* vProfile = ws ? (vec_t*)ssw_reserve(ws, b, (n + PAD_MASK) * segLen * sizeof(vec_t)) :
+						  SSW_KERNEL(valloc)((n + PAD_MASK) * segLen);
+	int8_t* t = (int8_t*)vProfile;
+	int32_t nt, i, j, segNum;
+
+	if (! vProfile) return 0;
+
+#if PAD_MASK
+	/* keep the positions of a 16 lane profile */
+	int32_t keepLen = (readLen + 15) / 16 * 16;
+	for (i = 0; i < segLen; i ++) {
+		for (segNum = 0; segNum < LANES8; segNum ++) {
+			*t++ = i + segNum * segLen < keepLen ? -1 : 0;
+		}
+	}
+#endif
+
+	/* Generate query profile rearrange query sequence & calculate the weight of match/mismatch */
+	for (nt = 0; LIKELY(nt < n); nt ++) {
+		for (i = 0; i < segLen; i ++) {
+			j = i;
+			for (segNum = 0; LIKELY(segNum < LANES8) ; segNum ++) {
+				*t++ = j>= readLen ? bias : mat[nt * n + read_num[j]] + bias;
+				j += segLen;
+			}
+		}
+	}
+	return vProfile;
+}
+
+/* Striped Smith-Waterman
+   Record the highest score of each reference position.
+   Return the alignment score and ending position of the best alignment, 2nd best alignment, etc.
+   Gap begin and gap extension are different.
+   wight_match > 0, all other weights < 0.
+   The returned positions are 0-based.
+ */
+static alignment_end* SSW_KERNEL(sw_byte) (const int8_t* ref,
+							 int8_t ref_dir,	// 0: forward ref; 1: reverse ref
+							 int32_t refLen,
+							 int32_t readLen,
+							 const uint8_t weight_gapO, /* will be used as - */
+							 const uint8_t weight_gapE, /* will be used as - */
+							 const void* profile,
+							 uint8_t terminate,	/* the best alignment score: used to terminate
+												   the matrix calculation when locating the
+												   alignment beginning point. If this score
+												   is set to 0, it will not be used */
+	 						 uint8_t bias,  /* Shift 0 point to a positive value. */
+							 int32_t maskLen,
+							 uint8_t* column,	/* if not 0, gets the refLen column maxima */
+							 s_workspace* ws,	/* holds the other buffers */
+							 alignment_end* bests) {
+
+	uint8_t max = 0;		                     /* the max alignment score */
+	int32_t end_read = readLen - 1;
+	int32_t end_ref = -1; /* 0_based best alignment ending point; Initialized as isn't aligned -1. */
+	int32_t segLen = (readLen + LANES8 - 1) / LANES8; /* number of segment */
+#if PAD_MASK
+	const vec_t* pvMask = (const vec_t*)profile;
+	const vec_t* vProfile = pvMask + segLen;
+#else
+	const vec_t* vProfile = (const vec_t*)profile;
+#endif
+
+	/* array to record the largest score of each reference position */
+	uint8_t* maxColumn = column ? column : (uint8_t*)ssw_reserve(ws, &ws->columns, refLen);
+
+	/* Define 0 vector. */
+	vec_t vZero = V_ZERO();
+
+	vec_t* pvHStore = (vec_t*)ssw_reserve(ws, &ws->vectors, 4 * segLen * sizeof(vec_t));
+	vec_t* pvHLoad = pvHStore + segLen;
+	vec_t* pvE = pvHLoad + segLen;
+	vec_t* pvHmax = pvE + segLen;
+
+	int32_t i, j;
+	/* insertion begin vector */
+	vec_t vGapO = V_SET1_8(weight_gapO);
+
+	/* insertion extension vector */
+	vec_t vGapE = V_SET1_8(weight_gapE);
+
+	/* bias vector */
+	vec_t vBias = V_SET1_8(bias);
+
+	vec_t vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
+	vec_t vMaxMark = vZero; /* Trace the highest score till the previous column. */
+	vec_t vTemp;
+	int32_t edge, begin = 0, end = refLen, step = 1;
+
+	if (! maxColumn || ! pvHStore) return 0;
+	memset(maxColumn, 0, refLen);
+	memset(pvHStore, 0, 4 * segLen * sizeof(vec_t));
+
+	/* outer loop to process the reference sequence */
+	if (ref_dir == 1) {
+		begin = refLen - 1;
+		end = -1;
+		step = -1;
+	}
+	for (i = begin; LIKELY(i != end); i += step) {
+		vec_t e, vF = vZero, vMaxColumn = vZero; /* Initialize F value to 0.
+							   Any errors to vH values will be corrected in the Lazy_F loop.
+							 */
+
+		vec_t vH = pvHStore[segLen - 1];
+		vH = V_SHL8 (vH); /* Shift the value in vH up by 1 byte. */
+		const vec_t* vP = vProfile + ref[i] * segLen; /* Right part of the vProfile */
+
+		/* Swap the 2 H buffers. */
+		vec_t* pv = pvHLoad;
+		pvHLoad = pvHStore;
+		pvHStore = pv;
+
+		/* inner loop to process the query sequence */
+		for (j = 0; LIKELY(j < segLen); ++j) {
+			vH = V_ADDS_U8(vH, V_LOAD(vP + j));
+			vH = V_SUBS_U8(vH, vBias); /* vH will be always > 0 */
+
+			/* Get max from vH, vE and vF. */
+			e = V_LOAD(pvE + j);
+			vH = V_MAX_U8(vH, e);
+			vH = V_MAX_U8(vH, vF);
+			vMaxColumn = V_MAX_U8(vMaxColumn, MASK_COLUMN(vH, j));
+
+			/* Save vH values. */
+			V_STORE(pvHStore + j, vH);
+
+			/* Update vE value. */
+			vH = V_SUBS_U8(vH, vGapO); /* saturation arithmetic, result >= 0 */
+			e = V_SUBS_U8(e, vGapE);
+			e = V_MAX_U8(e, vH);
+			V_STORE(pvE + j, e);
+
+			/* Update vF value. */
+			vF = V_SUBS_U8(vF, vGapE);
+			vF = V_MAX_U8(vF, vH);
+
+			/* Load the next vH. */
+			vH = V_LOAD(pvHLoad + j);
+		}
+
+		/* Lazy_F loop: has been revised to disallow adjecent insertion and then deletion, so don't update E(i, j), learn from SWPS3 */
+		/* reset pointers to the start of the saved data */
+		j = 0;
+		vH = V_LOAD (pvHStore + j);
+
+		/*  the computed vF value is for the given column.  since */
+		/*  we are at the end, we need to shift the vF value over */
+		/*  to the next column. */
+		vF = V_SHL8 (vF);
+		vTemp = V_SUBS_U8 (vH, vGapO);
+		vTemp = V_SUBS_U8 (vF, vTemp);
+
+		while (! V_ALL_EQ_U8 (vTemp, vZero))
+		{
+			vH = V_MAX_U8 (vH, vF);
+			vMaxColumn = V_MAX_U8(vMaxColumn, MASK_COLUMN(vH, j));
+			V_STORE (pvHStore + j, vH);
+			vF = V_SUBS_U8 (vF, vGapE);
+			j++;
+			if (j >= segLen)
+			{
+				j = 0;
+				vF = V_SHL8 (vF);
+			}
+			vH = V_LOAD (pvHStore + j);
+
+			vTemp = V_SUBS_U8 (vH, vGapO);
+			vTemp = V_SUBS_U8 (vF, vTemp);
+		}
+
+		vMaxScore = V_MAX_U8(vMaxScore, vMaxColumn);
+		if (! V_ALL_EQ_U8(vMaxMark, vMaxScore)) {
+			uint8_t temp;
+			vMaxMark = vMaxScore;
+			temp = V_HMAX_U8(vMaxScore);
+
+			if (LIKELY(temp > max)) {
+				max = temp;
+				if (max + bias >= 255) break;	//overflow
+				end_ref = i;
+
+				/* Store the column with the highest alignment score in order to trace the alignment ending position on read. */
+				for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
+			}
+		}
+
+		/* Record the max score of current column. */
+		maxColumn[i] = V_HMAX_U8(vMaxColumn);
+		if (maxColumn[i] == terminate) break;
+	}
+
+	/* Trace the alignment ending position on read. */
+	uint8_t *t = (uint8_t*)pvHmax;
+	int32_t column_len = segLen * LANES8;
+	for (i = 0; LIKELY(i < column_len); ++i, ++t) {
+		int32_t temp;
+		if (*t == max) {
+			temp = i / LANES8 + i % LANES8 * segLen;
+			if (temp < end_read) end_read = temp;
+		}
+	}
+
+	/* Find the most possible 2nd best alignment. */
+	bests[0].score = max + bias >= 255 ? 255 : max;
+	bests[0].ref = end_ref;
+	bests[0].read = end_read;
+
+	bests[1].score = 0;
+	bests[1].ref = 0;
+	bests[1].read = 0;
+
+	edge = (end_ref - maskLen) > 0 ? (end_ref - maskLen) : 0;
+	for (i = 0; i < edge; i ++) {
+		if (maxColumn[i] > bests[1].score) {
+			bests[1].score = maxColumn[i];
+			bests[1].ref = i;
+		}
+	}
+	edge = (end_ref + maskLen) > refLen ? refLen : (end_ref + maskLen);
+	for (i = edge + 1; i < refLen; i ++) {
+		if (maxColumn[i] > bests[1].score) {
+			bests[1].score = maxColumn[i];
+			bests[1].ref = i;
+		}
+	}
+
+	return bests;
+}
+
+static void* SSW_KERNEL(qP_word) (const int8_t* read_num,
+				  const int8_t* mat,
+				  const int32_t readLen,
+				  const int32_t n,
+				  s_workspace* ws,	/* if not 0, the profile goes in its buffer b */
+				  ssw_buffer* b) {
+
+	int32_t segLen = (readLen + LANES16 - 1) / LANES16;
+	vec_t* vProfile = ws ? (vec_t*)ssw_reserve(ws, b, (n + PAD_MASK) * segLen * sizeof(vec_t)) :
+						  SSW_KERNEL(valloc)((n + PAD_MASK) * segLen);
+	int16_t* t = (int16_t*)vProfile;
+	int32_t nt, i, j;
+	int32_t segNum;
+
+	if (! vProfile) return 0;
+
+#if PAD_MASK
+	/* keep the positions of an 8 lane profile */
+	int32_t keepLen = (readLen + 7) / 8 * 8;
+	for (i = 0; i < segLen; i ++) {
+		for (segNum = 0; segNum < LANES16; segNum ++) {
+			*t++ = i + segNum * segLen < keepLen ? -1 : 0;
+		}
+	}
+#endif
+
+	/* Generate query profile rearrange query sequence & calculate the weight of match/mismatch */
+	for (nt = 0; LIKELY(nt < n); nt ++) {
+		for (i = 0; i < segLen; i ++) {
+			j = i;
+			for (segNum = 0; LIKELY(segNum < LANES16) ; segNum ++) {
+				*t++ = j>= readLen ? 0 : mat[nt * n + read_num[j]];
+				j += segLen;
+			}
+		}
+	}
+	return vProfile;
+}
+
+static alignment_end* SSW_KERNEL(sw_word) (const int8_t* ref,
+							 int8_t ref_dir,	// 0: forward ref; 1: reverse ref
+							 int32_t refLen,
+							 int32_t readLen,
+							 const uint8_t weight_gapO, /* will be used as - */
+							 const uint8_t weight_gapE, /* will be used as - */
+							 const void* profile,
+							 uint16_t terminate,
+							 int32_t maskLen,
+							 uint16_t* column,	/* if not 0, gets the refLen column maxima */
+							 s_workspace* ws,	/* holds the other buffers */
+							 alignment_end* bests) {
+
+	uint16_t max = 0;		                     /* the max alignment score */
+	int32_t end_read = readLen - 1;
+	int32_t end_ref = 0; /* 1_based best alignment ending point; Initialized as isn't aligned - 0. */
+	int32_t segLen = (readLen + LANES16 - 1) / LANES16; /* number of segment */
+#if PAD_MASK
+	const vec_t* pvMask = (const vec_t*)profile;
+	const vec_t* vProfile = pvMask + segLen;
+#else
+	const vec_t* vProfile = (const vec_t*)profile;
+#endif
+
+	/* array to record the largest score of each reference position */
+	uint16_t* maxColumn = column ? column : (uint16_t*)ssw_reserve(ws, &ws->columns, refLen * 2);
+
+	/* Define 0 vector. */
+	vec_t vZero = V_ZERO();
+
+	vec_t* pvHStore = (vec_t*)ssw_reserve(ws, &ws->vectors, 4 * segLen * sizeof(vec_t));
+	vec_t* pvHLoad = pvHStore + segLen;
+	vec_t* pvE = pvHLoad + segLen;
+	vec_t* pvHmax = pvE + segLen;
+
+	int32_t i, j, k;
+	/* insertion begin vector */
+	vec_t vGapO = V_SET1_16(weight_gapO);
+
+	/* insertion extension vector */
+	vec_t vGapE = V_SET1_16(weight_gapE);
+
+	vec_t vMaxScore = vZero; /* Trace the highest score of the whole SW matrix. */
+	vec_t vMaxMark = vZero; /* Trace the highest score till the previous column. */
+	int32_t edge, begin = 0, end = refLen, step = 1;
+
+	if (! maxColumn || ! pvHStore) return 0;
+	memset(maxColumn, 0, refLen * 2);
+	memset(pvHStore, 0, 4 * segLen * sizeof(vec_t));
+
+	/* outer loop to process the reference sequence */
+	if (ref_dir == 1) {
+		begin = refLen - 1;
+		end = -1;
+		step = -1;
+	}
+	for (i = begin; LIKELY(i != end); i += step) {
+		vec_t e, vF = vZero; /* Initialize F value to 0.
+							   Any errors to vH values will be corrected in the Lazy_F loop.
+							 */
+		vec_t vH = pvHStore[segLen - 1];
+		vH = V_SHL16 (vH); /* Shift the value in vH up by 2 bytes. */
+
+		/* Swap the 2 H buffers. */
+		vec_t* pv = pvHLoad;
+
+		vec_t vMaxColumn = vZero; /* vMaxColumn is used to record the max values of column i. */
+
+		const vec_t* vP = vProfile + ref[i] * segLen; /* Right part of the vProfile */
+		pvHLoad = pvHStore;
+		pvHStore = pv;
+
+		/* inner loop to process the query sequence */
+		for (j = 0; LIKELY(j < segLen); j ++) {
+			vH = V_ADDS_I16(vH, V_LOAD(vP + j));
+
+			/* Get max from vH, vE and vF. */
+			e = V_LOAD(pvE + j);
+			vH = V_MAX_I16(vH, e);
+			vH = V_MAX_I16(vH, vF);
+			vMaxColumn = V_MAX_I16(vMaxColumn, MASK_COLUMN(vH, j));
+
+			/* Save vH values. */
+			V_STORE(pvHStore + j, vH);
+
+			/* Update vE value. */
+			vH = V_SUBS_U16(vH, vGapO); /* saturation arithmetic, result >= 0 */
+			e = V_SUBS_U16(e, vGapE);
+			e = V_MAX_I16(e, vH);
+			V_STORE(pvE + j, e);
+
+			/* Update vF value. */
+			vF = V_SUBS_U16(vF, vGapE);
+			vF = V_MAX_I16(vF, vH);
+
+			/* Load the next vH. */
+			vH = V_LOAD(pvHLoad + j);
+		}
+
+		/* Lazy_F loop: has been revised to disallow adjecent insertion and then deletion, so don't update E(i, j), learn from SWPS3 */
+		for (k = 0; LIKELY(k < LANES16); ++k) {
+			vF = V_SHL16 (vF);
+			for (j = 0; LIKELY(j < segLen); ++j) {
+				vH = V_LOAD(pvHStore + j);
+				vH = V_MAX_I16(vH, vF);
+				vMaxColumn = V_MAX_I16(vMaxColumn, MASK_COLUMN(vH, j)); //newly added line
+				V_STORE(pvHStore + j, vH);
+				vH = V_SUBS_U16(vH, vGapO);
+				vF = V_SUBS_U16(vF, vGapE);
+				if (UNLIKELY(! V_ANY_GT_I16(vF, vH))) goto end;
+			}
+		}
+
+end:
+		vMaxScore = V_MAX_I16(vMaxScore, vMaxColumn);
+		if (! V_ALL_EQ_I16(vMaxMark, vMaxScore)) {
+			uint16_t temp;
+			vMaxMark = vMaxScore;
+			temp = V_HMAX_I16(vMaxScore);
+
+			if (LIKELY(temp > max)) {
+				max = temp;
+				end_ref = i;
+				for (j = 0; LIKELY(j < segLen); ++j) pvHmax[j] = pvHStore[j];
+			}
+		}
+
+		/* Record the max score of current column. */
+		maxColumn[i] = V_HMAX_I16(vMaxColumn);
+		if (maxColumn[i] == terminate) break;
+	}
+
+	/* Trace the alignment ending position on read. */
+	uint16_t *t = (uint16_t*)pvHmax;
+	int32_t column_len = segLen * LANES16;
+	for (i = 0; LIKELY(i < column_len); ++i, ++t) {
+		int32_t temp;
+		if (*t == max) {
+			temp = i / LANES16 + i % LANES16 * segLen;
+			if (temp < end_read) end_read = temp;
+		}
+	}
+
+	/* Find the most possible 2nd best alignment. */
+	bests[0].score = max;
+	bests[0].ref = end_ref;
+	bests[0].read = end_read;
+
+	bests[1].score = 0;
+	bests[1].ref = 0;
+	bests[1].read = 0;
+
+	edge = (end_ref - maskLen) > 0 ? (end_ref - maskLen) : 0;
+	for (i = 0; i < edge; i ++) {
+		if (maxColumn[i] > bests[1].score) {
+			bests[1].score = maxColumn[i];
+			bests[1].ref = i;
+		}
+	}
+	edge = (end_ref + maskLen) > refLen ? refLen : (end_ref + maskLen);
+	for (i = edge; i < refLen; i ++) {
+		if (maxColumn[i] > bests[1].score) {
+			bests[1].score = maxColumn[i];
+			bests[1].ref = i;
+		}
+	}
+
+	return bests;
+}
+
+/* Inter-sequence kernels: every lane holds a different read and all of them
+   are scored against the same reference with the plain row by row
+   recurrence, so no lane is wasted on padding when the reads are short.
+   ends[k] gets the best score of read k, the first reference position
+   reaching it and the smallest read position reaching it there; the
+   reference position is -1 when the score is 0. */
+static void SSW_KERNEL(inter_byte) (const int8_t** reads,
+							const int32_t* readLens,
+							int32_t num,	/* number of reads, at most LANES8 */
+							const int8_t* ref,
+							int32_t refLen,
+							const int8_t* mat,
+							int32_t n,
+							const uint8_t weight_gapO, /* will be used as - */
+							const uint8_t weight_gapE, /* will be used as - */
+							uint8_t bias,
+							alignment_end* ends) {
+
+	int32_t maxLen = 0, i, j, k, nt;
+	for (k = 0; k < num; ++k) if (readLens[k] > maxLen) maxLen = readLens[k];
+
+	/* n rows of scores shifted by bias, then a row masking out the lanes
+	   past the end of their read */
+	vec_t* vProfile = SSW_KERNEL(valloc)((n + 1) * maxLen);
+	vec_t* pvMask = vProfile + n * maxLen;
+	vec_t* pvH = SSW_KERNEL(valloc)(maxLen);
+	vec_t* pvE = SSW_KERNEL(valloc)(maxLen);
+	vec_t vColumn;
+	uint8_t* column = (uint8_t*)&vColumn;
+
+	for (nt = 0; nt < n; ++nt) {
+		for (i = 0; i < maxLen; ++i) {
+			uint8_t* t = (uint8_t*)(vProfile + nt * maxLen + i);
+			for (k = 0; k < num; ++k) t[k] = i < readLens[k] ? mat[nt * n + reads[k][i]] + bias : 0;
+		}
+	}
+	for (i = 0; i < maxLen; ++i) {
+		uint8_t* t = (uint8_t*)(pvMask + i);
+		for (k = 0; k < num; ++k) t[k] = i < readLens[k] ? 0xff : 0;
+	}
+	for (k = 0; k < num; ++k) {
+		ends[k].score = 0;
+		ends[k].ref = -1;
+		ends[k].read = 0;
+	}
+
+	vec_t vZero = V_ZERO();
+	vec_t vGapO = V_SET1_8(weight_gapO);
+	vec_t vGapE = V_SET1_8(weight_gapE);
+	vec_t vBias = V_SET1_8(bias);
+	vec_t vMaxScore = vZero;
+
+	for (j = 0; LIKELY(j < refLen); ++j) {
+		const vec_t* vP = vProfile + ref[j] * maxLen;
+		vec_t vF = vZero, vHDiag = vZero, vMaxColumn = vZero, vMax;
+		for (i = 0; LIKELY(i < maxLen); ++i) {
+			vec_t vHUp = V_LOAD(pvH + i);
+			vec_t e = V_MAX_U8(V_SUBS_U8(V_LOAD(pvE + i), vGapE), V_SUBS_U8(vHUp, vGapO));
+			vec_t vH = V_SUBS_U8(V_ADDS_U8(vHDiag, V_LOAD(vP + i)), vBias);
+			vH = V_MAX_U8(vH, e);
+			vH = V_MAX_U8(vH, vF);
+			vH = V_AND(vH, V_LOAD(pvMask + i));
+			V_STORE(pvE + i, e);
+			V_STORE(pvH + i, vH);
+			vMaxColumn = V_MAX_U8(vMaxColumn, vH);
+			vF = V_MAX_U8(V_SUBS_U8(vF, vGapE), V_SUBS_U8(vH, vGapO));
+			vHDiag = vHUp;
+		}
+
+		vMax = V_MAX_U8(vMaxScore, vMaxColumn);
+		if (UNLIKELY(! V_ALL_EQ_U8(vMax, vMaxScore))) {
+			vMaxScore = vMax;
+			V_STORE(&vColumn, vMaxColumn);
+			for (k = 0; k < num; ++k) {
+				if (column[k] > ends[k].score) {
+					ends[k].score = column[k];
+					ends[k].ref = j;
+					for (i = 0; ((uint8_t*)(pvH + i))[k] != column[k]; ++i);
+					ends[k].read = i;
+				}
+			}
+		}
+	}
+	for (k = 0; k < num; ++k) if (ends[k].score + bias >= 255) ends[k].score = 255;
+
+	_mm_free(pvE);
+	_mm_free(pvH);
+	_mm_free(vProfile);
+}
+
+static void SSW_KERNEL(inter_word) (const int8_t** reads,
+							const int32_t* readLens,
+							int32_t num,	/* number of reads, at most LANES16 */
+							const int8_t* ref,
+							int32_t refLen,
+							const int8_t* mat,
+							int32_t n,
+							const uint8_t weight_gapO, /* will be used as - */
+							const uint8_t weight_gapE, /* will be used as - */
+							alignment_end* ends) {
+
+	int32_t maxLen = 0, i, j, k, nt;
+	for (k = 0; k < num; ++k) if (readLens[k] > maxLen) maxLen = readLens[k];
+
+	vec_t* vProfile = SSW_KERNEL(valloc)((n + 1) * maxLen);
+	vec_t* pvMask = vProfile + n * maxLen;
+	vec_t* pvH = SSW_KERNEL(valloc)(maxLen);
+	vec_t* pvE = SSW_KERNEL(valloc)(maxLen);
+	vec_t vColumn;
+	uint16_t* column = (uint16_t*)&vColumn;
+
+	for (nt = 0; nt < n; ++nt) {
+		for (i = 0; i < maxLen; ++i) {
+			int16_t* t = (int16_t*)(vProfile + nt * maxLen + i);
+			for (k = 0; k < num; ++k) t[k] = i < readLens[k] ? mat[nt * n + reads[k][i]] : 0;
+		}
+	}
+	for (i = 0; i < maxLen; ++i) {
+		int16_t* t = (int16_t*)(pvMask + i);
+		for (k = 0; k < num; ++k) t[k] = i < readLens[k] ? -1 : 0;
+	}
+	for (k = 0; k < num; ++k) {
+		ends[k].score = 0;
+		ends[k].ref = -1;
+		ends[k].read = 0;
+	}
+
+	vec_t vZero = V_ZERO();
+	vec_t vGapO = V_SET1_16(weight_gapO);
+	vec_t vGapE = V_SET1_16(weight_gapE);
+	vec_t vMaxScore = vZero;
+
+	for (j = 0; LIKELY(j < refLen); ++j) {
+		const vec_t* vP = vProfile + ref[j] * maxLen;
+		vec_t vF = vZero, vHDiag = vZero, vMaxColumn = vZero, vMax;
+		for (i = 0; LIKELY(i < maxLen); ++i) {
+			vec_t vHUp = V_LOAD(pvH + i);
+			vec_t e = V_MAX_I16(V_SUBS_U16(V_LOAD(pvE + i), vGapE), V_SUBS_U16(vHUp, vGapO));
+			vec_t vH = V_MAX_I16(V_ADDS_I16(vHDiag, V_LOAD(vP + i)), vZero);
+			vH = V_MAX_I16(vH, e);
+			vH = V_MAX_I16(vH, vF);
+			vH = V_AND(vH, V_LOAD(pvMask + i));
+			V_STORE(pvE + i, e);
+			V_STORE(pvH + i, vH);
+			vMaxColumn = V_MAX_I16(vMaxColumn, vH);
+			vF = V_MAX_I16(V_SUBS_U16(vF, vGapE), V_SUBS_U16(vH, vGapO));
+			vHDiag = vHUp;
+		}
+
+		vMax = V_MAX_I16(vMaxScore, vMaxColumn);
+		if (UNLIKELY(! V_ALL_EQ_I16(vMax, vMaxScore))) {
+			vMaxScore = vMax;
+			V_STORE(&vColumn, vMaxColumn);
+			for (k = 0; k < num; ++k) {
+				if (column[k] > ends[k].score) {
+					ends[k].score = column[k];
+					ends[k].ref = j;
+					for (i = 0; ((uint16_t*)(pvH + i))[k] != column[k]; ++i);
+					ends[k].read = i;
+				}
+			}
+		}
+	}
+
+	_mm_free(pvE);
+	_mm_free(pvH);
+	_mm_free(vProfile);
+}
+
+/* Kernels for alignments anchored to the ends of the read or the reference
+   (the SSW_ANCHOR_* flags of ssw.h).  Scores are signed words and lose the
+   zero floor once a start is anchored: the column before the reference
+   holds the cost of inserting a read prefix if the read start is anchored,
+   and the row before the read the cost of deleting a reference prefix if
+   the reference start is anchored.  The score is taken from the last read
+   position or the last column when those ends are anchored.  Padding
+   positions score ANCHOR_NEG so they never win, and E is updated in the
+   lazy F loop as well, so the recurrence is plain Gotoh. */
+#define ANCHOR_NEG (-0x4000)
+
+static void* SSW_KERNEL(qP_anchor) (const int8_t* read_num,
+				  const int8_t* mat,
+				  const int32_t readLen,
+				  const int32_t n) {
+
+	int32_t segLen = (readLen + LANES16 - 1) / LANES16;
+	vec_t* vProfile = SSW_KERNEL(valloc)(n * segLen);
+	int16_t* t = (int16_t*)vProfile;
+	int32_t nt, i, j, segNum;
+
+	for (nt = 0; LIKELY(nt < n); nt ++) {
+		for (i = 0; i < segLen; i ++) {
+			j = i;
+			for (segNum = 0; LIKELY(segNum < LANES16) ; segNum ++) {
+				*t++ = j >= readLen ? ANCHOR_NEG : mat[nt * n + read_num[j]];
+				j += segLen;
+			}
+		}
+	}
+	return vProfile;
+}
+
+static inline int16_t SSW_KERNEL(sat16) (int32_t score) {
+	return score < -0x8000 ? -0x8000 : score;
+}
+
+/* cost of a gap of length bases, saturated */
+static inline int16_t SSW_KERNEL(gap_cost) (int32_t weight_gapO, int32_t weight_gapE, int32_t length) {
+	return SSW_KERNEL(sat16)(-(weight_gapO + (int64_t)(length - 1) * weight_gapE));
+}
+
+/* Return the best score allowed by the anchors, INT32_MIN for an empty
+   reference, stopping at the first column that reaches terminate. */
+static int32_t SSW_KERNEL(sw_anchor) (const int8_t* ref,
+							 int8_t ref_dir,	// 0: forward ref; 1: reverse ref
+							 int32_t refLen,
+							 int32_t readLen,
+							 const uint8_t weight_gapO, /* will be used as - */
+							 const uint8_t weight_gapE, /* will be used as - */
+							 const void* profile,
+							 int32_t anchor,
+							 int32_t terminate,
+							 int32_t* end_ref,
+							 int32_t* end_read) {
+
+	int32_t best = INT32_MIN;
+	int32_t segLen = (readLen + LANES16 - 1) / LANES16;
+	int32_t last = (readLen - 1) % segLen * LANES16 + (readLen - 1) / segLen;	/* last read position in a column */
+	int32_t floor = !(anchor & (SSW_ANCHOR_READ_START | SSW_ANCHOR_REF_START));
+	const vec_t* vProfile = (const vec_t*)profile;
+
+	vec_t* pvHStore = SSW_KERNEL(valloc)(segLen);
+	vec_t* pvHLoad = SSW_KERNEL(valloc)(segLen);
+	vec_t* pvE = SSW_KERNEL(valloc)(segLen);
+	/* lane 0 of the row before the read: H shifted in diagonally, the
+	   first F, and the -inf replacing the lane shifted out of F */
+	vec_t* pvTop = SSW_KERNEL(valloc)(3);
+	int16_t* top = (int16_t*)pvTop;
+
+	int32_t j, k, c;
+	vec_t vZero = V_ZERO();
+	vec_t vGapO = V_SET1_16(weight_gapO);
+	vec_t vGapE = V_SET1_16(weight_gapE);
+	vec_t vFNeg;
+
+	for (k = 0; k < LANES16; ++k) {
+		top[k] = 0;
+		top[LANES16 + k] = ANCHOR_NEG;
+		top[2 * LANES16 + k] = k == 0 ? ANCHOR_NEG : 0;
+	}
+	vFNeg = V_LOAD(pvTop + 2);
+
+	/* the column before the reference */
+	for (j = 0; j < segLen; ++j) {
+		int16_t* h = (int16_t*)(pvHStore + j), *e = (int16_t*)(pvE + j);
+		for (k = 0; k < LANES16; ++k) {
+			int32_t pos = j + k * segLen;
+			h[k] = pos >= readLen ? ANCHOR_NEG :
+				   anchor & SSW_ANCHOR_READ_START ? SSW_KERNEL(gap_cost)(weight_gapO, weight_gapE, pos + 1) : 0;
+			e[k] = SSW_KERNEL(sat16)(h[k] - weight_gapO);
+		}
+	}
+
+	for (c = 0; LIKELY(c < refLen); ++c) {
+		int32_t i = ref_dir ? refLen - 1 - c : c, score = INT32_MIN;
+		vec_t e, vF, vH, vMaxColumn = V_SET1_16(ANCHOR_NEG);
+		const vec_t* vP = vProfile + ref[i] * segLen;
+		vec_t* pv = pvHLoad;
+
+		if (anchor & SSW_ANCHOR_REF_START) {
+			top[0] = c == 0 ? 0 : SSW_KERNEL(gap_cost)(weight_gapO, weight_gapE, c);
+			top[LANES16] = SSW_KERNEL(sat16)(SSW_KERNEL(gap_cost)(weight_gapO, weight_gapE, c + 1) - weight_gapO);
+		} else {
+			top[0] = 0;
+			top[LANES16] = -weight_gapO;
+		}
+		vH = V_ADDS_I16(V_SHL16(pvHStore[segLen - 1]), V_LOAD(pvTop));
+		vF = V_LOAD(pvTop + 1);
+		pvHLoad = pvHStore;
+		pvHStore = pv;
+
+		for (j = 0; LIKELY(j < segLen); j ++) {
+			vH = V_ADDS_I16(vH, V_LOAD(vP + j));
+			e = V_LOAD(pvE + j);
+			vH = V_MAX_I16(vH, e);
+			vH = V_MAX_I16(vH, vF);
+			if (floor) vH = V_MAX_I16(vH, vZero);
+			vMaxColumn = V_MAX_I16(vMaxColumn, vH);
+			V_STORE(pvHStore + j, vH);
+
+			vH = V_SUBS_I16(vH, vGapO);
+			e = V_MAX_I16(V_SUBS_I16(e, vGapE), vH);
+			V_STORE(pvE + j, e);
+			vF = V_MAX_I16(V_SUBS_I16(vF, vGapE), vH);
+
+			vH = V_LOAD(pvHLoad + j);
+		}
+
+		/* Lazy_F loop */
+		for (k = 0; LIKELY(k < LANES16); ++k) {
+			vF = V_ADDS_I16(V_SHL16(vF), vFNeg);
+			for (j = 0; LIKELY(j < segLen); ++j) {
+				/* compare with the H before F raised it, so the F chain
+				   is followed even when extending costs as much as opening */
+				vH = V_LOAD(pvHStore + j);
+				e = V_SUBS_I16(vH, vGapO);
+				vH = V_MAX_I16(vH, vF);
+				vMaxColumn = V_MAX_I16(vMaxColumn, vH);
+				V_STORE(pvHStore + j, vH);
+				V_STORE(pvE + j, V_MAX_I16(V_LOAD(pvE + j), V_SUBS_I16(vH, vGapO)));
+				vF = V_SUBS_I16(vF, vGapE);
+				if (UNLIKELY(! V_ANY_GT_I16(vF, e))) goto end;
+			}
+		}
+
+end:
+		if (!(anchor & SSW_ANCHOR_REF_END) || c == refLen - 1) {
+			if (anchor & SSW_ANCHOR_READ_END) score = ((int16_t*)pvHStore)[last];
+			else score = (int16_t)V_HMAX_I16(vMaxColumn);
+		}
+		if (score > best) {
+			best = score;
+			*end_ref = i;
+			if (anchor & SSW_ANCHOR_READ_END) *end_read = readLen - 1;
+			else {
+				int16_t* t = (int16_t*)pvHStore;
+				*end_read = readLen - 1;
+				for (k = 0; k < segLen * LANES16; ++k) {
+					int32_t pos = k / LANES16 + k % LANES16 * segLen;
+					if (t[k] == score && pos < *end_read) *end_read = pos;
+				}
+			}
+			if (best >= terminate) break;
+		}
+	}
+
+	_mm_free(pvTop);
+	_mm_free(pvE);
+	_mm_free(pvHLoad);
+	_mm_free(pvHStore);
+	return best;
+}
+
+const ssw_kernels SSW_KERNELS = {
+	SSW_KERNEL_NAME,
+	VBYTES,
+	SSW_KERNEL(qP_byte),
+	SSW_KERNEL(sw_byte),
+	SSW_KERNEL(qP_word),
+	SSW_KERNEL(sw_word),
+	SSW_KERNEL(qP_anchor),
+	SSW_KERNEL(sw_anchor),
+	SSW_KERNEL(inter_byte),
+	SSW_KERNEL(inter_word)
+};
+
+#undef ANCHOR_NEG
+#undef LANES8
+#undef LANES16
+#undef PAD_MASK
+#undef MASK_COLUMN
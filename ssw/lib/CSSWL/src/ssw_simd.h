@@ -0,0 +1,163 @@
+/*
+ *  ssw_simd.h
+ *
+ *  Private interface between ssw.c and the striped kernels of ssw_kernel.h,
+ *  which are compiled once per instruction set (ssw_sse2.c, ssw_avx2.c and
+ *  ssw_avx512.c) and picked at run time.
+ *
+ */
+
+#ifndef SSW_SIMD_H
+#define SSW_SIMD_H
+
+#include <stdint.h>
+#include "ssw.h"
+
+/* The wider kernels need GCC or clang on x86 to compile the AVX code and
+   to check the CPU at run time.  Other compilers only get SSE2. */
+#if (defined(__GNUC__) || defined(__clang__)) && (defined(__x86_64__) || defined(__i386__))
+#define SSW_HAVE_AVX 1
+#else
+#define SSW_HAVE_AVX 0
+#endif
+
+typedef struct {
+	uint16_t score;
+	int32_t ref;	 //0-based position
+	int32_t read;    //alignment ending position on read, 0-based
+} alignment_end;
+
+/* A buffer of a workspace, only ever grown. */
+typedef struct {
+	void* data;
+	size_t size;
+} ssw_buffer;
+
+struct _kernels;
+
+/* Profile of the reverse of the first readLen bases of the read of prof,
+   built by kernels for the reverse pass of ssw_align_ws. */
+typedef struct {
+	const s_profile* prof;
+	const struct _kernels* kernels;
+	int32_t readLen;	/* 0: unused */
+	int8_t word;
+	ssw_buffer profile;
+} ssw_reverse;
+
+#define SSW_REVERSE_CACHE 8
+
+/* Buffers ssw_align_ws reuses from one alignment to the next. */
+struct _workspace {
+	ssw_buffer vectors;	/* H, E and best column vectors of the kernels */
+	ssw_buffer columns;	/* best score of each reference position */
+	ssw_buffer read;	/* the reversed read */
+	ssw_buffer band;	/* rows and direction matrix of banded_sw */
+	ssw_buffer cigar;
+	ssw_reverse reverse[SSW_REVERSE_CACHE];	/* reverse profiles, replaced round robin */
+	int32_t reverse_next;
+	size_t reverse_hits;
+	size_t reverse_misses;
+	s_stats* stats;	/* 0: not counting */
+	s_align result;
+	size_t size;	/* bytes held by the buffers */
+	size_t peak;	/* largest size so far */
+};
+
+/* At least size bytes of b, aligned for any kernel, or 0 if out of memory.
+   The contents are not kept when b grows. */
+void* ssw_reserve (s_workspace* ws, ssw_buffer* b, size_t size);
+
+/* One instruction set's striped query profile builders and Smith-Waterman
+   kernels.  Profiles are opaque vector arrays allocated with _mm_malloc, or
+   held by buffer b of the workspace passed in, and only valid with the kernels that
+   built them.  The sw kernels fill in the best and 2nd best ends of bests
+   and return it, or 0 if out of memory. */
+typedef struct _kernels {
+	const char* name;
+	int32_t width;	/* vector width in bytes: 16 byte or 8 word lanes per 16 */
+	void* (*qP_byte) (const int8_t* read_num,
+					  const int8_t* mat,
+					  const int32_t readLen,
+					  const int32_t n,
+					  uint8_t bias,
+					  s_workspace* ws,
+					  ssw_buffer* b);
+	alignment_end* (*sw_byte) (const int8_t* ref,
+							   int8_t ref_dir,
+							   int32_t refLen,
+							   int32_t readLen,
+							   const uint8_t weight_gapO,
+							   const uint8_t weight_gapE,
+							   const void* vProfile,
+							   uint8_t terminate,
+							   uint8_t bias,
+							   int32_t maskLen,
+							   uint8_t* column,
+							   s_workspace* ws,
+							   alignment_end* bests);
+	void* (*qP_word) (const int8_t* read_num,
+					  const int8_t* mat,
+					  const int32_t readLen,
+					  const int32_t n,
+					  s_workspace* ws,
+					  ssw_buffer* b);
+	alignment_end* (*sw_word) (const int8_t* ref,
+							   int8_t ref_dir,
+							   int32_t refLen,
+							   int32_t readLen,
+							   const uint8_t weight_gapO,
+							   const uint8_t weight_gapE,
+							   const void* vProfile,
+							   uint16_t terminate,
+							   int32_t maskLen,
+							   uint16_t* column,
+							   s_workspace* ws,
+							   alignment_end* bests);
+	/* signed word kernels of ssw_align_anchor */
+	void* (*qP_anchor) (const int8_t* read_num,
+						const int8_t* mat,
+						const int32_t readLen,
+						const int32_t n);
+	int32_t (*sw_anchor) (const int8_t* ref,
+						  int8_t ref_dir,
+						  int32_t refLen,
+						  int32_t readLen,
+						  const uint8_t weight_gapO,
+						  const uint8_t weight_gapE,
+						  const void* vProfile,
+						  int32_t anchor,
+						  int32_t terminate,
+						  int32_t* end_ref,
+						  int32_t* end_read);
+	/* inter-sequence kernels of ssw_score_batch, one read per lane */
+	void (*inter_byte) (const int8_t** reads,
+						const int32_t* readLens,
+						int32_t num,
+						const int8_t* ref,
+						int32_t refLen,
+						const int8_t* mat,
+						int32_t n,
+						const uint8_t weight_gapO,
+						const uint8_t weight_gapE,
+						uint8_t bias,
+						alignment_end* ends);
+	void (*inter_word) (const int8_t** reads,
+						const int32_t* readLens,
+						int32_t num,
+						const int8_t* ref,
+						int32_t refLen,
+						const int8_t* mat,
+						int32_t n,
+						const uint8_t weight_gapO,
+						const uint8_t weight_gapE,
+						alignment_end* ends);
+} ssw_kernels;
+
+extern const ssw_kernels ssw_kernels_sse2;
+#if SSW_HAVE_AVX
+extern const ssw_kernels ssw_kernels_avx2;
+extern const ssw_kernels ssw_kernels_avx512;
+#endif
+
+#endif	// SSW_SIMD_H
@@ -0,0 +1,67 @@
+/*
+ *  ssw_sse2.c
+ *
+ *  SSE2 instantiation of the striped kernels: 16 byte or 8 word lanes.
+ *
+ */
+
+#include <emmintrin.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include "ssw_simd.h"
+
+#ifdef __GNUC__
+#define LIKELY(x) __builtin_expect((x),1)
+#define UNLIKELY(x) __builtin_expect((x),0)
+#else
+#define LIKELY(x) (x)
+#define UNLIKELY(x) (x)
+#endif
+
+typedef __m128i vec_t;
+#define VBYTES 16
+#define SSW_KERNEL(f) f##_sse2
+#define SSW_KERNELS ssw_kernels_sse2
+#define SSW_KERNEL_NAME "sse2"
+
+#define V_ZERO() _mm_setzero_si128()
+#define V_SET1_8(x) _mm_set1_epi8(x)
+#define V_SET1_16(x) _mm_set1_epi16(x)
+#define V_LOAD(p) _mm_load_si128(p)
+#define V_STORE(p, v) _mm_store_si128((p), (v))
+#define V_ADDS_U8(a, b) _mm_adds_epu8((a), (b))
+#define V_SUBS_U8(a, b) _mm_subs_epu8((a), (b))
+#define V_MAX_U8(a, b) _mm_max_epu8((a), (b))
+#define V_ADDS_I16(a, b) _mm_adds_epi16((a), (b))
+#define V_SUBS_U16(a, b) _mm_subs_epu16((a), (b))
+#define V_SUBS_I16(a, b) _mm_subs_epi16((a), (b))
+#define V_MAX_I16(a, b) _mm_max_epi16((a), (b))
+#define V_AND(a, b) _mm_and_si128((a), (b))
+#define V_SHL8(v) _mm_slli_si128((v), 1)
+#define V_SHL16(v) _mm_slli_si128((v), 2)
+#define V_ALL_EQ_U8(a, b) (_mm_movemask_epi8(_mm_cmpeq_epi8((a), (b))) == 0xffff)
+#define V_ALL_EQ_I16(a, b) (_mm_movemask_epi8(_mm_cmpeq_epi16((a), (b))) == 0xffff)
+#define V_ANY_GT_I16(a, b) (_mm_movemask_epi8(_mm_cmpgt_epi16((a), (b))) != 0)
+
+// Put the largest of the 16 numbers in vm into m.
+static inline uint8_t hmax_u8_sse2(__m128i vm) {
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 8));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 4));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 2));
+	vm = _mm_max_epu8(vm, _mm_srli_si128(vm, 1));
+	return (uint8_t)_mm_extract_epi16(vm, 0);
+}
+
+// Put the largest of the 8 numbers in vm into m.
+static inline uint16_t hmax_i16_sse2(__m128i vm) {
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 8));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 4));
+	vm = _mm_max_epi16(vm, _mm_srli_si128(vm, 2));
+	return (uint16_t)_mm_extract_epi16(vm, 0);
+}
+
+#define V_HMAX_U8(v) hmax_u8_sse2(v)
+#define V_HMAX_I16(v) hmax_i16_sse2(v)
+
+#include "ssw_kernel.h"
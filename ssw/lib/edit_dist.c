@@ -0,0 +1,298 @@
+#include "edit_dist.h"
+#include <stdlib.h>
+#include <string.h>
+#include "ssw.h"
+
+#define HIGH_BIT ((uint64_t)1 << 63)
+
+/*  Bit i % 64 of word i / 64 of row c of peq is set where read[i] == c */
+typedef struct {
+    int32_t words;
+    uint64_t last_bit;      /* bit of the last read base in the last word */
+    uint64_t* peq;
+} edit_profile_t;
+
+static int profile_init(edit_profile_t* p,
+                        const int8_t* read,
+                        int32_t read_len,
+                        int32_t n) {
+    int32_t i;
+    p->words = (read_len + 63) / 64;
+    p->last_bit = (uint64_t)1 << ((read_len - 1) % 64);
+    p->peq = (uint64_t*) calloc((size_t)n * p->words + 1, sizeof(uint64_t));
+    if (!p->peq) {
+        return -1;
+    }
+    for (i = 0; i < read_len; ++i) {
+        if (read[i] >= 0 && read[i] < n) {
+            p->peq[read[i] * p->words + i / 64] |= (uint64_t)1 << (i % 64);
+        }
+    }
+    return 0;
+}
+
+/*  Advance one 64 row block of the vertical deltas pv/mv by one column
+    given the horizontal delta hin entering at its top, returning the
+    horizontal delta at out_bit (Hyyro 2003)
+*/
+static inline int advance_block(uint64_t* pv,
+                                uint64_t* mv,
+                                uint64_t eq,
+                                int hin,
+                                uint64_t out_bit) {
+    uint64_t xv = eq | *mv, xh, ph, mh;
+    int hout = 0;
+    if (hin < 0) {
+        eq |= 1;
+    }
+    xh = (((eq & *pv) + *pv) ^ *pv) | eq;
+    ph = *mv | ~(xh | *pv);
+    mh = *pv & xh;
+    if (ph & out_bit) {
+        hout = 1;
+    } else if (mh & out_bit) {
+        hout = -1;
+    }
+    ph <<= 1;
+    mh <<= 1;
+    if (hin < 0) {
+        mh |= 1;
+    } else if (hin > 0) {
+        ph |= 1;
+    }
+    *pv = mh | ~(xv | ph);
+    *mv = ph & xv;
+    return hout;
+}
+
+/*  Run the columns of ref, keeping the vertical deltas of column c in
+    store[2 * words * c:] (pv then mv) unless store is NULL.  Returns the
+    distance at the last column (EDIT_GLOBAL) or the first best column
+    (EDIT_SEARCH), whose index goes to *end
+*/
+static int32_t scan(const edit_profile_t* p,
+                    const int8_t* ref,
+                    int32_t ref_len,
+                    int32_t read_len,
+                    int32_t n,
+                    int mode,
+                    uint64_t* store,
+                    int32_t* end) {
+    int32_t words = p->words, score = read_len, best = read_len, b, c;
+    uint64_t* pv = store;
+    uint64_t* mv;
+    uint64_t* prev;
+    uint64_t* col = NULL;
+    const uint64_t* eq;
+    int h;
+
+    *end = -1;
+    if (!store) {
+        col = (uint64_t*) malloc(2 * words * sizeof(uint64_t));
+        if (!col) {
+            return -1;
+        }
+    }
+    for (c = 0; c < ref_len; ++c) {
+        pv = store ? store + (int64_t)2 * words * c : col;
+        mv = pv + words;
+        prev = store && c > 0 ? pv - 2 * words : pv;
+        if (c == 0) {
+            for (b = 0; b < words; ++b) {
+                pv[b] = ~(uint64_t)0;
+                mv[b] = 0;
+            }
+        } else if (prev != pv) {
+            memcpy(pv, prev, 2 * words * sizeof(uint64_t));
+        }
+        eq = ref[c] >= 0 && ref[c] < n ? p->peq + ref[c] * words : NULL;
+        /* the row above the read costs one per base in global mode */
+        h = mode == EDIT_GLOBAL;
+        for (b = 0; b < words; ++b) {
+            h = advance_block(&pv[b], &mv[b], eq ? eq[b] : 0, h,
+                              b == words - 1 ? p->last_bit : HIGH_BIT);
+        }
+        score += h;
+        if (mode == EDIT_GLOBAL || *end < 0 || score < best) {
+            best = score;
+            *end = c;
+        }
+    }
+    free(col);
+    return mode == EDIT_GLOBAL && ref_len > 0 ? score : best;
+}
+
+/*  Distance from the first i read bases to column c (1 based) of the
+    stored columns, or to no column for c == 0
+*/
+static int32_t cell(const uint64_t* store,
+                    int32_t words,
+                    int mode,
+                    int32_t i,
+                    int32_t c) {
+    const uint64_t* pv;
+    uint64_t mask;
+    int32_t b, score;
+
+    if (c == 0) {
+        return i;
+    }
+    pv = store + (int64_t)2 * words * (c - 1);
+    score = mode == EDIT_GLOBAL ? c : 0;
+    for (b = 0; b < i / 64; ++b) {
+        score += __builtin_popcountll(pv[b]) - __builtin_popcountll(pv[words + b]);
+    }
+    if (i % 64) {
+        mask = ((uint64_t)1 << (i % 64)) - 1;
+        score += __builtin_popcountll(pv[b] & mask) - __builtin_popcountll(pv[words + b] & mask);
+    }
+    return score;
+}
+
+/*  Trace the alignment back from the last read base and the last stored
+    column, preferring M, then I, then D.  Sets out->ref_begin relative to
+    ref and the CIGAR if cigar is set
+*/
+static int trace(const uint64_t* store,
+                 int32_t words,
+                 const int8_t* read,
+                 int32_t read_len,
+                 const int8_t* ref,
+                 int32_t ref_len,
+                 int32_t n,
+                 int mode,
+                 int cigar,
+                 edit_result_t* out) {
+    int32_t i = read_len, c = ref_len, l = 0, d, match;
+    char* ops = (char*) malloc(read_len + ref_len + 1);
+    uint32_t length = 0;
+    char op, prev_op = 0;
+
+    if (!ops) {
+        return -1;
+    }
+    while (i > 0 || (mode == EDIT_GLOBAL && c > 0)) {
+        d = cell(store, words, mode, i, c);
+        match = i > 0 && c > 0 && read[i - 1] == ref[c - 1] && read[i - 1] >= 0 && read[i - 1] < n;
+        if (i > 0 && c > 0 && cell(store, words, mode, i - 1, c - 1) + !match == d) {
+            op = 'M';
+            --i;
+            --c;
+        } else if (i > 0 && cell(store, words, mode, i - 1, c) + 1 == d) {
+            op = 'I';
+            --i;
+        } else {
+            op = 'D';
+            --c;
+        }
+        ops[l++] = op;
+    }
+    out->ref_begin = c;
+    if (cigar) {
+        /* ops were collected backwards; l is an upper bound on the runs */
+        out->cigar = (uint32_t*) malloc((l + 1) * sizeof(uint32_t));
+        if (!out->cigar) {
+            free(ops);
+            return -1;
+        }
+        out->cigar_len = 0;
+        while (l > 0) {
+            op = ops[--l];
+            if (op != prev_op && prev_op) {
+                out->cigar[out->cigar_len++] = to_cigar_int(length, prev_op);
+                length = 0;
+            }
+            prev_op = op;
+            ++length;
+        }
+        if (prev_op) {
+            out->cigar[out->cigar_len++] = to_cigar_int(length, prev_op);
+        }
+    }
+    free(ops);
+    return 0;
+}
+
+int edit_align(const int8_t* read,
+               int32_t read_len,
+               const int8_t* ref,
+               int32_t ref_len,
+               int32_t n,
+               int mode,
+               int flag,
+               edit_result_t* out) {
+    edit_profile_t p;
+    uint64_t* store = NULL;
+    int32_t start = 0, span, end, distance;
+    int status = -1;
+
+    memset(out, 0, sizeof(edit_result_t));
+    out->ref_begin = out->ref_end = -1;
+    if (read_len == 0) {
+        /* nothing to align, or a deletion of the whole reference */
+        out->distance = mode == EDIT_GLOBAL ? ref_len : 0;
+        if (mode == EDIT_GLOBAL && ref_len > 0) {
+            out->ref_end = ref_len - 1;
+            if (flag & (EDIT_FLAG_START | EDIT_FLAG_CIGAR)) {
+                out->ref_begin = 0;
+            }
+            if (flag & EDIT_FLAG_CIGAR) {
+                out->cigar = (uint32_t*) malloc(sizeof(uint32_t));
+                if (!out->cigar) {
+                    return -1;
+                }
+                out->cigar[0] = to_cigar_int(ref_len, 'D');
+                out->cigar_len = 1;
+            }
+        }
+        return 0;
+    }
+    if (profile_init(&p, read, read_len, n) != 0) {
+        return -1;
+    }
+    if (!(flag & (EDIT_FLAG_START | EDIT_FLAG_CIGAR)) ||
+        (mode == EDIT_SEARCH && ref_len > 0)) {
+        distance = scan(&p, ref, ref_len, read_len, n, mode, NULL, &end);
+        if (distance < 0) {
+            goto done;
+        }
+        out->distance = distance;
+        out->ref_end = end;
+        if (!(flag & (EDIT_FLAG_START | EDIT_FLAG_CIGAR))) {
+            status = 0;
+            goto done;
+        }
+        /* an alignment with distance d spans at most read_len + d bases */
+        span = read_len + distance;
+        start = end + 1 > span ? end + 1 - span : 0;
+        ref += start;
+        ref_len = end + 1 - start;
+    } else {
+        out->ref_end = ref_len - 1;
+    }
+    if (ref_len > 0) {
+        store = (uint64_t*) malloc((int64_t)2 * p.words * ref_len * sizeof(uint64_t));
+        if (!store) {
+            goto done;
+        }
+        out->distance = scan(&p, ref, ref_len, read_len, n, mode, store, &end);
+    } else {
+        out->distance = read_len;
+    }
+    if (trace(store, p.words, read, read_len, ref, ref_len, n, mode,
+              flag & EDIT_FLAG_CIGAR, out) != 0) {
+        goto done;
+    }
+    out->ref_begin = ref_len > 0 ? out->ref_begin + start : -1;
+    status = 0;
+
+done:
+    free(store);
+    free(p.peq);
+    if (status != 0) {
+        free(out->cigar);
+        out->cigar = NULL;
+        out->cigar_len = 0;
+    }
+    return status;
+}
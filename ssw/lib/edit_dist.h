@@ -0,0 +1,41 @@
+#ifndef EDIT_DIST_H
+#define EDIT_DIST_H
+
+#include <inttypes.h>
+
+/*  Unit cost edit distance (Levenshtein) with Myers' bit-vector algorithm,
+    in Hyyro's multi-word form for reads longer than 64 bases.
+
+    EDIT_GLOBAL aligns the whole read to the whole reference, EDIT_SEARCH
+    the whole read to any stretch of the reference (semi-global).
+*/
+#define EDIT_GLOBAL 0
+#define EDIT_SEARCH 1
+
+/* flag bits of edit_align, the same as those of ssw_align */
+#define EDIT_FLAG_CIGAR 1
+#define EDIT_FLAG_START 8
+
+typedef struct {
+    int32_t distance;
+    int32_t ref_begin;      /* -1 unless the start was asked for */
+    int32_t ref_end;        /* -1 for an empty alignment */
+    uint32_t* cigar;        /* BAM packed operations, NULL unless asked for */
+    int32_t cigar_len;
+} edit_result_t;
+
+/*  Align read to ref, both coded 0 to n - 1.  Codes of n or more (N) never
+    match, not even each other.  On a tie EDIT_SEARCH reports the first
+    reference end.  The read always spans 0 to read_len - 1.  Returns 0, or
+    -1 if out of memory.  out->cigar is released with free.
+*/
+int edit_align(const int8_t* read,
+               int32_t read_len,
+               const int8_t* ref,
+               int32_t ref_len,
+               int32_t n,
+               int mode,
+               int flag,
+               edit_result_t* out);
+
+#endif
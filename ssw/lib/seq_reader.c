@@ -0,0 +1,134 @@
+#include "seq_reader.h"
+#include <stdlib.h>
+#include <string.h>
+#include <zlib.h>
+#include "kseq.h"
+
+/* the vendored kseq.h compares its size_t and int buffer positions */
+#if defined(__GNUC__)
+#pragma GCC diagnostic push
+#pragma GCC diagnostic ignored "-Wsign-compare"
+#endif
+KSEQ_INIT(gzFile, gzread)
+#if defined(__GNUC__)
+#pragma GCC diagnostic pop
+#endif
+
+struct seq_reader {
+    gzFile fp;
+    kseq_t* seq;
+};
+
+seq_reader_t* seq_reader_open(const char* path) {
+    seq_reader_t* reader;
+    gzFile fp = gzopen(path, "r");
+    if (!fp) {
+        return NULL;
+    }
+    reader = (seq_reader_t*) malloc(sizeof(seq_reader_t));
+    if (!reader) {
+        gzclose(fp);
+        return NULL;
+    }
+    reader->fp = fp;
+    reader->seq = kseq_init(fp);
+    return reader;
+}
+
+void seq_reader_close(seq_reader_t* reader) {
+    if (reader) {
+        kseq_destroy(reader->seq);
+        gzclose(reader->fp);
+        free(reader);
+    }
+}
+
+void seq_chunk_init(seq_chunk_t* chunk) {
+    memset(chunk, 0, sizeof(seq_chunk_t));
+}
+
+void seq_chunk_destroy(seq_chunk_t* chunk) {
+    free(chunk->name_off);
+    free(chunk->seq_off);
+    free(chunk->qual_off);
+    free(chunk->names);
+    free(chunk->seqs);
+    free(chunk->quals);
+    seq_chunk_init(chunk);
+}
+
+/* Grow *buf so that it holds at least need bytes */
+static int reserve(char** buf, int64_t* m, int64_t need) {
+    int64_t new_m = *m > 0 ? *m : 256;
+    char* new_buf;
+    if (need <= *m) {
+        return 0;
+    }
+    while (new_m < need) {
+        new_m <<= 1;
+    }
+    new_buf = (char*) realloc(*buf, new_m);
+    if (!new_buf) {
+        return -1;
+    }
+    *buf = new_buf;
+    *m = new_m;
+    return 0;
+}
+
+static int append(char** buf, int64_t* m, int64_t* off, const char* s, size_t l) {
+    if (reserve(buf, m, off[0] + (int64_t) l) < 0) {
+        return -1;
+    }
+    if (l > 0) {
+        memcpy(*buf + off[0], s, l);
+    }
+    off[1] = off[0] + (int64_t) l;
+    return 0;
+}
+
+/*  Read up to max_records records, stopping early once max_bases sequence
+    bases have been collected. The chunk is overwritten.
+    Returns the number of records read, 0 at the end of the file,
+    -2 on a truncated FASTQ quality string and -3 when out of memory.
+*/
+int32_t seq_reader_read_chunk(seq_reader_t* reader,
+                              seq_chunk_t* chunk,
+                              int32_t max_records,
+                              int64_t max_bases) {
+    kseq_t* seq = reader->seq;
+    int l;
+
+    chunk->n = 0;
+    if (max_records <= 0) {
+        return 0;
+    }
+    if (chunk->m < max_records) {
+        size_t size = (max_records + 1)*sizeof(int64_t);
+        int64_t* off;
+        if (!(off = (int64_t*) realloc(chunk->name_off, size))) return -3;
+        chunk->name_off = off;
+        if (!(off = (int64_t*) realloc(chunk->seq_off, size))) return -3;
+        chunk->seq_off = off;
+        if (!(off = (int64_t*) realloc(chunk->qual_off, size))) return -3;
+        chunk->qual_off = off;
+        chunk->m = max_records;
+    }
+    chunk->name_off[0] = chunk->seq_off[0] = chunk->qual_off[0] = 0;
+    while (chunk->n < max_records && chunk->seq_off[chunk->n] < max_bases) {
+        int32_t i = chunk->n;
+        l = kseq_read(seq);
+        if (l == -1) {
+            break;
+        } else if (l < -1) {
+            return -2;
+        }
+        if (append(&chunk->names, &chunk->names_m, &chunk->name_off[i], seq->name.s, seq->name.l) < 0 ||
+            append(&chunk->seqs, &chunk->seqs_m, &chunk->seq_off[i], seq->seq.s, seq->seq.l) < 0 ||
+            append(&chunk->quals, &chunk->quals_m, &chunk->qual_off[i], seq->qual.s, seq->qual.l) < 0) {
+            return -3;
+        }
+        chunk->n++;
+    }
+    return chunk->n;
+}
@@ -0,0 +1,37 @@
+#ifndef SEQ_READER_H
+#define SEQ_READER_H
+
+#include <inttypes.h>
+
+/*  Records read from a FASTA/FASTQ file, stored back to back.
+    Record i has name names[name_off[i]:name_off[i+1]], sequence
+    seqs[seq_off[i]:seq_off[i+1]] and quality quals[qual_off[i]:qual_off[i+1]]
+    (empty for FASTA records). Strings are not NUL terminated.
+*/
+typedef struct {
+    int32_t n;
+    int32_t m;
+    int64_t* name_off;
+    int64_t* seq_off;
+    int64_t* qual_off;
+    char* names;
+    int64_t names_m;
+    char* seqs;
+    int64_t seqs_m;
+    char* quals;
+    int64_t quals_m;
+} seq_chunk_t;
+
+typedef struct seq_reader seq_reader_t;
+
+seq_reader_t* seq_reader_open(const char* path);
+void seq_reader_close(seq_reader_t* reader);
+int32_t seq_reader_read_chunk(seq_reader_t* reader,
+                              seq_chunk_t* chunk,
+                              int32_t max_records,
+                              int64_t max_bases);
+
+void seq_chunk_init(seq_chunk_t* chunk);
+void seq_chunk_destroy(seq_chunk_t* chunk);
+
+#endif
@@ -1,6 +1,7 @@
 
 #include "str_util.h"
 #include <Python.h>
+#include <math.h>
 #include <stdio.h>
 
 static const int8_t DNA_BASE_LUT[128] = {
@@ -41,106 +42,367 @@ void ssw_write_cigar(const s_align* a) {
     }
 }
 
+static const char DNA_COMPLEMENT[128] = {
+    'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',
+    'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',
+    'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',
+    'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',
+    'N', 'T', 'N', 'G',  'N', 'N', 'N', 'C',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',
+    'N', 'N', 'N', 'N',  'A', 'A', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N',
+    'N', 't', 'N', 'g',  'N', 'N', 'N', 'c',  'N', 'N', 'N', 'N',  'N', 'N', 'n', 'N',
+    'N', 'N', 'N', 'N',  'a', 'a', 'N', 'N',  'N', 'N', 'N', 'N',  'N', 'N', 'N', 'N'
+};
+
+/*  Labels of the header fields and rows ssw_render writes, by label set */
+typedef struct {
+    const char* ref_begin;
+    const char* ref_end;
+    const char* read_begin;
+    const char* read_end;
+    const char* ref_row;    /* padded to 8 characters */
+    const char* read_row;
+} render_labels_t;
+
+static const render_labels_t RENDER_LABELS[2] = {
+    {"target_begin", "target_end", "query_begin", "query_end", "Target: ", "Query:  "},
+    {"reference_start", "reference_end", "read_start", "read_end", "Refer:  ", "Read:   "}
+};
+
+/*  Position of a block of rendered columns in the CIGAR and sequences */
+typedef struct {
+    int32_t c;      /* CIGAR operation */
+    uint32_t done;  /* columns of it already rendered */
+    int32_t q;      /* reference position */
+    int32_t p;      /* read position */
+} render_pos_t;
+
+/*  Whether a aligned nothing, as for a zero score result of ssw_align.
+    ssw_render writes just its scores and ends and ssw_sam_record writes it
+    as unmapped
+*/
+static int unaligned(const s_align* a) {
+    return a->score1 == 0 || !a->cigar || a->ref_begin1 < 0 || a->read_begin1 < 0;
+}
+
+/*  Number of alignment columns of the CIGAR of a, or -1 if it has an
+    operation other than M, I, D, = and X or runs past ref_len or read_len
+*/
+static int64_t cigar_columns(const s_align* a,
+                             int32_t ref_len,
+                             int32_t read_len) {
+    int64_t columns = 0, q = a->ref_begin1, p = a->read_begin1;
+    int32_t c;
+
+    if (!a->cigar) {
+        return 0;
+    }
+    if (q < 0 || p < 0) {
+        return -1;
+    }
+    for (c = 0; c < a->cigarLen; ++c) {
+        uint32_t length = cigar_int_to_len(a->cigar[c]);
+        switch (cigar_int_to_op(a->cigar[c])) {
+            case 'M': case '=': case 'X':
+                q += length;
+                p += length;
+                break;
+            case 'I':
+                p += length;
+                break;
+            case 'D':
+                q += length;
+                break;
+            default:
+                return -1;
+        }
+        columns += length;
+    }
+    return q > ref_len || p > read_len ? -1 : columns;
+}
+
+int64_t ssw_render_size(const s_align* a,
+                        int32_t ref_len,
+                        int32_t read_len,
+                        int32_t width) {
+    int64_t columns = unaligned(a) ? 0 : cigar_columns(a, ref_len, read_len), blocks;
+
+    if (width < 1 || columns < 0) {
+        return -1;
+    }
+    blocks = (columns + width - 1) / width;
+    /* a line holds its columns, a label and two numbers of up to 11 chars */
+    return 256 + blocks * (3 * (int64_t)width + 128);
+}
+
+/*  Write the next n columns from at as the reference (row 0), match (row 1)
+    or read (row 2) line, moving at past them
+*/
+static char* render_row(const s_align* a,
+                        const char* ref_seq,
+                        const char* read_seq,
+                        int32_t read_len,
+                        int8_t reverse,
+                        int row,
+                        int32_t n,
+                        render_pos_t* at,
+                        char* out) {
+    const int8_t* table = DNA_BASE_LUT;
+    char r = 0, s = 0, letter;
+    uint32_t length;
+
+    while (n > 0) {
+        letter = cigar_int_to_op(a->cigar[at->c]);
+        length = cigar_int_to_len(a->cigar[at->c]);
+        for (; at->done < length && n > 0; ++at->done, --n) {
+            if (letter != 'I') {
+                r = ref_seq[at->q++];
+            }
+            if (letter != 'D') {
+                s = reverse ? DNA_COMPLEMENT[read_seq[read_len - 1 - at->p] & 0x7f] : read_seq[at->p];
+                ++at->p;
+            }
+            if (row == 0) {
+                *out++ = letter == 'I' ? '-' : r;
+            } else if (row == 1) {
+                *out++ = letter != 'I' && letter != 'D' &&
+                        table[r & 0x7f] == table[s & 0x7f] ? '|' : '*';
+            } else {
+                *out++ = letter == 'D' ? '-' : s;
+            }
+        }
+        if (at->done == length) {
+            ++at->c;
+            at->done = 0;
+        }
+    }
+    return out;
+}
+
+int64_t ssw_render(const s_align* a,
+                   const char* ref_seq,
+                   const char* read_seq,
+                   int32_t read_len,
+                   int8_t reverse,
+                   int32_t width,
+                   int8_t labels,
+                   char* buf) {
+    const render_labels_t* label = &RENDER_LABELS[labels == SSW_LABELS_REFERENCE];
+    char* out = buf;
+    render_pos_t at, row;
+    int64_t columns = 0;
+    int32_t c, n;
+
+    out += sprintf(out, "optimal_score: %d\tsub-optimal_score: %d\t\n", a->score1, a->score2);
+    if (a->ref_begin1 >= 0) {
+        out += sprintf(out, "%s: %d\t", label->ref_begin, a->ref_begin1);
+    }
+    out += sprintf(out, "%s: %d\t\n", label->ref_end, a->ref_end1);
+    if (a->read_begin1 >= 0) {
+        out += sprintf(out, "%s: %d\t", label->read_begin, a->read_begin1);
+    }
+    out += sprintf(out, "%s: %d\n\n", label->read_end, a->read_end1);
+    if (!unaligned(a)) {
+        for (c = 0; c < a->cigarLen; ++c) {
+            columns += cigar_int_to_len(a->cigar[c]);
+        }
+        at.c = 0;
+        at.done = 0;
+        at.q = a->ref_begin1;
+        at.p = a->read_begin1;
+        while (columns > 0) {
+            n = columns < width ? (int32_t) columns : width;
+            columns -= n;
+            row = at;
+            out += sprintf(out, "%s%8d    ", label->ref_row, row.q);
+            out = render_row(a, ref_seq, read_seq, read_len, reverse, 0, n, &row, out);
+            out += sprintf(out, "    %d\n                    ", row.q - 1);
+            row = at;
+            out = render_row(a, ref_seq, read_seq, read_len, reverse, 1, n, &row, out);
+            out += sprintf(out, "\n%s%8d    ", label->read_row, at.p);
+            out = render_row(a, ref_seq, read_seq, read_len, reverse, 2, n, &at, out);
+            out += sprintf(out, "    %d\n\n", at.p - 1);
+        }
+    }
+    return out - buf;
+}
+
 //  Print the BLAST like output.
 void ssw_writer(const s_align* a,
       const char* ref_seq,
       const char* read_seq) {
 
+    int64_t size = ssw_render_size(a, INT32_MAX, INT32_MAX, 60);
+    char* buf = size < 0 ? NULL : (char*) malloc(size);
+    if (buf) {
+        fwrite(buf, 1, ssw_render(a, ref_seq, read_seq, 0, 0, 60, SSW_LABELS_TARGET, buf), stdout);
+        free(buf);
+    }
+}
+
+int64_t ssw_sam_size(const s_align* a,
+                     int32_t ref_len,
+                     int32_t read_len,
+                     int32_t qname_len,
+                     int32_t rname_len) {
+    int64_t columns = unaligned(a) ? 0 : cigar_columns(a, ref_len, read_len);
+
+    if (columns < 0) {
+        return -1;
+    }
+    /* a CIGAR run per column at most, plus the soft clips */
+    return 256 + (int64_t)qname_len + rname_len + 2 * (int64_t)read_len + 12 * (columns + 2);
+}
+
+static char* put_int(char* out, int64_t value) {
+    char digits[24];
+    int n = 0;
+    if (value < 0) {
+        *out++ = '-';
+        value = -value;
+    }
+    do {
+        digits[n++] = '0' + value % 10;
+        value /= 10;
+    } while (value > 0);
+    while (n > 0) {
+        *out++ = digits[--n];
+    }
+    return out;
+}
+
+/*  Add length columns of op to the pending run of *run_op, writing it out
+    first if op differs
+*/
+static char* put_run(char* out, char* run_op, uint32_t* run_len, char op, uint32_t length) {
+    if (op != *run_op) {
+        if (*run_len > 0) {
+            out = put_int(out, *run_len);
+            *out++ = *run_op;
+        }
+        *run_op = op;
+        *run_len = 0;
+    }
+    *run_len += length;
+    return out;
+}
+
+static char* put_str(char* out, const char* s, int32_t length) {
+    memcpy(out, s, length);
+    return out + length;
+}
+
+#define put_literal(out, s) put_str(out, s, sizeof(s) - 1)
+
+/*  SEQ and QUAL, tab separated, reversed for the reverse strand */
+static char* put_seq_qual(char* out,
+                          const char* read_seq,
+                          const char* qual,
+                          int32_t read_len,
+                          int8_t reverse) {
+    int32_t i;
+    if (reverse) {
+        for (i = read_len - 1; i >= 0; --i) {
+            *out++ = DNA_COMPLEMENT[read_seq[i] & 0x7f];
+        }
+    } else {
+        out = put_str(out, read_seq, read_len);
+    }
+    *out++ = '\t';
+    if (!qual) {
+        *out++ = '*';
+    } else if (reverse) {
+        for (i = read_len - 1; i >= 0; --i) {
+            *out++ = qual[i];
+        }
+    } else {
+        out = put_str(out, qual, read_len);
+    }
+    return out;
+}
+
+int64_t ssw_sam_record(const s_align* a,
+                       const char* qname,
+                       int32_t qname_len,
+                       const char* rname,
+                       int32_t rname_len,
+                       const char* ref_seq,
+                       int8_t ref_encoded,
+                       int64_t ref_offset,
+                       const char* read_seq,
+                       const char* qual,
+                       int32_t read_len,
+                       int8_t reverse,
+                       char* buf) {
     const int8_t* table = DNA_BASE_LUT;
-    fprintf(stdout, "optimal_score: %d\tsub-optimal_score: %d\t\n", a->score1, a->score2);
-    if (a->ref_begin1 >= 0) {
-        fprintf(stdout, "target_begin: %d\t", a->ref_begin1);
+    char* out = put_str(buf, qname, qname_len);
+    int32_t c, q = a->ref_begin1, p = a->read_begin1, nm = 0, x, y;
+    uint32_t i, length, run_len = 0, mapq = 255;
+    char op, run_op = 0;
+    double ratio;
+
+    if (unaligned(a)) {
+        out = put_literal(out, "\t4\t*\t0\t0\t*\t*\t0\t0\t");
+        out = put_seq_qual(out, read_seq, qual, read_len, 0);
+        *out++ = '\n';
+        return out - buf;
     }
-    fprintf(stdout, "target_end: %d\t\n", a->ref_end1);
-    if (a->read_begin1 >= 0) {
-        fprintf(stdout, "query_begin: %d\t", a->read_begin1);
+    /* the MAPQ of the ssw_test program */
+    ratio = 1 - (double)abs(a->score1 - a->score2) / (double)a->score1;
+    if (ratio > 0) {
+        mapq = (uint32_t)(-4.343 * log(ratio));
+        mapq = (uint32_t)(mapq + 4.99);
     }
-    fprintf(stdout, "query_end: %d\n\n", a->read_end1);
-    if (a->cigar) {
-        int32_t c = 0, left = 0, e = 0, qb = a->ref_begin1, pb = a->read_begin1;
-        uint32_t i;
-        while (e < a->cigarLen || left > 0) {
-            int32_t count = 0;
-            int32_t q = qb;
-            int32_t p = pb;
-            fprintf(stdout, "Target: %8d    ", q);
-            for (c = e; c < a->cigarLen; ++c) {
-                char letter = cigar_int_to_op(a->cigar[c]);
-                uint32_t length = cigar_int_to_len(a->cigar[c]);
-                uint32_t l = (count == 0 && left > 0) ? left: length;
-                for (i = 0; i < l; ++i) {
-                  if (letter == 'I') {
-                      fprintf(stdout, "-");
-                  } else {
-                      fprintf(stdout, "%c", *(ref_seq + q));
-                      ++q;
-                  }
-                  ++count;
-                  if (count == 60) {
-                      goto step2;
-                  }
-                }
-            }
-step2:
-            fprintf(stdout, "    %d\n                    ", q-1);
-            q = qb;
-            count = 0;
-            for (c = e; c < a->cigarLen; ++c) {
-                char letter = cigar_int_to_op(a->cigar[c]);
-                uint32_t length = cigar_int_to_len(a->cigar[c]);
-                uint32_t l = (count == 0 && left > 0) ? left: length;
-                for (i = 0; i < l; ++i) {
-                    if (letter == 'M') {
-                        if (table[(int)*(ref_seq + q)] == table[(int)*(read_seq + p)]) {
-                            fprintf(stdout, "|");
-                        } else {
-                            fprintf(stdout, "*");
-                        }
-                        ++q;
-                        ++p;
-                    } else {
-                      fprintf(stdout, "*");
-                      if (letter == 'I') { 
-                          ++p;
-                      } else {
-                          ++q;
-                      }
-                    }
-                    ++count;
-                    if (count == 60) {
-                        qb = q;
-                        goto step3;
-                    }
-                }
+    mapq = mapq < 254 ? mapq : 254;
+    out = reverse ? put_literal(out, "\t16\t") : put_literal(out, "\t0\t");
+    out = put_str(out, rname, rname_len);
+    *out++ = '\t';
+    out = put_int(out, ref_offset + a->ref_begin1 + 1);
+    *out++ = '\t';
+    out = put_int(out, mapq);
+    *out++ = '\t';
+    if (a->read_begin1 > 0) {
+        out = put_run(out, &run_op, &run_len, 'S', a->read_begin1);
+    }
+    for (c = 0; c < a->cigarLen; ++c) {
+        op = cigar_int_to_op(a->cigar[c]);
+        length = cigar_int_to_len(a->cigar[c]);
+        if (op == 'I' || op == 'D') {
+            out = put_run(out, &run_op, &run_len, op, length);
+            if (op == 'I') {
+                p += length;
+            } else {
+                q += length;
             }
-step3:
-            p = pb;
-            fprintf(stdout, "\nQuery:  %8d    ", p);
-            count = 0;
-            for (c = e; c < a->cigarLen; ++c) {
-                char letter = cigar_int_to_op(a->cigar[c]);
-                uint32_t length = cigar_int_to_len(a->cigar[c]);
-                uint32_t l = (count == 0 && left > 0) ? left: length;
-                for (i = 0; i < l; ++i) {
-                    if (letter == 'D') {
-                        fprintf(stdout, "-");
-                    } else {
-                       fprintf(stdout, "%c", *(read_seq + p));
-                       ++p;
-                    }
-                    ++ count;
-                    if (count == 60) {
-                      pb = p;
-                      left = l - i - 1;
-                      e = (left == 0) ? (c + 1) : c;
-                      goto end;
-                    }
-                }
+            nm += length;
+            continue;
+        }
+        for (i = 0; i < length; ++i, ++q, ++p) {
+            x = ref_encoded ? ref_seq[ref_offset + q] : table[ref_seq[ref_offset + q] & 0x7f];
+            if (reverse) {
+                y = table[read_seq[read_len - 1 - p] & 0x7f];
+                y = y < 4 ? 3 - y : y;
+            } else {
+                y = table[read_seq[p] & 0x7f];
             }
-            e = c;
-            left = 0;
-end:
-            fprintf(stdout, "    %d\n\n", p-1);
+            op = x == y && x < 4 ? '=' : 'X';
+            nm += op == 'X';
+            out = put_run(out, &run_op, &run_len, op, 1);
         }
     }
-}
\ No newline at end of file
+    if (read_len - 1 - a->read_end1 > 0) {
+        out = put_run(out, &run_op, &run_len, 'S', read_len - 1 - a->read_end1);
+    }
+    out = put_run(out, &run_op, &run_len, 0, 0);
+    out = put_literal(out, "\t*\t0\t0\t");
+    out = put_seq_qual(out, read_seq, qual, read_len, reverse);
+    out = put_literal(out, "\tAS:i:");
+    out = put_int(out, a->score1);
+    out = put_literal(out, "\tNM:i:");
+    out = put_int(out, nm);
+    if (a->score2 > 0) {
+        out = put_literal(out, "\tZS:i:");
+        out = put_int(out, a->score2);
+    }
+    *out++ = '\n';
+    return out - buf;
+}
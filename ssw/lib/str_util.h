@@ -3,4 +3,66 @@
 
 void dnaToInt8(const char* c_str, int8_t* arr, uint32_t len);
 void ssw_write_cigar(const s_align* a);
-void ssw_writer(const s_align* a, const char* ref_seq, const char* read_seq);
\ No newline at end of file
+void ssw_writer(const s_align* a, const char* ref_seq, const char* read_seq);
+
+/*  Bytes ssw_render needs for a in blocks of width columns, or -1 if its
+    CIGAR has an operation other than M, I, D, = and X or runs past the
+    ref_len bases of ref_seq or the read_len bases of read_seq
+*/
+int64_t ssw_render_size(const s_align* a,
+                        int32_t ref_len,
+                        int32_t read_len,
+                        int32_t width);
+
+/*  Label sets of ssw_render: the target and query of ssw_writer, or the
+    reference and read of the former Python printer
+*/
+#define SSW_LABELS_TARGET       0
+#define SSW_LABELS_REFERENCE    1
+
+/*  Write the BLAST like output of ssw_writer for a to buf, which must hold
+    ssw_render_size bytes, in blocks of width columns, with the labels of
+    the labels set.  If reverse is set the read is the reverse complement
+    of the read_len bases of read_seq.
+    An a that aligned nothing, with no CIGAR, a zero score or a negative
+    begin, gets just its scores and ends.  Returns the number of bytes
+    written, with no terminating NUL
+*/
+int64_t ssw_render(const s_align* a,
+                   const char* ref_seq,
+                   const char* read_seq,
+                   int32_t read_len,
+                   int8_t reverse,
+                   int32_t width,
+                   int8_t labels,
+                   char* buf);
+
+/*  Bytes ssw_sam_record needs, or -1 as for ssw_render_size */
+int64_t ssw_sam_size(const s_align* a,
+                     int32_t ref_len,
+                     int32_t read_len,
+                     int32_t qname_len,
+                     int32_t rname_len);
+
+/*  Write the SAM record of a to buf, which must hold ssw_sam_size bytes.
+    Positions of a are relative to ref_offset in ref_seq, which holds
+    0-4 codes if ref_encoded is set.  M operations become = and X, with N
+    always a mismatch, and the unaligned ends of the read soft clips.  If
+    reverse is set a is an alignment of the reverse complement of read_seq
+    and SEQ and QUAL are reversed to match.  qual is 0 for no qualities.
+    a is unmapped if it has no CIGAR or score.  Returns the number of bytes
+    written, with no terminating NUL
+*/
+int64_t ssw_sam_record(const s_align* a,
+                       const char* qname,
+                       int32_t qname_len,
+                       const char* rname,
+                       int32_t rname_len,
+                       const char* ref_seq,
+                       int8_t ref_encoded,
+                       int64_t ref_offset,
+                       const char* read_seq,
+                       const char* qual,
+                       int32_t read_len,
+                       int8_t reverse,
+                       char* buf);
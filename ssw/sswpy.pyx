@@ -5,23 +5,79 @@ from typing import (
     Union
 )
 
-from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
 from cython.operator cimport postincrement as inc
-from libc.stdint cimport int32_t, uint32_t, uint16_t, int8_t, uint8_t
+from libc.stdint cimport int32_t, uint32_t, uint16_t, int8_t, uint8_t, int64_t, uint64_t
+from libc.stddef cimport size_t
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy, memset
 
+import io
+import mmap
+import os
+import pickle
+import re
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+cimport cython
 cimport c_util
 
+_CIGAR_RE = re.compile(r'(\d+)([MIDNSHP=X])')
+
 """
 What is a CIGAR?
 http://genome.sph.umich.edu/wiki/SAM#What_is_a_CIGAR.3F
 """
 
-cdef extern from "str_util.h":
+cdef extern from "str_util.h" nogil:
     void dnaToInt8(const char*, int8_t*, int32_t)
     void ssw_write_cigar(const s_align*)
     void ssw_writer(const s_align*, const char*, const char*)
+    int64_t ssw_render_size(const s_align*, int32_t, int32_t, int32_t)
+    int64_t ssw_render(const s_align*, const char*, const char*, int32_t, int8_t, int32_t, int8_t, char*)
+    int8_t SSW_LABELS_TARGET
+    int8_t SSW_LABELS_REFERENCE
+    int64_t ssw_sam_size(const s_align*, int32_t, int32_t, int32_t, int32_t)
+    int64_t ssw_sam_record(const s_align*, const char*, int32_t, const char*, int32_t,
+                           const char*, int8_t, int64_t, const char*, const char*,
+                           int32_t, int8_t, char*)
+
+cdef extern from "seq_reader.h" nogil:
+    ctypedef struct seq_chunk_t:
+        int32_t n
+        int64_t* name_off
+        int64_t* seq_off
+        int64_t* qual_off
+        char* names
+        char* seqs
+        char* quals
+
+    ctypedef struct seq_reader_t:
+        pass
+
+    seq_reader_t* seq_reader_open(const char*)
+    void seq_reader_close(seq_reader_t*)
+    int32_t seq_reader_read_chunk(seq_reader_t*, seq_chunk_t*, int32_t, int64_t)
+    void seq_chunk_init(seq_chunk_t*)
+    void seq_chunk_destroy(seq_chunk_t*)
+
+cdef extern from "edit_dist.h" nogil:
+    ctypedef struct edit_result_t:
+        int32_t distance
+        int32_t ref_begin
+        int32_t ref_end
+        uint32_t* cigar
+        int32_t cigar_len
+
+    int edit_align(const int8_t*, int32_t, const int8_t*, int32_t, int32_t, int, int, edit_result_t*)
+    int EDIT_GLOBAL
+    int EDIT_SEARCH
 
-cdef extern from "ssw.h":
+cdef extern from "ssw.h" nogil:
     # leave out a few members
     ctypedef struct s_profile:
         const int8_t* read
@@ -45,84 +101,1500 @@ cdef extern from "ssw.h":
     void init_destroy (s_profile*)
     s_align* ssw_align (const s_profile*, const int8_t*, int32_t, const uint8_t, const uint8_t, const uint8_t, const uint16_t, const int32_t, const int32_t)
     void align_destroy (s_align*)
+    ctypedef struct s_workspace:
+        pass
+    enum:
+        SSW_PHASE_FORWARD
+        SSW_PHASE_REVERSE
+        SSW_PHASE_CIGAR
+        SSW_PHASES
+    ctypedef struct s_stats:
+        uint64_t calls[SSW_PHASES]
+        uint64_t nanos[SSW_PHASES]
+        uint64_t cells[SSW_PHASES]
+        uint64_t saturations
+        uint64_t reverse_profiles
+        uint64_t band_widenings
+        uint64_t band_max
+        uint64_t buffer_peak
+    void ssw_workspace_set_stats(s_workspace*, s_stats*)
+    void ssw_stats_add(s_stats*, const s_stats*)
+    uint64_t ssw_clock_ns()
+    s_workspace* ssw_workspace_init()
+    void ssw_workspace_destroy(s_workspace*)
+    void ssw_workspace_release(s_workspace*)
+    size_t ssw_workspace_size(const s_workspace*, size_t*)
+    void ssw_workspace_forget(s_workspace*)
+    size_t ssw_workspace_reverse_hits(const s_workspace*, size_t*)
+    const s_align* ssw_align_ws(const s_profile*, const int8_t*, int32_t, const uint8_t, const uint8_t, const uint8_t, const uint16_t, const int32_t, const int32_t, s_workspace*)
+    const char* ssw_simd_backend()
+    int ssw_simd_set_backend(const char*)
+    size_t ssw_profile_size(const s_profile*)
+    int32_t ssw_column_max(const s_profile*, const int8_t*, int32_t, const uint8_t, const uint8_t, uint16_t*)
+    s_align* ssw_align_anchor(const s_profile*, const int8_t*, int32_t, const uint8_t, const uint8_t, const uint8_t, const uint16_t, const int32_t, const int32_t)
+    int SSW_ANCHOR_READ_START
+    int SSW_ANCHOR_READ_END
+    int SSW_ANCHOR_REF_START
+    int SSW_ANCHOR_REF_END
+    s_align* ssw_ungapped(const int8_t*, int32_t, const int8_t*, int32_t, const int8_t*, int32_t, const int32_t)
+    int32_t ssw_score_batch(const int8_t**, const int32_t*, int32_t, const int8_t*, int32_t, const int8_t*, int32_t, const uint8_t, const uint8_t, uint16_t*, int32_t*, int32_t*)
     char cigar_int_to_op (uint32_t)
     uint32_t cigar_int_to_len(uint32_t)
     uint32_t to_cigar_int(uint32_t, char)
 
-Alignment = NamedTuple("Alignment", [
-        ('CIGAR', str),
-        ('optimal_score', int),
-        ('sub_optimal_score', int),
-        ('reference_start', int),
-        ('reference_end', int),
-        ('read_start', int),
-        ('read_end', int)
+ALIGNMENT_FIELDS = (
+    'CIGAR',
+    'optimal_score',
+    'sub_optimal_score',
+    'reference_start',
+    'reference_end',
+    'read_start',
+    'read_end'
+)
+
+@cython.freelist(64)
+cdef class Alignment:
+    """Result of :meth:`SSW.align`.  The packed BAM style CIGAR operations
+    of the C library are kept as is and only turned into a string when
+    :attr:`CIGAR` is read.  Behaves like the ``Alignment`` named tuple it
+    replaces: fields can be read by name, index or unpacking and compare
+    equal to tuples of the same values.  :attr:`strand` is ``'+'`` for the
+    read as given and ``'-'`` for its reverse complement; it is not one of
+    the tuple fields
+    """
+    cdef bytes cigar_bytes
+    cdef object cigar_str
+    cdef readonly str strand
+    cdef readonly int optimal_score
+    cdef readonly int sub_optimal_score
+    cdef readonly int reference_start
+    cdef readonly int reference_end
+    cdef readonly int read_start
+    cdef readonly int read_end
+
+    _fields = ALIGNMENT_FIELDS
+
+    def __init__(self,  CIGAR,
+                        int optimal_score,
+                        int sub_optimal_score,
+                        int reference_start,
+                        int reference_end,
+                        int read_start,
+                        int read_end,
+                        str strand = '+'):
+        if strand not in STRANDS:
+            raise ValueError("strand must be '+' or '-', not {!r}".format(strand))
+        self.cigar_bytes = None
+        self.strand = strand
+        self.cigar_str = CIGAR
+        self.optimal_score = optimal_score
+        self.sub_optimal_score = sub_optimal_score
+        self.reference_start = reference_start
+        self.reference_end = reference_end
+        self.read_start = read_start
+        self.read_end = read_end
+    # end def
+
+    @property
+    def CIGAR(self) -> str:
+        """CIGAR string, or ``None`` if it was not computed
+        """
+        if self.cigar_str is None and self.cigar_bytes is not None:
+            self.cigar_str = cigar_to_str(memoryview(self.cigar_bytes).cast('I'))
+        return self.cigar_str
+    # end def
+
+    @property
+    def cigar_array(self):
+        """Packed BAM style CIGAR operations as a uint32 ``memoryview``, or
+        ``None`` if the CIGAR was not computed
+        """
+        if self.cigar_bytes is None and self.cigar_str is not None:
+            self.cigar_bytes = np.array(
+                [to_cigar_int(int(length), ord(op))
+                    for length, op in _CIGAR_RE.findall(self.cigar_str)],
+                dtype=np.uint32).tobytes()
+        if self.cigar_bytes is None:
+            return None
+        return memoryview(self.cigar_bytes).cast('I')
+    # end def
+
+    cdef tuple astuple_c(self):
+        return (self.CIGAR,
+                self.optimal_score,
+                self.sub_optimal_score,
+                self.reference_start,
+                self.reference_end,
+                self.read_start,
+                self.read_end)
+    # end def
+
+    def _asdict(self) -> dict:
+        return dict(zip(ALIGNMENT_FIELDS, self.astuple_c()))
+    # end def
+
+    def _replace(self, **kwargs) -> Alignment:
+        values = self._asdict()
+        values['strand'] = self.strand
+        for key, value in kwargs.items():
+            if key not in values:
+                raise ValueError("Got unexpected field name: {!r}".format(key))
+            values[key] = value
+        return Alignment(**values)
+    # end def
+
+    def __len__(self) -> int:
+        return len(ALIGNMENT_FIELDS)
+
+    def __getitem__(self, idx):
+        return self.astuple_c()[idx]
+
+    def __iter__(self):
+        return iter(self.astuple_c())
+
+    def __eq__(self, other):
+        if isinstance(other, Alignment):
+            return (self.astuple_c() == (<Alignment> other).astuple_c() and
+                    self.strand == (<Alignment> other).strand)
+        if isinstance(other, tuple):
+            return self.astuple_c() == other
+        return NotImplemented
+    # end def
+
+    def __hash__(self):
+        return hash(self.astuple_c())
+
+    def __reduce__(self):
+        return (Alignment, self.astuple_c() + (self.strand,))
+
+    def __repr__(self) -> str:
+        fields = ["{}={!r}".format(field, value)
+            for field, value in zip(ALIGNMENT_FIELDS, self.astuple_c())]
+        if self.strand != '+':
+            fields.append("strand={!r}".format(self.strand))
+        return "Alignment({})".format(", ".join(fields))
+    # end def
+# end class
+
+cdef Alignment make_alignment(const s_align* result, bint reverse=False):
+    """Copy an ``s_align`` into a new :class:`Alignment`, keeping the
+    CIGAR packed.  ``reverse`` marks an alignment of the reverse complement
+    of the read
+    """
+    cdef Alignment out = Alignment.__new__(Alignment)
+    out.strand = '-' if reverse else '+'
+    if result.cigar != NULL:
+        out.cigar_bytes = (<char*> result.cigar)[:result.cigarLen*sizeof(uint32_t)]
+    out.optimal_score = result.score1
+    out.sub_optimal_score = result.score2
+    out.reference_start = result.ref_begin1
+    out.reference_end = result.ref_end1
+    out.read_start = result.read_begin1
+    out.read_end = result.read_end1
+    return out
+# end def
+
+BatchAlignment = NamedTuple("BatchAlignment", [
+        ('optimal_score', np.ndarray),
+        ('sub_optimal_score', np.ndarray),
+        ('reference_start', np.ndarray),
+        ('reference_end', np.ndarray),
+        ('read_start', np.ndarray),
+        ('read_end', np.ndarray),
+        ('cigars', np.ndarray),
+        ('cigar_offsets', np.ndarray)
+    ]
+)
+
+BatchScore = NamedTuple("BatchScore", [
+        ('optimal_score', np.ndarray),
+        ('reference_end', np.ndarray),
+        ('read_end', np.ndarray)
+    ]
+)
+
+AlignmentChunk = NamedTuple("AlignmentChunk", [
+        ('target_name', str),
+        ('query_names', list),
+        ('alignments', BatchAlignment)
     ]
 )
 
 STR_T = Union[str, bytes]
 
+cdef inline bint is_encoded_c(const uint8_t* seq, Py_ssize_t length) nogil:
+    """True if every base of ``seq`` is one of the codes 0 to 4
+    """
+    cdef Py_ssize_t i
+    for i in range(length):
+        if seq[i] > 4:
+            return False
+    return True
+# end def
+
+cdef str decode_c(const uint8_t* seq, Py_ssize_t length):
+    """Decode 0-4 codes back to a string of A, C, G, T and N
+    """
+    cdef Py_ssize_t i
+    cdef bytearray out = bytearray(length)
+    cdef char* out_cstr = out
+    cdef const char* bases = b"ACGTN"
+    for i in range(length):
+        out_cstr[i] = bases[seq[i] if seq[i] < 4 else 4]
+    return out.decode('ascii')
+# end def
+
+cdef enum:
+    # cap on the number of query bases parsed into memory at once
+    CHUNK_BASES = 1 << 24
+
+cdef enum:
+    # ssw_align flag bits
+    FLAG_CIGAR = 1
+    FLAG_SCORE_FILTER = 2
+    FLAG_DISTANCE_FILTER = 4
+    FLAG_START = 8
+
+cdef enum:
+    # score_size values of ssw_init
+    SCORE_SIZE_BYTE = 0
+    SCORE_SIZE_WORD = 1
+    SCORE_SIZE_BOTH = 2
+
+cdef struct align_opts_t:
+    uint8_t flag
+    uint16_t filters
+    int32_t filterd
+    # reads of at most byte_max_length are profiled with short_score_size,
+    # longer ones with long_score_size
+    int32_t byte_max_length
+    int8_t short_score_size
+    int8_t long_score_size
+
+ALIGN_MODES = ('score', 'start', 'cigar')
+# strands :meth:`SSW.align` can search and the strand of an Alignment
+ALIGN_STRANDS = ('forward', 'reverse', 'both')
+STRANDS = ('+', '-')
+# ends :meth:`SSW.align` can anchor the alignment to
+ALIGN_ANCHORS = ('local', 'read_global', 'ref_prefix', 'ref_suffix')
+# how much of the reference :meth:`EditAligner.align` aligns the read to
+EDIT_METHODS = ('global', 'search')
+SCORE_SIZE_POLICIES = ('both', 'byte', 'word', 'auto', 'adaptive')
+
+# k-mer lengths a SeedIndex supports, the longest one taking 1 GiB of offsets
+SEED_K_MIN = 4
+SEED_K_MAX = 14
+
+cdef int anchor_flags_c(str anchor) except -1:
+    """Translate the ``anchor`` argument of :meth:`SSW.align` into the
+    ``SSW_ANCHOR_*`` flags of ``ssw_align_anchor``, 0 for a local alignment
+
+    Raises:
+        ValueError
+    """
+    if anchor == 'local':
+        return 0
+    elif anchor == 'read_global':
+        return SSW_ANCHOR_READ_START | SSW_ANCHOR_READ_END
+    elif anchor == 'ref_prefix':
+        return SSW_ANCHOR_REF_START
+    elif anchor == 'ref_suffix':
+        return SSW_ANCHOR_REF_END
+    raise ValueError("anchor must be one of {}, not {!r}".format(ALIGN_ANCHORS, anchor))
+# end def
+
+cdef int32_t search_length_c(  Py_ssize_t ref_length,
+                                Py_ssize_t start_idx,
+                                Py_ssize_t end_idx) except -1:
+    """Validate a ``[start_idx, end_idx)`` search range of a reference of
+    ``ref_length`` bases, where an ``end_idx`` of 0 means the end
+
+    Returns:
+        the number of reference bases to search
+    """
+    cdef Py_ssize_t end_idx_final
+
+    if start_idx < 0 or end_idx < 0:
+        raise ValueError("negative indexing not supported")
+    if end_idx > ref_length or start_idx > ref_length:
+        err = "start_idx: {} or end_idx: {} can't be greater than ref_length: {}".format(
+                                            start_idx,
+                                            end_idx,
+                                            ref_length)
+        raise ValueError(err)
+    if end_idx == 0:
+        end_idx_final = ref_length
+    else:
+        end_idx_final = end_idx
+    return <int32_t> (end_idx_final - start_idx)
+# end def
+
+cdef int dna_score_matrix_c(const uint8_t match_score,
+                            const uint8_t mismatch_penalty,
+                            int8_t* matrix) noexcept nogil:
+    """
+    mismatch_penalty should be positive
+
+    The score matrix looks like
+                        A,  C,  G,  T,  N
+    score_matrix  = {   2, -2, -2, -2,  0, // A
+                       -2,  2, -2, -2,  0, // C
+                       -2, -2,  2, -2,  0, // G
+                       -2, -2, -2,  2,  0, // T
+                        0,  0,  0,  0,  0  // N
+                    }
+    """
+    cdef Py_ssize_t i, j
+    cdef Py_ssize_t idx = 0;
+    for i in range(4):
+        for j in range(4):
+            if i == j:
+                matrix[idx] =  <int8_t> match_score
+            else:
+                matrix[idx] = <int8_t> (-mismatch_penalty)
+            inc(idx)
+        matrix[idx] = 0;
+        inc(idx)
+    for i in range(5):
+        matrix[inc(idx)] = 0
+    return 0
+# end def
+
+cdef int align_opts_c(  str mode,
+                        object score_filter,
+                        object distance_filter,
+                        align_opts_t* opts) except -1:
+    """Translate the ``mode``, ``score_filter`` and ``distance_filter``
+    arguments of :meth:`SSW.align` into the ``flag``, ``filters`` and
+    ``filterd`` arguments of ``ssw_align``
+
+    Raises:
+        ValueError
+    """
+    opts.filters = 0
+    opts.filterd = 0
+    opts.byte_max_length = 0
+    opts.short_score_size = SCORE_SIZE_BOTH
+    opts.long_score_size = SCORE_SIZE_BOTH
+    if mode == 'score':
+        opts.flag = 0
+    elif mode == 'start':
+        opts.flag = FLAG_START
+    elif mode == 'cigar':
+        opts.flag = FLAG_CIGAR
+    else:
+        raise ValueError("mode must be one of {}, not {!r}".format(ALIGN_MODES, mode))
+    if score_filter is None and distance_filter is None:
+        return 0
+    if mode != 'cigar':
+        raise ValueError("score_filter and distance_filter require mode='cigar'")
+    opts.flag = 0
+    if score_filter is not None:
+        if not 0 <= score_filter <= 0xFFFF:
+            raise ValueError("score_filter out of range: {}".format(score_filter))
+        opts.flag |= FLAG_SCORE_FILTER
+        opts.filters = score_filter
+    if distance_filter is not None:
+        if not 0 <= distance_filter <= 0x7FFFFFFF:
+            raise ValueError("distance_filter out of range: {}".format(distance_filter))
+        opts.flag |= FLAG_DISTANCE_FILTER
+        opts.filterd = distance_filter
+    return 0
+# end def
+
+cdef enum:
+    # calls of SSW timed by stats_t, after the phases of s_stats
+    STATS_SET_READ = 0
+    STATS_SET_REFERENCE = 1
+    STATS_ALIGN = 2
+    STATS_ALIGN_BATCH = 3
+    STATS_CALLS = 4
+
+# names of the calls of stats_t then of the phases of s_stats
+STATS_CALL_NAMES = ('set_read', 'set_reference', 'align', 'align_batch')
+STATS_PHASE_NAMES = ('forward', 'reverse', 'cigar')
+
+cdef struct stats_t:
+    # phases of the alignments run in a workspace
+    s_stats kernels
+    uint64_t calls[STATS_CALLS]
+    uint64_t nanos[STATS_CALLS]
+    uint64_t alignments
+    # read profiles built rather than found in a ProfileCache
+    uint64_t profiles
+
+# sum of the counters of every SSW object counting, see global_stats
+cdef stats_t global_stats_c
+memset(&global_stats_c, 0, sizeof(stats_t))
+
+cdef dict stats_dict_c(const stats_t* stats):
+    """The counters of ``stats`` as :meth:`SSW.stats` reports them
+    """
+    cdef int i
+    calls = {}
+    nanos = {}
+    cells = {}
+    for i in range(STATS_CALLS):
+        calls[STATS_CALL_NAMES[i]] = stats.calls[i]
+        nanos[STATS_CALL_NAMES[i]] = stats.nanos[i]
+    for i in range(SSW_PHASES):
+        calls[STATS_PHASE_NAMES[i]] = stats.kernels.calls[i]
+        nanos[STATS_PHASE_NAMES[i]] = stats.kernels.nanos[i]
+        cells[STATS_PHASE_NAMES[i]] = stats.kernels.cells[i]
+    return {
+        'calls': calls,
+        'nanoseconds': nanos,
+        'cells': cells,
+        'alignments': stats.alignments,
+        'profiles_built': stats.profiles,
+        'saturations': stats.kernels.saturations,
+        'reverse_profiles_built': stats.kernels.reverse_profiles,
+        'band_widenings': stats.kernels.band_widenings,
+        'band_max': stats.kernels.band_max,
+        'buffer_peak': stats.kernels.buffer_peak,
+    }
+# end def
+
+def global_stats(bint reset=False) -> dict:
+    '''Counters summed over every :class:`SSW` object that counts, see
+    :meth:`SSW.enable_stats`, including those since destroyed
+
+    Args:
+        reset (bool): zero the counters after reading them. default False
+
+    Returns:
+        dictionary as :meth:`SSW.stats`
+    '''
+    out = stats_dict_c(&global_stats_c)
+    if reset:
+        memset(&global_stats_c, 0, sizeof(stats_t))
+    return out
+# end def
+
+cdef struct batch_out_t:
+    uint16_t* score1
+    uint16_t* score2
+    int32_t* ref_begin1
+    int32_t* ref_end1
+    int32_t* read_begin1
+    int32_t* read_end1
+    uint32_t** cigar
+    int32_t* cigar_len
+
+cdef Py_ssize_t align_reads_c(  const int8_t* score_matrix,
+                                const char** read_ptrs,
+                                const int32_t* read_lengths,
+                                Py_ssize_t start,
+                                Py_ssize_t stop,
+                                int8_t* read_buffer,
+                                const int8_t* ref_arr,
+                                int32_t ref_length,
+                                uint8_t gap_open,
+                                uint8_t gap_extension,
+                                bint encoded,
+                                const align_opts_t* opts,
+                                s_workspace* workspace,
+                                batch_out_t* out) nogil:
+    """Align reads ``start`` to ``stop`` against one encoded reference,
+    storing the results column wise in ``out``.  Each read is encoded into
+    ``read_buffer`` which must hold the longest read, unless ``encoded`` is
+    set in which case reads are used in place.  The alignments run in
+    ``workspace`` and their CIGAR arrays are copied to ``out.cigar`` and
+    must be released with ``free``.  Safe to run without the GIL as long as
+    each caller owns its own ``read_buffer`` and ``workspace``
+
+    Returns:
+        -1 on success, otherwise the index of the read that failed
+    """
+    cdef Py_ssize_t i
+    cdef int32_t read_length, mask_len
+    cdef int8_t score_size
+    cdef const int8_t* read_arr
+    cdef s_profile* profile
+    cdef const s_align* result
+    cdef uint32_t* cigar
+
+    for i in range(start, stop):
+        read_length = read_lengths[i]
+        if encoded:
+            read_arr = <const int8_t*> read_ptrs[i]
+            if not is_encoded_c(<const uint8_t*> read_arr, read_length):
+                return i
+        else:
+            dnaToInt8(read_ptrs[i], read_buffer, read_length)
+            read_arr = read_buffer
+        if read_length <= opts.byte_max_length:
+            score_size = opts.short_score_size
+        else:
+            score_size = opts.long_score_size
+        profile = ssw_init(read_arr, read_length, score_matrix, 5, score_size)
+        if profile == NULL:
+            return i
+        mask_len = read_length // 2
+        mask_len = 15 if mask_len < 15 else mask_len
+        result = ssw_align_ws(  profile,
+                                ref_arr,
+                                ref_length,
+                                gap_open,
+                                gap_extension,
+                                opts.flag,
+                                opts.filters,
+                                opts.filterd,
+                                mask_len,
+                                workspace)
+        init_destroy(profile)
+        # the next profile may get the same address
+        ssw_workspace_forget(workspace)
+        if result == NULL:
+            return i
+        cigar = NULL
+        if result.cigarLen > 0:
+            cigar = <uint32_t*> malloc(result.cigarLen*sizeof(uint32_t))
+            if cigar == NULL:
+                return i
+            memcpy(cigar, result.cigar, result.cigarLen*sizeof(uint32_t))
+        out.score1[i] = result.score1
+        out.score2[i] = result.score2
+        out.ref_begin1[i] = result.ref_begin1
+        out.ref_end1[i] = result.ref_end1
+        out.read_begin1[i] = result.read_begin1
+        out.read_end1[i] = result.read_end1
+        out.cigar[i] = cigar
+        out.cigar_len[i] = result.cigarLen
+    return -1
+# end def
+
+cdef class _BatchJob:
+    """Shared state of one :meth:`SSW.align_batch` call.  :meth:`run` can be
+    called from many threads at once on disjoint read ranges, each call
+    owning its own encoded read buffer, workspace and profiles
+    """
+    cdef const int8_t* score_matrix
+    cdef const char** read_ptrs
+    cdef const int32_t* read_lengths
+    cdef Py_ssize_t max_length
+    cdef const int8_t* ref_arr
+    cdef int32_t ref_length
+    cdef uint8_t gap_open
+    cdef uint8_t gap_extension
+    cdef bint encoded
+    cdef align_opts_t opts
+    cdef batch_out_t out
+    # kernel counters of every run when counting is set
+    cdef bint counting
+    cdef s_stats stats
+
+    def run(self, Py_ssize_t start, Py_ssize_t stop) -> int:
+        cdef Py_ssize_t failed
+        cdef int8_t* read_buffer = <int8_t*> malloc(self.max_length*sizeof(int8_t))
+        cdef s_workspace* workspace = ssw_workspace_init()
+        cdef s_stats stats
+        if read_buffer == NULL or workspace == NULL:
+            free(read_buffer)
+            ssw_workspace_destroy(workspace)
+            raise MemoryError('Out of Memory')
+        if self.counting:
+            memset(&stats, 0, sizeof(s_stats))
+            ssw_workspace_set_stats(workspace, &stats)
+        with nogil:
+            failed = align_reads_c( self.score_matrix,
+                                    self.read_ptrs,
+                                    self.read_lengths,
+                                    start,
+                                    stop,
+                                    read_buffer,
+                                    self.ref_arr,
+                                    self.ref_length,
+                                    self.gap_open,
+                                    self.gap_extension,
+                                    self.encoded,
+                                    &self.opts,
+                                    workspace,
+                                    &self.out)
+        free(read_buffer)
+        ssw_workspace_destroy(workspace)
+        if self.counting:
+            ssw_stats_add(&self.stats, &stats)
+        return failed
+    # end def
+# end class
+
+cdef class _ScoreJob:
+    """Shared state of one :meth:`SSW.score_batch` call, run like
+    :class:`_BatchJob` on disjoint read ranges
+    """
+    cdef const int8_t* score_matrix
+    cdef const char** read_ptrs
+    cdef const int32_t* read_lengths
+    cdef const int8_t* ref_arr
+    cdef int32_t ref_length
+    cdef uint8_t gap_open
+    cdef uint8_t gap_extension
+    cdef bint encoded
+    cdef uint16_t* score
+    cdef int32_t* ref_end
+    cdef int32_t* read_end
+
+    def run(self, Py_ssize_t start, Py_ssize_t stop) -> int:
+        cdef Py_ssize_t i, offset = 0
+        cdef int32_t status
+        cdef int8_t* read_buffer = NULL
+        cdef const int8_t** reads = <const int8_t**> malloc((stop - start)*sizeof(int8_t*))
+        if reads == NULL:
+            raise MemoryError('Out of Memory')
+        if not self.encoded:
+            for i in range(start, stop):
+                offset += self.read_lengths[i]
+            read_buffer = <int8_t*> malloc(offset*sizeof(int8_t))
+            if read_buffer == NULL:
+                free(reads)
+                raise MemoryError('Out of Memory')
+        with nogil:
+            offset = 0
+            for i in range(start, stop):
+                if self.encoded:
+                    reads[i - start] = <const int8_t*> self.read_ptrs[i]
+                else:
+                    dnaToInt8(self.read_ptrs[i], &read_buffer[offset], self.read_lengths[i])
+                    reads[i - start] = &read_buffer[offset]
+                    offset += self.read_lengths[i]
+            status = ssw_score_batch(   reads,
+                                        &self.read_lengths[start],
+                                        <int32_t> (stop - start),
+                                        self.ref_arr,
+                                        self.ref_length,
+                                        self.score_matrix,
+                                        5,
+                                        self.gap_open,
+                                        self.gap_extension,
+                                        &self.score[start],
+                                        &self.ref_end[start],
+                                        &self.read_end[start])
+        free(read_buffer)
+        free(reads)
+        return -1 if status == 0 else start
+    # end def
+# end class
+
+cdef int tile_max_c(const s_profile* profile,
+                    const int8_t* ref_arr,
+                    int64_t tile_start,
+                    int32_t tile_length,
+                    int64_t own_start,
+                    int64_t skip_start,
+                    int64_t skip_end,
+                    uint8_t gap_open,
+                    uint8_t gap_extension,
+                    uint16_t* column,
+                    int32_t* best,
+                    int64_t* best_pos) noexcept nogil:
+    """Find the best column maximum of the reference tile starting at
+    ``tile_start``, among the columns from ``own_start`` to the end of the
+    tile that are outside ``[skip_start, skip_end)``.  ``column`` must hold
+    ``tile_length`` entries.  Positions are those of ``ref_arr``
+
+    Returns:
+        0 on success, -1 if the score overflowed the profile
+    """
+    cdef int64_t i
+    if ssw_column_max(profile, &ref_arr[tile_start], tile_length,
+                        gap_open, gap_extension, column) < 0:
+        return -1
+    best[0] = 0
+    best_pos[0] = -1
+    for i in range(own_start, tile_start + tile_length):
+        if skip_start <= i < skip_end:
+            continue
+        if column[i - tile_start] > best[0]:
+            best[0] = column[i - tile_start]
+            best_pos[0] = i
+    return 0
+# end def
+
+cdef class _TileJob:
+    """Shared state of one :meth:`SSW.align_tiled` call.  Tile ``k``
+    covers ``tile_length`` reference bases from ``k*step`` and owns the
+    columns from ``k*step + overlap`` on, the first tile all of them, so
+    every column is scored once by a tile holding any alignment ending there
+    """
+    cdef const s_profile* profile
+    cdef const int8_t* ref_arr
+    cdef int64_t ref_length
+    cdef int32_t tile_length
+    cdef int64_t step
+    cdef int64_t overlap
+    cdef uint8_t gap_open
+    cdef uint8_t gap_extension
+    cdef int64_t skip_start
+    cdef int64_t skip_end
+    cdef int32_t[::1] best
+    cdef int64_t[::1] best_pos
+
+    cdef int tile_c(self, Py_ssize_t k, uint16_t* column) noexcept nogil:
+        cdef int64_t tile_start = k*self.step
+        cdef int64_t own_start = tile_start + self.overlap if k > 0 else 0
+        cdef int32_t tile_length = <int32_t> min(<int64_t> self.tile_length,
+                                                self.ref_length - tile_start)
+        return tile_max_c(  self.profile, self.ref_arr,
+                            tile_start, tile_length, own_start,
+                            self.skip_start, self.skip_end,
+                            self.gap_open, self.gap_extension, column,
+                            &self.best[k], &self.best_pos[k])
+    # end def
+
+    def run(self, Py_ssize_t start, Py_ssize_t stop) -> int:
+        cdef Py_ssize_t k
+        cdef Py_ssize_t failed = -1
+        cdef uint16_t* column = <uint16_t*> malloc(self.tile_length*sizeof(uint16_t))
+        if column == NULL:
+            raise MemoryError('Out of Memory')
+        with nogil:
+            for k in range(start, stop):
+                if self.tile_c(k, column) < 0:
+                    failed = k
+                    break
+        free(column)
+        return failed
+    # end def
+# end class
+
+cdef enum:
+    NO_KMER = 0xFFFFFFFF
+
+cdef int64_t[::1] seed_windows_c(SeedIndex index,
+                                const int8_t* read_arr,
+                                Py_ssize_t read_length,
+                                int64_t start,
+                                int64_t stop,
+                                int min_seeds,
+                                int64_t padding,
+                                Py_ssize_t max_occurrences):
+    """Chain the seeds of a read into reference windows within
+    ``[start, stop)``.  Seeds are k-mers of the read found in ``index``,
+    placed on the diagonal of reference minus read position.  Sorted
+    diagonals no more than ``padding`` apart form a chain, and each chain of
+    at least ``min_seeds`` seeds spans the read along its diagonals, padded
+    by ``padding`` on both sides.  Overlapping windows are merged
+
+    Returns:
+        ascending start and stop pairs of the windows
+    """
+    cdef int k = index.k
+    cdef uint32_t mask = (1u << (2*k)) - 1
+    cdef uint32_t code = 0
+    cdef uint32_t first, last
+    cdef Py_ssize_t i, j, n = 0, valid = 0, chain_start, num_windows = 0
+    cdef int64_t lo, hi
+    cdef int64_t[::1] diagonals
+    cdef int64_t[::1] windows
+    cdef uint32_t[::1] kmers = np.empty(read_length, dtype=np.uint32)
+
+    # code of the k-mer ending at each read position, NO_KMER if it holds an
+    # N or is too common to use
+    for i in range(read_length):
+        kmers[i] = NO_KMER
+        if read_arr[i] > 3:
+            valid = 0
+            continue
+        code = ((code << 2) | <uint32_t> read_arr[i]) & mask
+        valid += 1
+        if (valid >= k and
+            index.offsets[code + 1] - index.offsets[code] <= max_occurrences):
+            kmers[i] = code
+            n += index.offsets[code + 1] - index.offsets[code]
+    diagonals = np.empty(n, dtype=np.int64)
+    n = 0
+    for i in range(read_length):
+        code = kmers[i]
+        if code == NO_KMER:
+            continue
+        first = index.offsets[code]
+        last = index.offsets[code + 1]
+        for j in range(first, last):
+            diagonals[n] = <int64_t> index.positions[j] - (i + 1 - k)
+            n += 1
+    diagonals = np.sort(np.asarray(diagonals))
+
+    windows = np.empty(2*n, dtype=np.int64)
+    chain_start = 0
+    for i in range(n):
+        if i + 1 < n and diagonals[i + 1] - diagonals[i] <= padding:
+            continue
+        if i + 1 - chain_start >= min_seeds:
+            lo = max(diagonals[chain_start] - padding, start)
+            hi = min(diagonals[i] + read_length + padding, stop)
+            if lo < hi:
+                if num_windows > 0 and lo <= windows[2*num_windows - 1]:
+                    windows[2*num_windows - 1] = hi
+                else:
+                    windows[2*num_windows] = lo
+                    windows[2*num_windows + 1] = hi
+                    num_windows += 1
+        chain_start = i + 1
+    return windows[:2*num_windows]
+# end def
+
+def _num_threads(threads) -> int:
+    """Resolve a ``threads`` argument, where ``None`` or 0 means one thread
+    per core
+    """
+    if threads is None or threads == 0:
+        return os.cpu_count() or 1
+    if threads < 0:
+        raise ValueError("threads must be >= 0")
+    return threads
+# end def
+
+cdef Py_ssize_t run_batch_job(object job, Py_ssize_t num_items, int num_threads):
+    """Run ``job`` over ``num_items`` items, splitting the work into
+    contiguous chunks spread over ``num_threads`` threads.  Results are
+    written in place so they stay in input order
+
+    Returns:
+        -1 on success, otherwise the index of the first item that failed
+    """
+    cdef Py_ssize_t num_chunks, chunk, failed
+    if num_threads <= 1 or num_items <= 1:
+        return job.run(0, num_items)
+    num_chunks = min(num_items, 4*num_threads)
+    chunk = (num_items + num_chunks - 1) // num_chunks
+    starts = range(0, num_items, chunk)
+    stops = [min(start + chunk, num_items) for start in starts]
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        for failed in pool.map(job.run, starts, stops):
+            if failed >= 0:
+                return failed
+    return -1
+# end def
+
+cdef class _ReadPointers:
+    """C pointers to and lengths of a batch of reads, given either as a
+    sequence of reads or as one buffer of concatenated reads with
+    ``offsets``.  Holds the buffers so the pointers stay valid
+    """
+    cdef const char** ptrs
+    cdef int32_t* lengths
+    cdef Py_ssize_t num_reads
+    cdef object buffers
+
+    def __cinit__(self, reads, offsets=None):
+        cdef Py_ssize_t i, read_length, total_length = 0
+        cdef const char* buffer_cstr = NULL
+        cdef int64_t[::1] offsets_view
+
+        if offsets is None:
+            if isinstance(reads, (str, bytes)):
+                raise TypeError("reads must be a sequence of reads when offsets is None")
+            self.buffers = [c_util.obj_to_buffer(read) for read in reads]
+            self.num_reads = len(self.buffers)
+        else:
+            self.buffers = c_util.obj_to_buffer(reads)
+            buffer_cstr = c_util.buffer_to_cstr_len(self.buffers, &total_length)
+            offsets_view = np.ascontiguousarray(offsets, dtype=np.int64)
+            self.num_reads = offsets_view.shape[0] - 1
+            if self.num_reads < 0:
+                raise ValueError("offsets must have at least one entry")
+
+        self.ptrs = <const char**> PyMem_Malloc((self.num_reads + 1)*sizeof(char*))
+        self.lengths = <int32_t*> PyMem_Malloc((self.num_reads + 1)*sizeof(int32_t))
+        if self.ptrs == NULL or self.lengths == NULL:
+            raise MemoryError('Out of Memory')
+
+        for i in range(self.num_reads):
+            if offsets is None:
+                self.ptrs[i] = c_util.buffer_to_cstr_len(self.buffers[i], &read_length)
+            else:
+                if (offsets_view[i] < 0 or
+                    offsets_view[i + 1] < offsets_view[i] or
+                    offsets_view[i + 1] > total_length):
+                    raise ValueError("invalid offsets at read {}".format(i))
+                self.ptrs[i] = &buffer_cstr[offsets_view[i]]
+                read_length = offsets_view[i + 1] - offsets_view[i]
+            self.lengths[i] = <int32_t> read_length
+    # end def
+
+    def __dealloc__(self):
+        PyMem_Free(self.lengths)
+        PyMem_Free(self.ptrs)
+    # end def
+# end class
+
+cdef class ReadProfile:
+    """An encoded read together with its striped query profile.  The
+    profile owns copies of the encoded read and of the score matrix so it
+    can outlive the :class:`SSW` that built it and be shared through a
+    :class:`ProfileCache`
+    """
+    cdef s_profile* profile
+    cdef int8_t* read_arr
+    cdef int8_t score_matrix[25]
+    cdef readonly Py_ssize_t read_length
+    cdef readonly int score_size
+    cdef readonly Py_ssize_t nbytes
+
+    def __cinit__(self):
+        self.profile = NULL
+        self.read_arr = NULL
+    # end def
+
+    def __dealloc__(self):
+        if self.profile != NULL:
+            init_destroy(self.profile)
+        PyMem_Free(self.read_arr)
+    # end def
+
+    def __reduce__(self):
+        # the striped profile depends on the SIMD kernels of the machine so
+        # only the encoded read is pickled and the profile rebuilt from it
+        return (_rebuild_read_profile, (
+                (<char*> self.read_arr)[:self.read_length],
+                (<char*> self.score_matrix)[:25],
+                self.score_size))
+# end class
+
+cdef ReadProfile make_read_profile(const char* read_cstr,
+                                    Py_ssize_t read_length,
+                                    const int8_t* score_matrix,
+                                    int score_size,
+                                    bint encoded):
+    """Encode a read and build its query profile
+
+    Args:
+        read_cstr: ASCII read, or 0-4 codes when ``encoded`` is set
+        read_length: length of the read
+        score_matrix: 5x5 score matrix, copied into the profile
+        score_size: 0 for a byte profile, 1 for a word profile and 2 for
+            both
+        encoded: the read is already encoded
+
+    Raises:
+        MemoryError, ValueError
+    """
+    cdef ReadProfile prof = ReadProfile()
+    memcpy(prof.score_matrix, score_matrix, 25*sizeof(int8_t))
+    prof.read_arr = <int8_t*> PyMem_Malloc(read_length*sizeof(int8_t))
+    if prof.read_arr == NULL:
+        raise MemoryError('Out of Memory')
+    if encoded:
+        if not is_encoded_c(<const uint8_t*> read_cstr, read_length):
+            raise ValueError("encoded reads may only hold the codes 0 to 4")
+        memcpy(prof.read_arr, read_cstr, read_length)
+    else:
+        dnaToInt8(read_cstr, prof.read_arr, read_length)
+    prof.profile = ssw_init(prof.read_arr,
+                            <int32_t> read_length,
+                            prof.score_matrix,
+                            5,
+                            <int8_t> score_size)
+    if prof.profile == NULL:
+        raise MemoryError('Out of Memory')
+    prof.read_length = read_length
+    prof.score_size = score_size
+    prof.nbytes = sizeof(ReadProfile) + read_length + ssw_profile_size(prof.profile)
+    return prof
+# end def
+
+def _rebuild_read_profile(bytes read, bytes score_matrix, int score_size) -> ReadProfile:
+    """Unpickle a :class:`ReadProfile` from its encoded read
+    """
+    if len(score_matrix) != 25:
+        raise ValueError("score matrix must have 25 entries")
+    return make_read_profile(read, len(read), <const int8_t*> (<const char*> score_matrix),
+                            score_size, True)
+# end def
+
+cdef class ProfileCache:
+    """Bounded least recently used cache of :class:`ReadProfile` objects,
+    keyed by read, score matrix and score size.  One cache can be shared by
+    any number of :class:`SSW` objects so a read that is set again, such as
+    a primer or barcode, reuses its profile instead of rebuilding it
+    """
+    cdef object entries
+    cdef readonly Py_ssize_t max_bytes
+    cdef readonly Py_ssize_t nbytes
+    cdef readonly Py_ssize_t hits
+    cdef readonly Py_ssize_t misses
+    cdef readonly Py_ssize_t evictions
+
+    def __init__(self, Py_ssize_t max_bytes=64*1024*1024):
+        """
+        Args:
+            max_bytes (int): memory cap of the cached profiles.  default 64 MiB
+        """
+        if max_bytes < 0:
+            raise ValueError("max_bytes must be >= 0")
+        self.entries = OrderedDict()
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    # end def
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __reduce__(self):
+        # profiles are cheaper to rebuild than to pickle, so a copy starts
+        # empty
+        return (ProfileCache, (self.max_bytes,))
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dictionary of `hits`, `misses`, `evictions`, `entries`,
+            `nbytes` and `max_bytes`
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes
+        }
+    # end def
+
+    def clear(self):
+        """Drop every cached profile and reset the counters
+        """
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    # end def
+
+    cdef ReadProfile get_c(self,
+                        object read,
+                        const char* read_cstr,
+                        Py_ssize_t read_length,
+                        const int8_t* score_matrix,
+                        int score_size,
+                        bint encoded):
+        """Fetch the profile of ``read``, building and caching it on a miss
+        """
+        cdef ReadProfile prof
+        if not isinstance(read, (str, bytes)):
+            read = read_cstr[:read_length]
+        key = (read, encoded, (<char*> score_matrix)[:25], score_size)
+        prof = self.entries.get(key)
+        if prof is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return prof
+        self.misses += 1
+        prof = make_read_profile(read_cstr, read_length, score_matrix, score_size, encoded)
+        if prof.nbytes > self.max_bytes:
+            return prof
+        self.entries[key] = prof
+        self.nbytes += prof.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= (<ReadProfile> evicted).nbytes
+            self.evictions += 1
+        return prof
+    # end def
+# end class
+
+cdef class EncodedReference:
+    """A reference sequence already encoded as 0-4 codes for A, C, G, T
+    and N, usually a view into a memory mapped :class:`ReferenceIndex`.
+    Passing it to :meth:`SSW.setReference` aligns against the encoded bytes
+    in place with no copy or re-encoding
+    """
+    cdef const uint8_t[::1] data
+    cdef readonly str name
+
+    def __init__(self, data, str name='', bint validate=True):
+        """
+        Args:
+            data: buffer of encoded bases, for instance a memoryview slice
+                of a memory map or a NumPy uint8 array
+            name: name of the sequence
+            validate: check that every base is one of the codes 0 to 4
+
+        Raises:
+            ValueError
+        """
+        self.data = c_util.obj_to_buffer(data)
+        self.name = name
+        if validate and not is_encoded_c(&self.data[0] if self.data.shape[0] else NULL,
+                                        self.data.shape[0]):
+            raise ValueError("encoded references may only hold the codes 0 to 4")
+    # end def
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def __repr__(self) -> str:
+        return "EncodedReference(name={!r}, length={})".format(self.name, len(self))
+
+    def __reduce_ex__(self, protocol):
+        # protocol 5 lets the bases be pickled in place or out of band
+        # rather than copied to bytes first
+        data = pickle.PickleBuffer(self.data) if protocol >= 5 else bytes(self.data)
+        return (EncodedReference, (data, self.name, False))
+
+    def decode(self, Py_ssize_t start=0, stop=None) -> str:
+        """Decode ``[start, stop)`` of the sequence back to a string
+
+        Returns:
+            str of A, C, G, T and N
+        """
+        cdef Py_ssize_t stop_idx = self.data.shape[0] if stop is None else stop
+        if start < 0 or stop_idx > self.data.shape[0] or start > stop_idx:
+            raise ValueError("invalid range [{}, {})".format(start, stop_idx))
+        if start == stop_idx:
+            return ''
+        return decode_c(&self.data[start], stop_idx - start)
+    # end def
+# end class
+
+cdef class SeedIndex:
+    """Positions of every k-mer of an encoded reference, grouped by k-mer,
+    for :meth:`SSW.align_seeded`.  K-mers holding an N are left out.  Built
+    by :meth:`SSW.build_seed_index`
+    """
+    # positions of k-mer c are positions[offsets[c]:offsets[c + 1]]
+    cdef uint32_t[::1] offsets
+    cdef uint32_t[::1] positions
+    cdef readonly int k
+    cdef readonly Py_ssize_t ref_length
+    cdef readonly Py_ssize_t nbytes
+
+    def __len__(self) -> int:
+        return self.positions.shape[0]
+
+    def __repr__(self) -> str:
+        return "SeedIndex(k={}, ref_length={})".format(self.k, self.ref_length)
+
+    def __reduce__(self):
+        return (_rebuild_seed_index, (self.k,
+                                    self.ref_length,
+                                    np.asarray(self.offsets),
+                                    np.asarray(self.positions)))
+
+    def lookup(self, kmer: STR_T) -> np.ndarray:
+        """Reference positions of a k-mer
+
+        Args:
+            kmer: k bases
+
+        Returns:
+            ascending uint32 array of the positions
+
+        Raises:
+            ValueError
+        """
+        cdef Py_ssize_t length
+        cdef const char* kmer_cstr
+        cdef int8_t codes[16]
+        cdef uint32_t code = 0
+        cdef int i
+
+        kmer_buffer = c_util.obj_to_buffer(kmer)
+        kmer_cstr = c_util.buffer_to_cstr_len(kmer_buffer, &length)
+        if length != self.k:
+            raise ValueError("kmer must have {} bases, not {}".format(self.k, length))
+        dnaToInt8(kmer_cstr, codes, <int32_t> length)
+        for i in range(self.k):
+            if codes[i] > 3:
+                return np.zeros(0, dtype=np.uint32)
+            code = (code << 2) | <uint32_t> codes[i]
+        return np.asarray(self.positions[self.offsets[code]:self.offsets[code + 1]]).copy()
+    # end def
+# end class
+
+cdef SeedIndex make_seed_index(const int8_t* ref_arr, Py_ssize_t ref_length, int k):
+    """Index the k-mers of an encoded reference with a counting sort
+
+    Raises:
+        ValueError
+    """
+    cdef SeedIndex index = SeedIndex.__new__(SeedIndex)
+    cdef uint32_t mask = (1u << (2*k)) - 1
+    cdef uint32_t code = 0
+    cdef uint32_t total = 0
+    cdef uint32_t count
+    cdef Py_ssize_t i, valid = 0
+    cdef uint32_t[::1] offsets
+    cdef uint32_t[::1] positions
+
+    if k < SEED_K_MIN or k > SEED_K_MAX:
+        raise ValueError("k must be from {} to {}, not {}".format(SEED_K_MIN, SEED_K_MAX, k))
+    if ref_length >= 0xFFFFFFFF:
+        raise ValueError("reference too long to index")
+    offsets = np.zeros((1 << (2*k)) + 1, dtype=np.uint32)
+    with nogil:
+        for i in range(ref_length):
+            if ref_arr[i] > 3:
+                valid = 0
+                continue
+            code = ((code << 2) | <uint32_t> ref_arr[i]) & mask
+            valid += 1
+            if valid >= k:
+                offsets[code + 1] += 1
+        for i in range(1, offsets.shape[0]):
+            count = offsets[i]
+            offsets[i] = total
+            total += count
+    # offsets[c + 1] is now where k-mer c starts and is advanced to where it
+    # ends while filling
+    positions = np.empty(total, dtype=np.uint32)
+    valid = 0
+    with nogil:
+        for i in range(ref_length):
+            if ref_arr[i] > 3:
+                valid = 0
+                continue
+            code = ((code << 2) | <uint32_t> ref_arr[i]) & mask
+            valid += 1
+            if valid >= k:
+                positions[offsets[code + 1]] = <uint32_t> (i + 1 - k)
+                offsets[code + 1] += 1
+    index.offsets = offsets
+    index.positions = positions
+    index.k = k
+    index.ref_length = ref_length
+    index.nbytes = 4*(offsets.shape[0] + positions.shape[0])
+    return index
+# end def
+
+def _rebuild_seed_index(int k, Py_ssize_t ref_length, offsets, positions) -> SeedIndex:
+    """Unpickle a :class:`SeedIndex` from its arrays
+
+    Raises:
+        ValueError
+    """
+    cdef SeedIndex index = SeedIndex.__new__(SeedIndex)
+    if k < SEED_K_MIN or k > SEED_K_MAX:
+        raise ValueError("k must be from {} to {}, not {}".format(SEED_K_MIN, SEED_K_MAX, k))
+    index.offsets = np.ascontiguousarray(offsets, dtype=np.uint32)
+    index.positions = np.ascontiguousarray(positions, dtype=np.uint32)
+    if (index.offsets.shape[0] != (1 << (2*k)) + 1 or
+        index.offsets[index.offsets.shape[0] - 1] != index.positions.shape[0]):
+        raise ValueError("inconsistent seed index arrays")
+    index.k = k
+    index.ref_length = ref_length
+    index.nbytes = 4*(index.offsets.shape[0] + index.positions.shape[0])
+    return index
+# end def
 
 cdef class SSW:
 
     cdef int8_t* score_matrix
-    cdef s_profile* profile
+    cdef ReadProfile read_profile
+    # profile of the reverse complement of the read, built on first use
+    cdef ReadProfile rc_profile
+    cdef ProfileCache profile_cache
+    # k-mer index of the reference for align_seeded, dropped with it
+    cdef SeedIndex seed_index
 
     cdef object read
-    cdef int8_t* read_arr
     cdef Py_ssize_t read_length
+    cdef bint read_encoded
 
     cdef object reference
     cdef int8_t* ref_arr
     cdef Py_ssize_t ref_length
+    # False when ref_arr points into memory owned by self.reference
+    cdef bint ref_owned
+
+    # number of alignments running without the GIL on this object
+    cdef int in_use
+    # buffers reused by align_c, and whether an alignment holds them
+    cdef s_workspace* workspace
+    cdef bint workspace_busy
+    # profiles the workspace keeps reverse pass profiles for
+    cdef list workspace_profiles
+
+    # score size policy, one of SCORE_SIZE_POLICIES
+    cdef readonly str score_size
+    # bias added to byte scores and the longest read that can't overflow
+    # the byte kernel
+    cdef int bias
+    cdef int32_t byte_max_length
+    # number of alignments finished by the byte kernel, run directly with
+    # the word kernel, or rerun with the word kernel after the byte kernel
+    # saturated
+    cdef Py_ssize_t byte_count
+    cdef Py_ssize_t word_count
+    cdef Py_ssize_t fallback_count
+    # alignments of reads longer than byte_max_length and how many of them
+    # scored too high for the byte kernel
+    cdef Py_ssize_t long_count
+    cdef Py_ssize_t saturated_count
+
+    cdef stats_t stats_c
+    cdef readonly bint stats_enabled
 
-    def __cinit__(self, int match_score=2,
-                        int mismatch_penalty=2):
+    def __cinit__(self, *args, **kwargs):
+        memset(&self.stats_c, 0, sizeof(stats_t))
+        self.stats_enabled = False
         self.score_matrix = NULL
-        self.profile = NULL
-        self.read_arr = NULL
         self.ref_arr = NULL
+        self.ref_owned = False
+        self.in_use = 0
+        self.workspace = ssw_workspace_init()
+        if self.workspace == NULL:
+            raise MemoryError('Out of Memory')
+        self.workspace_busy = False
+        self.workspace_profiles = []
     # end def
 
     def __init__(self,  int match_score=2,
-                        int mismatch_penalty=2):
+                        int mismatch_penalty=2,
+                        ProfileCache profile_cache=None,
+                        str score_size='both',
+                        bint stats=False):
         """ Requires a
 
         Args:
             match_score (int): for scoring matches
             mismatch_penalty (int): for scoring mismatches
+            profile_cache (ProfileCache): optional cache of read profiles,
+                possibly shared with other :class:`SSW` objects
+            score_size (str): which striped kernel to align with.
+                ``'both'`` tries the 8 bit kernel and reruns with the 16 bit
+                kernel when the score saturates, ``'byte'`` and ``'word'``
+                force one kernel, ``'auto'`` picks the byte kernel only for
+                reads too short to saturate it and ``'adaptive'`` also
+                switches long reads to the word kernel once most of them have
+                been seen to saturate.  The kernels agree on everything but
+                `sub_optimal_score`, which comes from the column maxima of the
+                kernel that scored the read: the 8 bit kernel pads the read to
+                more positions, whose cells carry its scores and gaps into
+                later columns, and masks one column more after the best end,
+                so the policies can report different `sub_optimal_score`.
+                default 'both'
+            stats (bool): count calls, time and work, see :meth:`stats`.
+                default False
+
+        Raises:
+            ValueError
         """
+        if score_size not in SCORE_SIZE_POLICIES:
+            raise ValueError("score_size must be one of {}, not {!r}".format(
+                            SCORE_SIZE_POLICIES, score_size))
         self.score_matrix = <int8_t*> PyMem_Malloc(25*sizeof(int8_t))
         self.buildDNAScoreMatrix(   <uint8_t>match_score,
                                     <uint8_t> mismatch_penalty,
                                     self.score_matrix)
+        self.score_size = score_size
+        self.bias = mismatch_penalty if mismatch_penalty > 0 else 0
+        if match_score > 0:
+            self.byte_max_length = (254 - self.bias) // match_score
+        else:
+            self.byte_max_length = 0x7FFFFFFF
         self.read = None
         self.reference = None
+        self.read_profile = None
+        self.rc_profile = None
+        self.profile_cache = profile_cache
+        self.stats_enabled = stats
     # end def
 
     def __dealloc__(self):
         PyMem_Free(self.score_matrix)
+        ssw_workspace_destroy(self.workspace)
 
-        if self.profile != NULL:
-            init_destroy(self.profile)
-            self.profile = NULL
+        if self.ref_owned:
+            PyMem_Free(self.ref_arr)
+    # end def
 
-        if self.read_arr != NULL:
-            PyMem_Free(self.read_arr)
+    def __reduce__(self):
+        """Pickle the scoring parameters, the encoded read and reference,
+        the seed index and the score size counters.  The profiles are
+        rebuilt from the encoded read on unpickling, without decoding or
+        re-encoding anything, and the workspace and :meth:`stats` start
+        afresh
 
-        if self.ref_arr != NULL:
-            PyMem_Free(self.ref_arr)
+        Raises:
+            RuntimeError, TypeError
+        """
+        cdef EncodedReference reference
+        self.checkIdle_c()
+        if self.score_matrix == NULL:
+            raise TypeError("SSW object is not initialized")
+        read = None
+        read_score_size = SCORE_SIZE_BOTH
+        if self.read_profile is not None:
+            read = (<char*> self.read_profile.read_arr)[:self.read_length]
+            read_score_size = self.read_profile.score_size
+        if self.reference is None or isinstance(self.reference, EncodedReference):
+            reference = self.reference
+        else:
+            reference = EncodedReference(
+                (<char*> self.ref_arr)[:self.ref_length] if self.ref_length else b'',
+                '', False)
+        return (SSW,
+                (self.score_matrix[0], -self.score_matrix[1], self.profile_cache,
+                self.score_size, self.stats_enabled),
+                (read, read_score_size, reference, self.seed_index,
+                (self.byte_count, self.word_count, self.fallback_count,
+                self.long_count, self.saturated_count)))
     # end def
 
-    cdef int printResult_c(self, s_align* result, Py_ssize_t start_idx) except -1:
+    def __setstate__(self, state):
+        cdef bytes read
+        cdef EncodedReference reference
+        cdef SeedIndex seed_index
+        cdef int read_score_size
+
+        read, read_score_size, reference, seed_index, counters = state
+        self.checkIdle_c()
+        if read is not None:
+            self.read_profile = self.profile_c( read,
+                                                read,
+                                                len(read),
+                                                read_score_size,
+                                                True)
+            self.read = read
+            self.read_length = len(read)
+            self.read_encoded = True
+            self.rc_profile = None
+            ssw_workspace_forget(self.workspace)
+            self.workspace_profiles = []
+        if reference is not None:
+            self.setReferenceArray_c(reference,
+                                    <int8_t*> &reference.data[0] if len(reference) else NULL,
+                                    len(reference),
+                                    False)
+            if seed_index is not None:
+                if seed_index.ref_length != self.ref_length:
+                    raise ValueError("seed index does not match the reference")
+                self.seed_index = seed_index
+        (self.byte_count, self.word_count, self.fallback_count,
+            self.long_count, self.saturated_count) = counters
+    # end def
+
+    cdef int printResult_c(self,
+        s_align* result,
+        Py_ssize_t start_idx,
+        bint reverse=False) except -1:
         cdef const char* read_cstr
         cdef Py_ssize_t read_length, ref_length
         cdef const char* ref_cstr
 
-        print(self.read)
+        read = self.read
+        if reverse:
+            if self.rc_profile is None:
+                self.rc_profile = self.rcProfile_c(self.read_profile)
+            read = decode_c(<const uint8_t*> self.rc_profile.read_arr, self.read_length)
+        elif self.read_encoded:
+            read = decode_c(<const uint8_t*> self.read_profile.read_arr, self.read_length)
+        elif not isinstance(read, (str, bytes)):
+            read = bytes(read)
+        print(read)
         if result != NULL:
-            read_cstr = c_util.obj_to_cstr_len(self.read, &read_length)
-            ref_cstr = c_util.obj_to_cstr_len(self.reference, &ref_length)
+            read_cstr = c_util.obj_to_cstr_len(read, &read_length)
+            reference = self.reference
+            if isinstance(reference, EncodedReference):
+                reference = (<EncodedReference> reference).decode(0, start_idx + result.ref_end1 + 1)
+            elif not isinstance(reference, (str, bytes)):
+                reference = bytes(reference)
+            ref_cstr = c_util.obj_to_cstr_len(reference, &ref_length)
 
             ssw_write_cigar(result)
             ssw_writer(result, &ref_cstr[start_idx], read_cstr)
@@ -130,7 +1602,7 @@ cdef class SSW:
     # end def
 
 
-    def printResult(self, result: Alignment, start_idx: int = 0):
+    def printResult(self, result, start_idx: int = 0):
         """ rebuild a s_align struct from a result dictionary
         so as to be able to call ssw terminal print functions
 
@@ -141,129 +1613,500 @@ cdef class SSW:
         raises:
             MemoryError
         """
-        cdef uint32_t* cigar_array = NULL
+        cdef Alignment alignment
+        cdef const uint32_t[::1] cigar_array
         cdef s_align *res_align = NULL
-        cdef char letter
-        cdef uint32_t length
-
-        cdef Py_ssize_t i, j
 
+        alignment = result if isinstance(result, Alignment) else Alignment(*result)
         try:
             res_align = <s_align*> PyMem_Malloc(sizeof(s_align))
             if res_align == NULL:
                 raise MemoryError('Out of Memory')
-            cigar = result.CIGAR
-            if cigar is not None:
-                cigar_array = <uint32_t*> PyMem_Malloc(len(cigar)//2*sizeof(uint32_t))
-                if cigar_array == NULL:
-                    raise MemoryError('Out of Memory')
-                j = 0
-                for i in range(0, len(cigar), 2):
-                    length = int(cigar[i])
-                    letter = ord(cigar[i+1])
-                    cigar_array[j] = to_cigar_int(length, letter)
-                    j += 1
-                res_align.cigar = cigar_array
-                res_align.cigarLen = len(cigar)//2
+            cigar_ops = alignment.cigar_array
+            if cigar_ops is not None and len(cigar_ops) > 0:
+                cigar_array = cigar_ops
+                res_align.cigar = <uint32_t*> &cigar_array[0]
+                res_align.cigarLen = cigar_array.shape[0]
             else:
                 res_align.cigar = NULL
-            res_align.score1 = result.optimal_score
-            res_align.score2 = result.sub_optimal_score
-            res_align.ref_begin1 = result.reference_start
-            res_align.ref_end1 = result.reference_end
-            res_align.read_begin1 = result.read_start
-            res_align.read_end1 = result.read_end
-
-            self.printResult_c(res_align, start_idx)
+            res_align.score1 = alignment.optimal_score
+            res_align.score2 = alignment.sub_optimal_score
+            res_align.ref_begin1 = alignment.reference_start
+            res_align.ref_end1 = alignment.reference_end
+            res_align.read_begin1 = alignment.read_start
+            res_align.read_end1 = alignment.read_end
+
+            self.printResult_c(res_align, start_idx, alignment.strand == '-')
         finally:
-            if cigar is not None:
-                PyMem_Free(cigar_array)
             PyMem_Free(res_align)
     # end def
 
-    def setRead(self, read: STR_T):
+    def setRead(self, read, bint encoded = False):
         """ Set the query read string
 
         Args:
-            read:  String-like (str or bytestring) that represents the read.
+            read:  String-like (str or bytestring) that represents the read,
+                    or any object supporting the buffer protocol with 1 byte
+                    items such as a bytearray or NumPy uint8 array.
                     Must be set
+            encoded: ``read`` already holds the codes 0-4 for A, C, G, T
+                    and N so it is not re-encoded. default False
         """
         cdef Py_ssize_t read_length
-        cdef const char* read_cstr = c_util.obj_to_cstr_len(read, &read_length)
-        cdef int8_t* read_arr = <int8_t*> PyMem_Malloc(read_length*sizeof(char))
-
-        if self.profile != NULL:
-            init_destroy(self.profile)
-            self.profile = NULL
-        if self.read_arr != NULL:
-            PyMem_Free(self.read_arr)
-            self.read_arr = NULL
+        cdef const char* read_cstr
+        cdef uint64_t start = ssw_clock_ns() if self.stats_enabled else 0
 
+        self.checkIdle_c()
+        if encoded and isinstance(read, str):
+            raise TypeError("encoded reads must be bytes-like")
+        read_buffer = c_util.obj_to_buffer(read)
+        read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+        self.read_profile = self.profile_c( read_buffer,
+                                            read_cstr,
+                                            read_length,
+                                            self.scoreSize_c(read_length),
+                                            encoded)
         self.read = read
-        self.read_arr = read_arr
         self.read_length = read_length
-        dnaToInt8(read_cstr, read_arr, read_length)
+        self.read_encoded = encoded
+        self.rc_profile = None
+        ssw_workspace_forget(self.workspace)
+        self.workspace_profiles = []
+        if start:
+            self.countCall_c(STATS_SET_READ, start, 0)
+    # end def
+
+    cdef ReadProfile profile_c(self,
+                            object read,
+                            const char* read_cstr,
+                            Py_ssize_t read_length,
+                            int score_size,
+                            bint encoded):
+        """Profile of a read, through the profile cache if there is one
+        """
+        cdef ReadProfile prof
+        cdef Py_ssize_t misses
+        if self.profile_cache is None:
+            prof = make_read_profile(read_cstr, read_length, self.score_matrix, score_size, encoded)
+            self.countProfiles_c(1)
+            return prof
+        misses = self.profile_cache.misses
+        prof = self.profile_cache.get_c(read,
+                                        read_cstr,
+                                        read_length,
+                                        self.score_matrix,
+                                        score_size,
+                                        encoded)
+        self.countProfiles_c(self.profile_cache.misses - misses)
+        return prof
+    # end def
 
-        self.profile = ssw_init(read_arr,
-                                <int32_t> read_length,
-                                self.score_matrix,
-                                5,
-                                2 # don't know best score size
-                                )
+    cdef ReadProfile rcProfile_c(self, ReadProfile read_profile):
+        """Profile of the reverse complement of the read of
+        ``read_profile``, through the profile cache if there is one
+        """
+        cdef Py_ssize_t i, read_length = read_profile.read_length
+        cdef bytearray rc_read = bytearray(read_length)
+        cdef char* rc_cstr = rc_read
+        cdef int8_t code
+
+        for i in range(read_length):
+            code = read_profile.read_arr[read_length - 1 - i]
+            rc_cstr[i] = 3 - code if code < 4 else code
+        return self.profile_c(bytes(rc_read), rc_cstr, read_length, read_profile.score_size, True)
     # end def
 
-    def setReference(self, reference: STR_T):
+    def setReference(self, reference, bint encoded = False):
         """Set the query reference string
 
         Args:
             reference:  String-like (str or bytestring) that represents the
-                reference sequence must be set
+                reference sequence must be set, an :class:`EncodedReference`
+                which is used in place without copying, or any object
+                supporting the buffer protocol with 1 byte items
+            encoded: ``reference`` already holds the codes 0-4 for A, C, G,
+                T and N and is used in place without copying. default False
+
+        Raises:
+            ValueError: ``encoded`` is set and ``reference`` holds other codes
         """
         cdef Py_ssize_t ref_length
-        cdef const char* ref_cstr = c_util.obj_to_cstr_len(reference, &ref_length)
-        cdef int8_t* ref_arr = <int8_t*> PyMem_Malloc(ref_length*sizeof(char))
-        dnaToInt8(ref_cstr, ref_arr, ref_length)
-        self.reference = reference
-        if self.ref_arr != NULL:
+        cdef const char* ref_cstr
+        cdef int8_t* ref_arr
+        cdef EncodedReference encoded_ref
+        cdef uint64_t start = ssw_clock_ns() if self.stats_enabled else 0
+
+        self.checkIdle_c()
+        if encoded and not isinstance(reference, EncodedReference):
+            if isinstance(reference, str):
+                raise TypeError("encoded references must be bytes-like")
+            reference = EncodedReference(reference)
+        if isinstance(reference, EncodedReference):
+            encoded_ref = reference
+            ref_length = encoded_ref.data.shape[0]
+            ref_arr = <int8_t*> &encoded_ref.data[0] if ref_length > 0 else NULL
+            self.setReferenceArray_c(reference, ref_arr, ref_length, False)
+        else:
+            reference = c_util.obj_to_buffer(reference)
+            ref_cstr = c_util.buffer_to_cstr_len(reference, &ref_length)
+            ref_arr = <int8_t*> PyMem_Malloc(ref_length*sizeof(char))
+            if ref_arr == NULL and ref_length > 0:
+                raise MemoryError('Out of Memory')
+            dnaToInt8(ref_cstr, ref_arr, ref_length)
+            self.setReferenceArray_c(reference, ref_arr, ref_length, True)
+        if start:
+            self.countCall_c(STATS_SET_REFERENCE, start, 0)
+    # end def
+
+    def build_seed_index(self, int k=11) -> SeedIndex:
+        """Index the k-mers of the reference for :meth:`align_seeded`.
+        The index is kept until the reference is replaced
+
+        Args:
+            k (int): seed length, from 4 to 14.  The index takes 4**k + 1
+                plus one 4 byte entry per reference base.  default 11
+
+        Returns:
+            the SeedIndex
+
+        Raises:
+            ValueError
+        """
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        self.seed_index = make_seed_index(self.ref_arr, self.ref_length, k)
+        return self.seed_index
+    # end def
+
+    cdef int setReferenceArray_c(self,
+        object reference,
+        int8_t* ref_arr,
+        Py_ssize_t ref_length,
+        bint owned) except -1:
+        """Swap in an encoded reference, releasing the previous one.  When
+        ``owned`` is False ``ref_arr`` must stay valid for as long as
+        ``reference`` is alive
+        """
+        if self.ref_owned:
             PyMem_Free(self.ref_arr)
-            self.ref_arr = NULL
+        self.reference = reference
         self.ref_arr = ref_arr
         self.ref_length = ref_length
+        self.ref_owned = owned
+        self.seed_index = None
+        return 0
+    # end def
+
+    cdef int checkIdle_c(self) except -1:
+        """Refuse to swap the read or reference out from under alignments
+        running without the GIL in another thread
+        """
+        if self.in_use > 0:
+            raise RuntimeError("SSW object is in use by another thread")
+        return 0
     # end def
 
-    cdef s_align* align_c(self,
+    cdef int8_t longScoreSize_c(self):
+        """score_size for reads that might saturate the byte kernel
+        """
+        if self.score_size == 'byte':
+            return SCORE_SIZE_BYTE
+        elif self.score_size == 'word' or self.score_size == 'auto':
+            return SCORE_SIZE_WORD
+        elif (self.score_size == 'adaptive' and self.long_count > 0 and
+            2*self.saturated_count >= self.long_count):
+            # rerunning most alignments costs more than one word pass
+            return SCORE_SIZE_WORD
+        return SCORE_SIZE_BOTH
+    # end def
+
+    cdef int8_t scoreSize_c(self, Py_ssize_t read_length):
+        """Pick the ssw_init score_size of a read under the score size
+        policy
+        """
+        if (read_length <= self.byte_max_length and
+            (self.score_size == 'auto' or self.score_size == 'adaptive')):
+            return SCORE_SIZE_BYTE
+        return self.longScoreSize_c()
+    # end def
+
+    cdef void scoreSizeOpts_c(self, align_opts_t* opts):
+        """Fill in the score size fields of ``opts`` for a batch of reads
+        """
+        opts.byte_max_length = self.byte_max_length
+        opts.short_score_size = self.scoreSize_c(0)
+        opts.long_score_size = self.longScoreSize_c()
+    # end def
+
+    cdef void tallyScoreSize_c(self,
+        int8_t score_size,
+        Py_ssize_t read_length,
+        uint16_t score1):
+        """Count which kernel finished an alignment
+        """
+        cdef bint saturated = score1 + self.bias >= 255
+        if read_length > self.byte_max_length:
+            self.long_count += 1
+            self.saturated_count += saturated
+        if score_size == SCORE_SIZE_WORD:
+            self.word_count += 1
+        elif score_size == SCORE_SIZE_BOTH and saturated:
+            self.fallback_count += 1
+        else:
+            self.byte_count += 1
+    # end def
+
+    def scoreSizeStats(self) -> dict:
+        """Report how the alignments run so far were scored
+
+        Returns:
+            dictionary with the ``score_size`` policy and the number of
+            alignments finished by the 8 bit kernel (`byte`), run directly
+            with the 16 bit kernel (`word`) and rerun with the 16 bit kernel
+            after the 8 bit kernel saturated (`fallback`)
+        """
+        return {
+            'score_size': self.score_size,
+            'byte': self.byte_count,
+            'word': self.word_count,
+            'fallback': self.fallback_count,
+        }
+    # end def
+
+    cdef Alignment align_c(self,
         int gap_open,
         int gap_extension,
         Py_ssize_t start_idx,
-        int32_t mod_ref_length) except NULL:
-        """C version of the alignment code
+        int32_t mod_ref_length,
+        const align_opts_t* opts,
+        bint reverse=False,
+        int anchor=0):
+        """C version of the alignment code.  The GIL is released while
+        the C kernels run.  ``reverse`` aligns the reverse complement of the
+        read and a non zero ``anchor`` holds the ``SSW_ANCHOR_*`` flags of an
+        anchored alignment.  Unanchored alignments run in ``self.workspace``
+        unless another thread holds it
         """
-        cdef Py_ssize_t read_length
-        cdef const char* read_cstr = c_util.obj_to_cstr_len(self.read, &read_length)
         cdef s_align* result = NULL
-        cdef int32_t mask_len = read_length / 2
+        cdef const s_align* ws_result = NULL
+        cdef const s_profile* profile = NULL
+        cdef const int8_t* ref_arr = &self.ref_arr[start_idx]
+        cdef int32_t mask_len = self.read_length // 2
+        cdef bint use_workspace = not anchor and not self.workspace_busy
+        # a local reference keeps the profile alive if another thread
+        # replaces self.read_profile
+        cdef ReadProfile read_profile = self.read_profile
+        cdef uint64_t start = ssw_clock_ns() if self.stats_enabled else 0
+        cdef s_stats kernel_stats
 
         mask_len = 15 if mask_len < 15 else mask_len
 
-        if self.profile != NULL:
-            result = ssw_align ( self.profile,
-                                &self.ref_arr[start_idx],
-                                mod_ref_length,
-                                gap_open,
-                                gap_extension,
-                                1, 0, 0, mask_len)
+        if read_profile is not None:
+            if (self.score_size == 'adaptive' and
+                read_profile.score_size != self.scoreSize_c(self.read_length)):
+                # the saturation rate changed sides since setRead
+                read_profile = make_read_profile(
+                                        <const char*> read_profile.read_arr,
+                                        self.read_length,
+                                        self.score_matrix,
+                                        self.scoreSize_c(self.read_length),
+                                        True)
+                self.countProfiles_c(1)
+                self.read_profile = read_profile
+                self.rc_profile = None
+            if reverse:
+                if (self.rc_profile is None or
+                    self.rc_profile.score_size != read_profile.score_size):
+                    self.rc_profile = self.rcProfile_c(read_profile)
+                read_profile = self.rc_profile
+            profile = read_profile.profile
+            if use_workspace:
+                self.keepProfile_c(read_profile)
+                if start:
+                    memset(&kernel_stats, 0, sizeof(s_stats))
+                    ssw_workspace_set_stats(self.workspace, &kernel_stats)
+            self.in_use += 1
+            self.workspace_busy |= use_workspace
+            with nogil:
+                if anchor:
+                    result = ssw_align_anchor(  profile,
+                                                ref_arr,
+                                                mod_ref_length,
+                                                gap_open,
+                                                gap_extension,
+                                                opts.flag,
+                                                opts.filters,
+                                                opts.filterd,
+                                                anchor)
+                elif use_workspace:
+                    ws_result = ssw_align_ws(   profile,
+                                                ref_arr,
+                                                mod_ref_length,
+                                                gap_open,
+                                                gap_extension,
+                                                opts.flag,
+                                                opts.filters,
+                                                opts.filterd,
+                                                mask_len,
+                                                self.workspace)
+                else:
+                    result = ssw_align ( profile,
+                                        ref_arr,
+                                        mod_ref_length,
+                                        gap_open,
+                                        gap_extension,
+                                        opts.flag,
+                                        opts.filters,
+                                        opts.filterd,
+                                        mask_len)
+            self.in_use -= 1
         else:
             raise ValueError("Must set profile first")
-        if result == NULL:
-            raise ValueError("Problem Running alignment, see stdout")
-        return result
+        try:
+            if use_workspace:
+                result = <s_align*> ws_result
+            if result == NULL and anchor:
+                raise ValueError("Problem Running anchored alignment, see stderr")
+            if result == NULL:
+                if read_profile.score_size == SCORE_SIZE_BYTE:
+                    raise ValueError("Alignment score overflowed the 8 bit kernel, "
+                                    "use score_size='word' or 'auto'")
+                raise ValueError("Problem Running alignment, see stdout")
+            if not anchor:
+                self.tallyScoreSize_c(read_profile.score_size, self.read_length, result.score1)
+            return make_alignment(result, reverse)
+        finally:
+            if use_workspace:
+                if start:
+                    ssw_workspace_set_stats(self.workspace, NULL)
+                    self.countKernels_c(&kernel_stats)
+                self.workspace_busy = False
+            elif result != NULL:
+                align_destroy(result)
+            if start:
+                self.countCall_c(STATS_ALIGN, start, 1)
+    # end def
+
+    cdef int keepProfile_c(self, ReadProfile read_profile) except -1:
+        """Hold on to ``read_profile`` while the workspace keeps reverse
+        pass profiles for it, as they are keyed by its address.  Only a few
+        are kept: the forward and reverse complement profiles of the read
+        and their replacements when the score size changes
+        """
+        if read_profile not in self.workspace_profiles:
+            if len(self.workspace_profiles) >= 4:
+                ssw_workspace_forget(self.workspace)
+                self.workspace_profiles = []
+            self.workspace_profiles.append(read_profile)
+        return 0
+    # end def
+
+    def workspace_stats(self) -> dict:
+        """Memory held by the workspace that unanchored alignments reuse
+        from one call to the next, and how often it had the profile of the
+        reverse pass that finds the start of an alignment.  The memory only
+        grows, when a longer read or reference window needs it.  Reverse
+        pass profiles are kept per prefix of the read that ends an
+        alignment and dropped by :meth:`setRead`
+
+        Returns:
+            dictionary with the bytes held now as ``'size'``, the most
+            held so far as ``'peak'`` and the reverse pass profiles reused
+            and built as ``'reverse_hits'`` and ``'reverse_misses'``
+        """
+        cdef size_t peak = 0, misses = 0
+        cdef size_t size = ssw_workspace_size(self.workspace, &peak)
+        cdef size_t hits = ssw_workspace_reverse_hits(self.workspace, &misses)
+        return {'size': size,
+                'peak': peak,
+                'reverse_hits': hits,
+                'reverse_misses': misses}
+    # end def
+
+    def release_workspace(self):
+        """Free the buffers of the workspace, say after aligning an unusually
+        long read.  They are allocated again by the next alignment and
+        ``workspace_stats()['peak']`` is kept
+        """
+        if not self.workspace_busy:
+            ssw_workspace_release(self.workspace)
+            self.workspace_profiles = []
+    # end def
+
+    def enable_stats(self, bint enabled=True):
+        """Start or stop counting calls, time and work for :meth:`stats`
+        and :func:`global_stats`.  Counting reads a clock around each call
+        and alignment phase, and is a test per phase otherwise
+
+        Args:
+            enabled (bool): count from now on. default True
+        """
+        self.stats_enabled = enabled
+    # end def
+
+    def stats(self, bint reset=False) -> dict:
+        """What this aligner did while counting, see :meth:`enable_stats`.
+        ``'set_read'``, ``'set_reference'``, ``'align'`` and
+        ``'align_batch'`` count calls from Python, each alignment being one
+        ``'align'`` call of :meth:`align` and its variants.  The
+        ``'forward'``, ``'reverse'`` and ``'cigar'`` phases, the cells
+        searched and the counters after them come from the alignment
+        kernels, for alignments that are not anchored.  Phases run by
+        several threads add up the time of each
+
+        Args:
+            reset (bool): zero the counters after reading them. default False
+
+        Returns:
+            dictionary of the ``'calls'``, ``'nanoseconds'`` and
+            ``'cells'`` of each call and phase, the number of
+            ``'alignments'``, the read profiles built rather than found in
+            the profile cache as ``'profiles_built'``, the 8 bit forward
+            passes run again with 16 bits as ``'saturations'``, the
+            ``'reverse_profiles_built'``, the ``'band_widenings'`` and
+            widest band ``'band_max'`` of the CIGAR phase and the most
+            bytes held by the workspace as ``'buffer_peak'``
+        """
+        out = stats_dict_c(&self.stats_c)
+        if reset:
+            memset(&self.stats_c, 0, sizeof(stats_t))
+        return out
+    # end def
+
+    cdef void countCall_c(self, int call, uint64_t start, uint64_t alignments):
+        """Count a call begun at ``start`` that ran ``alignments``
+        alignments, here and in the global counters
+        """
+        cdef uint64_t nanos = ssw_clock_ns() - start
+        self.stats_c.calls[call] += 1
+        self.stats_c.nanos[call] += nanos
+        self.stats_c.alignments += alignments
+        global_stats_c.calls[call] += 1
+        global_stats_c.nanos[call] += nanos
+        global_stats_c.alignments += alignments
+    # end def
+
+    cdef void countKernels_c(self, const s_stats* kernel_stats):
+        ssw_stats_add(&self.stats_c.kernels, kernel_stats)
+        ssw_stats_add(&global_stats_c.kernels, kernel_stats)
+    # end def
+
+    cdef void countProfiles_c(self, uint64_t built):
+        if self.stats_enabled:
+            self.stats_c.profiles += built
+            global_stats_c.profiles += built
     # end def
 
     def align(self,
         int gap_open = 3,
         int gap_extension = 1,
         Py_ssize_t start_idx = 0,
-        Py_ssize_t end_idx = 0) -> Alignment:
+        Py_ssize_t end_idx = 0,
+        str mode = 'cigar',
+        score_filter: int = None,
+        distance_filter: int = None,
+        str strand = 'forward',
+        str anchor = 'local') -> Alignment:
         '''Align a read to the reference with optional index offseting
 
         returns a dictionary no matter what as align_c can't return
@@ -275,6 +2118,46 @@ cdef class SSW:
             start_idx (Py_ssize_t): index to start search. default 0
             end_idx (Py_ssize_t):   index to end search (trying to avoid a target region).
                                     default 0 means use whole reference length
+            mode (str):             how much of the alignment to compute.
+                                    ``'score'`` finds only the scores and end
+                                    positions, ``'start'`` adds the start
+                                    positions and ``'cigar'`` adds the CIGAR.
+                                    Fields that are not computed are ``None``
+                                    for `CIGAR` and -1 for the start positions.
+                                    default 'cigar'
+            score_filter (int):     only compute the start positions and CIGAR
+                                    when `optimal_score` is at least this.
+                                    Requires ``mode='cigar'``. default None
+            distance_filter (int):  only compute the CIGAR when both
+                                    ``reference_end - reference_start`` and
+                                    ``read_end - read_start`` are at most this.
+                                    Requires ``mode='cigar'``. default None
+            strand (str):           ``'forward'`` aligns the read,
+                                    ``'reverse'`` its reverse complement and
+                                    ``'both'`` both of them, returning the
+                                    higher scoring one (the forward one on a
+                                    tie).  The reverse complement profile is
+                                    built once per read and kept alongside
+                                    the forward one. default 'forward'
+            anchor (str):           ``'local'`` for Smith-Waterman,
+                                    ``'read_global'`` to align the whole
+                                    read anywhere in the reference,
+                                    ``'ref_prefix'`` to start the alignment
+                                    at `start_idx` and ``'ref_suffix'`` to end
+                                    it at the last base searched.  Anchored
+                                    ends are part of the dynamic programming
+                                    and may be gaps, so the CIGAR can start or
+                                    end with I or D.  Anchored alignments use
+                                    16 bit scores and leave
+                                    `sub_optimal_score` 0.  When no anchored
+                                    alignment scores above 0, as happens
+                                    with ``'read_global'`` when every way of
+                                    placing the whole read scores 0 or less,
+                                    `optimal_score` is 0 and every position
+                                    -1.  A ``gap_extension`` above
+                                    ``gap_open`` costs ``gap_open``, the
+                                    cost of opening another gap.
+                                    default 'local'
 
         Returns:
             Alignment with keys `CIGAR`,        <for depicting alignment>
@@ -284,127 +2167,1038 @@ cdef class SSW:
                                 `reference_end`,   <index into reference>
                                 `read_start`,  <index into read>
                                 `read_end`     <index into read>
+            The packed CIGAR is also available as `cigar_array` and the
+            strand as `strand`, ``'+'`` or ``'-'``.  Read positions of a
+            ``'-'`` alignment index into the reverse complement of the read
 
         Raises
             ValueError
         '''
-        cdef Py_ssize_t c
-        cdef char letter
-        cdef int letter_int
-        cdef uint32_t length
-        cdef int32_t search_length
-        cdef Py_ssize_t end_idx_final
-
-        if start_idx < 0 or end_idx < 0:
-            raise ValueError("negative indexing not supported")
-        if end_idx > self.ref_length or start_idx > self.ref_length:
-            err = "start_idx: {} or end_idx: {} can't be greater than ref_length: {}".format(
-                                                start_idx,
-                                                end_idx,
-                                                self.ref_length)
-            raise ValueError(err)
-        if end_idx == 0:
-            end_idx_final = self.ref_length
-        else:
-            end_idx_final = end_idx
-        search_length = end_idx_final - start_idx
+        cdef int32_t search_length = self.searchLength_c(start_idx, end_idx)
+        cdef align_opts_t opts
+        cdef Alignment out
+        cdef Alignment rc_out
+        cdef bint reverse = strand == 'reverse'
+        cdef int anchor_flags = anchor_flags_c(anchor)
+
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        if strand not in ALIGN_STRANDS:
+            raise ValueError("strand must be one of {}, not {!r}".format(ALIGN_STRANDS, strand))
+        align_opts_c(mode, score_filter, distance_filter, &opts)
 
-        cigar = None
+        out = self.align_c(gap_open, gap_extension, start_idx, search_length, &opts,
+                                reverse, anchor_flags)
+        if strand == 'both':
+            rc_out = self.align_c(gap_open, gap_extension, start_idx, search_length, &opts,
+                                    True, anchor_flags)
+            if rc_out.optimal_score > out.optimal_score:
+                out = rc_out
+        return out
+    # end def
+
+    cdef Py_ssize_t alignSpan_c(self, int gap_open, int gap_extension):
+        """Longest stretch of reference an alignment of the read can span:
+        the read plus the deletions its score can pay for, plus the columns
+        the padding of a striped profile reaches
+
+        Returns:
+            the span, or -1 if ``gap_extension`` is 0 and it is unbounded
+        """
+        cdef int match_score = self.score_matrix[0]
+        if gap_extension <= 0:
+            return -1
+        return (self.read_length + 16 +
+                max(0, match_score*self.read_length - gap_open) // gap_extension + 1)
+    # end def
+
+    def align_top(self,
+        int n = 2,
+        int min_score = 1,
+        min_separation: int = None,
+        int gap_open = 3,
+        int gap_extension = 1,
+        Py_ssize_t start_idx = 0,
+        Py_ssize_t end_idx = 0,
+        str mode = 'cigar') -> list:
+        '''Find the ``n`` best alignments of the read that do not overlap
+        on the reference, such as the copies of a repeat.  The reference is
+        scanned once for the best score ending at each position, and hits
+        are taken from the highest scoring positions down, each realigned in
+        a window just long enough to hold it, with its reference end
+        anchored when the window holds an earlier hit scoring as well
+
+        Args:
+            n (int):                most hits to return. default 2
+            min_score (int):        lowest score of a hit. default 1
+            min_separation (int):   fewest reference bases between the end
+                                    positions of two hits.  Hits also never
+                                    share a reference base. default None
+                                    uses the read length
+            gap_open (int):         penalty for gap_open. default 3
+            gap_extension (int):    penalty for gap_extension. default 1
+            start_idx (Py_ssize_t): index to start search. default 0
+            end_idx (Py_ssize_t):   index to end search. default 0 means use
+                                    whole reference length
+            mode (str):             as for :meth:`align`.  Overlaps are
+                                    checked on the end positions only unless
+                                    the start positions are found. default
+                                    'cigar'
+
+        Returns:
+            list of up to ``n`` Alignment, best first, with positions as for
+            :meth:`align`.  The `sub_optimal_score` of each hit is the score
+            of the next one, 0 for the last
+
+        Raises:
+            ValueError
+        '''
+        cdef int32_t search_length = self.searchLength_c(start_idx, end_idx)
+        cdef align_opts_t opts
+        cdef ReadProfile read_profile = self.read_profile
+        cdef Py_ssize_t span, separation, i, j
+        cdef int64_t end_pos, window_start
+        cdef int32_t max_score
+        cdef uint16_t[::1] column
+        cdef int64_t[::1] order
+        cdef Alignment hit
+        cdef list hits = []
+        cdef list ends = []
+        cdef list starts = []
+        # anchored alignments score with 16 bits
+        cdef bint can_anchor = self.score_matrix[0]*self.read_length < 0x3FFF
 
         if self.reference is None:
             raise ValueError("call setReference first")
+        if read_profile is None:
+            raise ValueError("Must set profile first")
+        if n < 0:
+            raise ValueError("n must be >= 0")
+        align_opts_c(mode, None, None, &opts)
+        separation = self.read_length if min_separation is None else min_separation
+        span = self.alignSpan_c(gap_open, gap_extension)
+        if span < 0 or span > search_length:
+            span = search_length
+        if n == 0 or search_length == 0:
+            return hits
 
-        cdef s_align* result =  self.align_c(gap_open, gap_extension, start_idx, search_length)
-        if result.cigar != NULL:
-            cigar = ""
-            for c in range(result.cigarLen):
-                letter = cigar_int_to_op(result.cigar[c])
-                letter_int = letter
-                length = cigar_int_to_len(result.cigar[c])
-                cigar += "%d%s" % (<int>length, chr(letter_int))
-        out = Alignment(
-                cigar,
-                result.score1,
-                result.score2,
-                result.ref_begin1,
-                result.ref_end1,
-                result.read_begin1,
-                result.read_end1
-        )
-        #print("RAW BEGIN")
-        #self.printResult_c(result)
-        #print("RAW END")
-        align_destroy(result)
+        column = np.zeros(search_length, dtype=np.uint16)
+        self.in_use += 1
+        try:
+            with nogil:
+                max_score = ssw_column_max( read_profile.profile,
+                                            &self.ref_arr[start_idx],
+                                            search_length,
+                                            gap_open,
+                                            gap_extension,
+                                            &column[0])
+        finally:
+            self.in_use -= 1
+        if max_score < 0:
+            raise ValueError("Alignment score overflowed the 8 bit kernel, "
+                            "use score_size='word' or 'auto'")
+
+        # candidate end positions, best first and leftmost first on a tie.
+        # Most positions score a little, so rather than sorting all of them
+        # take bands of the highest scores, each at least twice the last
+        column_arr = np.asarray(column)
+        counts = np.bincount(column_arr)
+        floor = max(min_score, 1)
+        high = counts.shape[0]
+        want = max(64, 4*n)
+        while len(hits) < n and high > floor:
+            # the lowest score that fills the band, or floor
+            filled = np.cumsum(counts[floor:high][::-1])
+            low = max(floor, high - 1 - int(np.searchsorted(filled, want)))
+            band = np.flatnonzero((column_arr >= low) & (column_arr < high))
+            order = band[np.argsort(-column_arr[band].astype(np.int32),
+                                    kind='stable')].astype(np.int64)
+            high = low
+            want *= 2
+            for i in range(order.shape[0]):
+                if len(hits) == n:
+                    break
+                end_pos = order[i]
+                if any(abs(end_pos - end) < separation for end in ends):
+                    continue
+                window_start = max(0, end_pos + 1 - span)
+                hit = self.align_c( gap_open, gap_extension,
+                                    start_idx + window_start,
+                                    <int32_t> (end_pos + 1 - window_start),
+                                    &opts)
+                if hit.reference_end != end_pos - window_start and can_anchor:
+                    # an earlier hit in the window, such as a tandem copy,
+                    # scores as well, so align the best hit ending here instead
+                    hit = self.align_c( gap_open, gap_extension,
+                                        start_idx + window_start,
+                                        <int32_t> (end_pos + 1 - window_start),
+                                        &opts, False, SSW_ANCHOR_REF_END)
+                hit.reference_end += window_start
+                if hit.reference_start >= 0:
+                    hit.reference_start += window_start
+                hit_start = hit.reference_start if hit.reference_start >= 0 else end_pos
+                # the window can hold a better hit than the one ending here, and
+                # that one was already taken or turned down
+                if (hit.reference_end != end_pos or
+                    any(hit_start <= end and start <= end_pos
+                        for start, end in zip(starts, ends))):
+                    continue
+                hits.append(hit)
+                starts.append(hit_start)
+                ends.append(end_pos)
+        for j in range(len(hits)):
+            (<Alignment> hits[j]).sub_optimal_score = \
+                (<Alignment> hits[j + 1]).optimal_score if j + 1 < len(hits) else 0
+        return hits
+    # end def
+
+    def align_tiled(self,
+        int gap_open = 3,
+        int gap_extension = 1,
+        Py_ssize_t start_idx = 0,
+        Py_ssize_t end_idx = 0,
+        str mode = 'cigar',
+        Py_ssize_t tile_length = 1 << 20,
+        overlap: int = None,
+        threads: int = 1) -> Alignment:
+        '''Align the read to a long reference in overlapping tiles, keeping
+        memory bounded by the tile length instead of the reference length.
+        Tiles overlap by more than any alignment of the read can span, so
+        the result is the same as that of :meth:`align`, including
+        `sub_optimal_score`
+
+        Args:
+            gap_open (int):         penalty for gap_open. default 3
+            gap_extension (int):    penalty for gap_extension. default 1
+            start_idx (Py_ssize_t): index to start search. default 0
+            end_idx (Py_ssize_t):   index to end search. default 0 means use
+                                    whole reference length
+            mode (str):             as for :meth:`align`. default 'cigar'
+            tile_length (Py_ssize_t): reference bases per tile. default 1 Mb
+            overlap (int):          reference bases shared by neighbouring
+                                    tiles.  default None computes the
+                                    longest reference span an alignment of
+                                    the read can have, which needs a
+                                    positive ``gap_extension``
+            threads (int):          number of threads to scan tiles with, as
+                                    for :meth:`align_batch`. default 1
+
+        Returns:
+            Alignment as for :meth:`align`
+
+        Raises:
+            ValueError
+        '''
+        cdef int32_t search_length = self.searchLength_c(start_idx, end_idx)
+        cdef align_opts_t opts
+        cdef _TileJob job
+        cdef ReadProfile read_profile = self.read_profile
+        cdef Py_ssize_t k, num_tiles, failed
+        cdef int64_t best_pos, window_start
+        cdef int32_t best, mask_len
+        cdef uint16_t* column = NULL
+        cdef Alignment out
+
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        if read_profile is None:
+            raise ValueError("Must set profile first")
+        align_opts_c(mode, None, None, &opts)
+        if overlap is None:
+            overlap = self.alignSpan_c(gap_open, gap_extension)
+            if overlap < 0:
+                raise ValueError("overlap must be given when gap_extension is 0")
+        if tile_length <= overlap:
+            raise ValueError("tile_length must be larger than overlap: {}".format(overlap))
+        if search_length <= tile_length:
+            return self.align(gap_open, gap_extension, start_idx, end_idx, mode)
+
+        job = _TileJob()
+        job.profile = read_profile.profile
+        job.ref_arr = self.ref_arr + start_idx
+        job.ref_length = search_length
+        job.tile_length = <int32_t> tile_length
+        job.step = tile_length - overlap
+        job.overlap = overlap
+        job.gap_open = gap_open
+        job.gap_extension = gap_extension
+        job.skip_start = job.skip_end = 0
+        num_tiles = (search_length - overlap + job.step - 1) // job.step
+        job.best = np.zeros(num_tiles, dtype=np.int32)
+        job.best_pos = np.zeros(num_tiles, dtype=np.int64)
+
+        self.in_use += 1
+        try:
+            failed = run_batch_job(job, num_tiles, _num_threads(threads))
+            if failed >= 0:
+                raise ValueError("Alignment score overflowed the 8 bit kernel, "
+                                "use score_size='word' or 'auto'")
+            best = 0
+            best_pos = -1
+            for k in range(num_tiles):
+                if job.best[k] > best:
+                    best = job.best[k]
+                    best_pos = job.best_pos[k]
+
+            # align the best hit in a window just long enough to hold it
+            window_start = max(0, best_pos + 1 - overlap) if best > 0 else 0
+            out = self.align_c( gap_open, gap_extension,
+                                start_idx + window_start,
+                                <int32_t> min(overlap, search_length - window_start),
+                                &opts)
+
+            # rescan the tiles owning columns masked around the best one for
+            # the best column outside the mask.  The 8 bit kernel masks
+            # [end - mask_len, end + mask_len] and the 16 bit kernel, which
+            # align_c used if the profile has no byte part or the score
+            # saturated it, [end - mask_len, end + mask_len)
+            mask_len = self.read_length // 2
+            mask_len = 15 if mask_len < 15 else mask_len
+            job.skip_start = best_pos - mask_len
+            job.skip_end = best_pos + mask_len
+            if not (self.read_profile.score_size == SCORE_SIZE_WORD or
+                    best + self.bias >= 255):
+                job.skip_end += 1
+            column = <uint16_t*> malloc(tile_length*sizeof(uint16_t))
+            if column == NULL:
+                raise MemoryError('Out of Memory')
+            for k in range(num_tiles):
+                if (k*job.step + (overlap if k > 0 else 0) < job.skip_end and
+                    job.skip_start < k*job.step + tile_length):
+                    job.tile_c(k, column)
+            free(column)
+            column = NULL
+            best2 = max(job.best[k] for k in range(num_tiles)) if best > 0 else 0
+        finally:
+            free(column)
+            self.in_use -= 1
+        if best > 0:
+            out.sub_optimal_score = best2
+            out.reference_end += window_start
+            if out.reference_start >= 0:
+                out.reference_start += window_start
+        return out
+    # end def
+
+    def align_seeded(self,
+        int gap_open = 3,
+        int gap_extension = 1,
+        Py_ssize_t start_idx = 0,
+        Py_ssize_t end_idx = 0,
+        str mode = 'cigar',
+        int min_seeds = 1,
+        padding: int = None,
+        Py_ssize_t max_occurrences = 1000,
+        bint exhaustive = False) -> Alignment:
+        '''Align the read only to the windows of the reference around its
+        k-mer seeds, found with the index of :meth:`build_seed_index`.
+        Seeds on nearby diagonals are chained into one window padded on
+        both sides, and the best alignment of any window is returned, so an
+        alignment with no exact k-mer in common with the read, or with
+        gaps longer than the padding, can be missed
+
+        Args:
+            gap_open (int):         penalty for gap_open. default 3
+            gap_extension (int):    penalty for gap_extension. default 1
+            start_idx (Py_ssize_t): index to start search. default 0
+            end_idx (Py_ssize_t):   index to end search. default 0 means use
+                                    whole reference length
+            mode (str):             as for :meth:`align`. default 'cigar'
+            min_seeds (int):        seeds a window needs to be aligned.
+                                    default 1
+            padding (int):          reference bases added to each side of a
+                                    window, and the largest diagonal
+                                    distance of seeds in one window.
+                                    default None uses the read length
+            max_occurrences (Py_ssize_t): skip k-mers found more often than
+                                    this in the reference. default 1000
+            exhaustive (bool):      search the whole range with
+                                    :meth:`align` instead. default False
+
+        Returns:
+            Alignment as for :meth:`align`.  `sub_optimal_score` is the best
+            other score found in the windows.  With no window the score is
+            0 and the positions are -1
+
+        Raises:
+            ValueError
+        '''
+        cdef int32_t search_length = self.searchLength_c(start_idx, end_idx)
+        cdef align_opts_t opts
+        cdef ReadProfile read_profile = self.read_profile
+        cdef SeedIndex index = self.seed_index
+        cdef Alignment out, window_out
+        cdef int64_t[::1] windows
+        cdef Py_ssize_t i
+        cdef int64_t window_start
+
+        if exhaustive:
+            return self.align(gap_open, gap_extension, start_idx, end_idx, mode)
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        if read_profile is None:
+            raise ValueError("Must set profile first")
+        if index is None:
+            raise ValueError("call build_seed_index first")
+        align_opts_c(mode, None, None, &opts)
+        if padding is None:
+            padding = self.read_length
+        if padding < 0:
+            raise ValueError("padding must be >= 0")
+
+        windows = seed_windows_c(index, read_profile.read_arr, read_profile.read_length,
+                                start_idx, start_idx + search_length,
+                                min_seeds, padding, max_occurrences)
+        out = None
+        best2 = 0
+        for i in range(0, windows.shape[0], 2):
+            window_start = windows[i]
+            window_out = self.align_c(  gap_open, gap_extension, window_start,
+                                        <int32_t> (windows[i + 1] - window_start), &opts)
+            window_out.reference_end += window_start - start_idx
+            if window_out.reference_start >= 0:
+                window_out.reference_start += window_start - start_idx
+            if out is None or window_out.optimal_score > out.optimal_score:
+                if out is not None:
+                    best2 = max(best2, out.optimal_score)
+                best2 = max(best2, window_out.sub_optimal_score)
+                out = window_out
+            else:
+                best2 = max(best2, window_out.optimal_score)
+        if out is None:
+            return Alignment(None, 0, 0, -1, -1, -1, -1)
+        out.sub_optimal_score = best2
         return out
     # end def
 
+    def align_batch(self,
+        reads,
+        int gap_open = 3,
+        int gap_extension = 1,
+        Py_ssize_t start_idx = 0,
+        Py_ssize_t end_idx = 0,
+        offsets = None,
+        threads: int = 1,
+        bint encoded = False,
+        str mode = 'cigar',
+        score_filter: int = None,
+        distance_filter: int = None) -> BatchAlignment:
+        '''Align many reads to the reference in a single call.  Reads are
+        encoded, profiled and aligned in C without building a Python object
+        per read.  The read set with :meth:`setRead` is left untouched
+
+        Args:
+            reads:                  sequence of String-like or buffer
+                                    protocol reads, or a single buffer of
+                                    concatenated reads such as a NumPy uint8
+                                    array when ``offsets`` is given
+            gap_open (int):         penalty for gap_open. default 3
+            gap_extension (int):    penalty for gap_extension. default 1
+            start_idx (Py_ssize_t): index to start search. default 0
+            end_idx (Py_ssize_t):   index to end search. default 0 means use
+                                    whole reference length
+            offsets:                optional sequence of ``len(reads) + 1``
+                                    offsets into a concatenated ``reads``
+                                    buffer. read ``i`` is
+                                    ``reads[offsets[i]:offsets[i + 1]]``
+            threads (int):          number of threads to align with.  The
+                                    GIL is released while aligning and each
+                                    thread works on its own chunk of reads.
+                                    0 or None uses every core. default 1
+            encoded (bool):         reads already hold the codes 0-4 for A,
+                                    C, G, T and N and are profiled in place.
+                                    default False
+            mode (str):             ``'score'``, ``'start'`` or ``'cigar'``
+                                    as for :meth:`align`. default 'cigar'
+            score_filter (int):     as for :meth:`align`. default None
+            distance_filter (int):  as for :meth:`align`. default None
+
+        Returns:
+            BatchAlignment of NumPy arrays with one entry per read for
+            `optimal_score`, `sub_optimal_score`, `reference_start`,
+            `reference_end`, `read_start` and `read_end`.  The packed BAM
+            style CIGAR operations of all reads are concatenated in `cigars`
+            and read ``i`` owns ``cigars[cigar_offsets[i]:cigar_offsets[i + 1]]``
+
+        Raises:
+            ValueError
+        '''
+        cdef int32_t search_length = self.searchLength_c(start_idx, end_idx)
+        cdef align_opts_t opts
+        cdef _ReadPointers pointers
+
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        align_opts_c(mode, score_filter, distance_filter, &opts)
+        pointers = _ReadPointers(reads, offsets)
+        return self.alignReads_c(   pointers.ptrs,
+                                    pointers.lengths,
+                                    pointers.num_reads,
+                                    start_idx,
+                                    search_length,
+                                    gap_open,
+                                    gap_extension,
+                                    _num_threads(threads),
+                                    encoded,
+                                    &opts)
+    # end def
+
+    def score_batch(self,
+        reads,
+        int gap_open = 3,
+        int gap_extension = 1,
+        Py_ssize_t start_idx = 0,
+        Py_ssize_t end_idx = 0,
+        offsets = None,
+        threads: int = 1,
+        bint encoded = False) -> BatchScore:
+        '''Score many short reads against the reference at once.  Unlike
+        :meth:`align_batch`, which vectorizes along each read, different
+        reads are packed into the SIMD lanes and run against the reference
+        together, which is much faster for primers and other reads of a few
+        dozen bases.  Scores are exact for any gap penalties.  The read set
+        with :meth:`setRead` is left untouched
+
+        Args:
+            reads:                  reads as for :meth:`align_batch`
+            gap_open (int):         penalty for gap_open. default 3
+            gap_extension (int):    penalty for gap_extension. default 1
+            start_idx (Py_ssize_t): index to start search. default 0
+            end_idx (Py_ssize_t):   index to end search. default 0 means use
+                                    whole reference length
+            offsets:                as for :meth:`align_batch`
+            threads (int):          as for :meth:`align_batch`. default 1
+            encoded (bool):         as for :meth:`align_batch`. default False
+
+        Returns:
+            BatchScore of NumPy arrays with one entry per read for
+            `optimal_score`, `reference_end` and `read_end`.
+            `reference_end` is -1 for reads scoring 0
+
+        Raises:
+            ValueError
+        '''
+        cdef int32_t search_length = self.searchLength_c(start_idx, end_idx)
+        cdef _ReadPointers pointers
+        cdef _ScoreJob job = _ScoreJob()
+        cdef Py_ssize_t i, num_reads
+        cdef uint16_t[::1] score
+        cdef int32_t[::1] ref_end, read_end
+
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        pointers = _ReadPointers(reads, offsets)
+        num_reads = pointers.num_reads
+        for i in range(num_reads):
+            if pointers.lengths[i] == 0:
+                raise ValueError("read {} is empty".format(i))
+            if encoded and not is_encoded_c(<const uint8_t*> pointers.ptrs[i], pointers.lengths[i]):
+                raise ValueError("encoded read {} may only hold the codes 0 to 4".format(i))
+
+        score = np.zeros(num_reads, dtype=np.uint16)
+        ref_end = np.zeros(num_reads, dtype=np.int32)
+        read_end = np.zeros(num_reads, dtype=np.int32)
+        if num_reads == 0:
+            return BatchScore(score.base, ref_end.base, read_end.base)
+
+        job.score_matrix = self.score_matrix
+        job.read_ptrs = pointers.ptrs
+        job.read_lengths = pointers.lengths
+        job.ref_arr = self.ref_arr + start_idx
+        job.ref_length = search_length
+        job.gap_open = gap_open
+        job.gap_extension = gap_extension
+        job.encoded = encoded
+        job.score = &score[0]
+        job.ref_end = &ref_end[0]
+        job.read_end = &read_end[0]
+
+        self.in_use += 1
+        try:
+            if run_batch_job(job, num_reads, _num_threads(threads)) >= 0:
+                raise MemoryError('Out of Memory')
+        finally:
+            self.in_use -= 1
+        return BatchScore(score.base, ref_end.base, read_end.base)
+    # end def
+
+    cdef object alignReads_c(self,
+        const char** read_ptrs,
+        const int32_t* read_lengths,
+        Py_ssize_t num_reads,
+        Py_ssize_t start_idx,
+        int32_t search_length,
+        int gap_open,
+        int gap_extension,
+        int num_threads,
+        bint encoded,
+        const align_opts_t* opts):
+        """Align ``num_reads`` reads held in C buffers against the
+        reference
+
+        Returns:
+            BatchAlignment
+
+        Raises:
+            ValueError
+        """
+        cdef Py_ssize_t i, failed, max_length = 0
+        cdef _BatchJob job = _BatchJob()
+        cdef batch_out_t* out = &job.out
+        cdef uint16_t[::1] score1, score2
+        cdef int32_t[::1] ref_begin1, ref_end1, read_begin1, read_end1
+        cdef uint32_t[::1] cigars
+        cdef int64_t[::1] cigar_offsets
+        cdef int32_t[::1] cigar_len
+        cdef uint64_t start = ssw_clock_ns() if self.stats_enabled else 0
+
+        for i in range(num_reads):
+            if read_lengths[i] == 0:
+                raise ValueError("read {} is empty".format(i))
+            if encoded and not is_encoded_c(<const uint8_t*> read_ptrs[i], read_lengths[i]):
+                raise ValueError("encoded read {} may only hold the codes 0 to 4".format(i))
+            if read_lengths[i] > max_length:
+                max_length = read_lengths[i]
+
+        score1 = np.zeros(num_reads, dtype=np.uint16)
+        score2 = np.zeros(num_reads, dtype=np.uint16)
+        ref_begin1 = np.zeros(num_reads, dtype=np.int32)
+        ref_end1 = np.zeros(num_reads, dtype=np.int32)
+        read_begin1 = np.zeros(num_reads, dtype=np.int32)
+        read_end1 = np.zeros(num_reads, dtype=np.int32)
+        cigar_len = np.zeros(num_reads, dtype=np.int32)
+        cigar_offsets = np.zeros(num_reads + 1, dtype=np.int64)
+
+        if num_reads == 0:
+            return BatchAlignment(
+                    score1.base, score2.base,
+                    ref_begin1.base, ref_end1.base,
+                    read_begin1.base, read_end1.base,
+                    np.zeros(0, dtype=np.uint32), cigar_offsets.base)
+
+        out.cigar = <uint32_t**> PyMem_Malloc(num_reads*sizeof(uint32_t*))
+        if out.cigar == NULL:
+            raise MemoryError('Out of Memory')
+        for i in range(num_reads):
+            out.cigar[i] = NULL
+
+        try:
+            out.score1 = &score1[0]
+            out.score2 = &score2[0]
+            out.ref_begin1 = &ref_begin1[0]
+            out.ref_end1 = &ref_end1[0]
+            out.read_begin1 = &read_begin1[0]
+            out.read_end1 = &read_end1[0]
+            out.cigar_len = &cigar_len[0]
+
+            job.score_matrix = self.score_matrix
+            job.read_ptrs = read_ptrs
+            job.read_lengths = read_lengths
+            job.max_length = max_length
+            job.ref_arr = self.ref_arr + start_idx
+            job.ref_length = search_length
+            job.gap_open = gap_open
+            job.gap_extension = gap_extension
+            job.encoded = encoded
+            job.opts = opts[0]
+            job.counting = start != 0
+            self.scoreSizeOpts_c(&job.opts)
+
+            self.in_use += 1
+            try:
+                failed = run_batch_job(job, num_reads, num_threads)
+            finally:
+                self.in_use -= 1
+                if start:
+                    self.countKernels_c(&job.stats)
+                    self.countProfiles_c(num_reads)
+                    self.countCall_c(STATS_ALIGN_BATCH, start, num_reads)
+            if failed >= 0:
+                if self.score_size == 'byte':
+                    raise ValueError("Alignment score of read {} overflowed the 8 bit "
+                                    "kernel, use score_size='word' or 'auto'".format(failed))
+                raise ValueError("Problem Running alignment of read {}, see stdout".format(failed))
+
+            for i in range(num_reads):
+                if read_lengths[i] <= job.opts.byte_max_length:
+                    self.tallyScoreSize_c(job.opts.short_score_size, read_lengths[i], score1[i])
+                else:
+                    self.tallyScoreSize_c(job.opts.long_score_size, read_lengths[i], score1[i])
+                cigar_offsets[i + 1] = cigar_offsets[i] + cigar_len[i]
+            cigars = np.empty(cigar_offsets[num_reads], dtype=np.uint32)
+            for i in range(num_reads):
+                if cigar_len[i] > 0:
+                    memcpy(&cigars[cigar_offsets[i]], out.cigar[i],
+                        cigar_len[i]*sizeof(uint32_t))
+        finally:
+            for i in range(num_reads):
+                free(out.cigar[i])
+            PyMem_Free(out.cigar)
+
+        return BatchAlignment(
+                score1.base, score2.base,
+                ref_begin1.base, ref_end1.base,
+                read_begin1.base, read_end1.base,
+                cigars.base, cigar_offsets.base)
+    # end def
+
+    cdef int32_t searchLength_c(self,
+        Py_ssize_t start_idx,
+        Py_ssize_t end_idx) except -1:
+        """Validate a ``[start_idx, end_idx)`` search range of the reference
+
+        Returns:
+            the number of reference bases to search
+        """
+        return search_length_c(self.ref_length, start_idx, end_idx)
+    # end def
+
     cdef int buildDNAScoreMatrix(self,
         const uint8_t match_score,
         const uint8_t mismatch_penalty,
         int8_t* matrix) except -1:
+        """See :func:`dna_score_matrix_c`
         """
-        mismatch_penalty should be positive
-
-        The score matrix looks like
-                            A,  C,  G,  T,  N
-        score_matrix  = {   2, -2, -2, -2,  0, // A
-                           -2,  2, -2, -2,  0, // C
-                           -2, -2,  2, -2,  0, // G
-                           -2, -2, -2,  2,  0, // T
-                            0,  0,  0,  0,  0  // N
-                        }
-        """
-        cdef Py_ssize_t i, j
-        cdef Py_ssize_t idx = 0;
-        for i in range(4):
-            for j in range(4):
-                if i == j:
-                    matrix[idx] =  <int8_t> match_score
-                else:
-                    matrix[idx] = <int8_t> (-mismatch_penalty)
-                inc(idx)
-            matrix[idx] = 0;
-            inc(idx)
-        for i in range(5):
-            matrix[inc(idx)] = 0
-        return 0
+        return dna_score_matrix_c(match_score, mismatch_penalty, matrix)
     # end def
 # end class
 
-def force_align( read: STR_T,
-                reference: STR_T,
-                force_overhang: bool = False,
-                aligner: SSW = None) -> Alignment:
-    '''Enforces no gaps by raising the ``gap_open`` penalty
+cdef class EditAligner:
+    """Unit cost alignment, where a mismatch, an insertion and a deletion
+    each cost 1, for checks such as barcode demultiplexing that only need
+    the edit distance.  Runs Myers' bit-vector algorithm, 64 read bases per
+    machine word, instead of the affine gap kernels of :class:`SSW`, and
+    returns the same :class:`Alignment` with the edit distance as
+    `optimal_score`, so lower is better.  Bases are coded as for
+    :class:`SSW` and N matches nothing, not even N
+    """
+    cdef object read
+    cdef int8_t* read_arr
+    cdef Py_ssize_t read_length
 
-    Args:
-        read:
-        reference:
-        force_overhang: Make sure only one end overhangs
-        aligner: pass an existing :class:`SSW` object
-    Raises:
-        ValueError for no solution found
+    cdef object reference
+    cdef int8_t* ref_arr
+    cdef Py_ssize_t ref_length
+
+    def __cinit__(self, *args, **kwargs):
+        self.read_arr = NULL
+        self.ref_arr = NULL
+        self.read = None
+        self.reference = None
+    # end def
+
+    def __dealloc__(self):
+        PyMem_Free(self.read_arr)
+        PyMem_Free(self.ref_arr)
+    # end def
+
+    cdef int8_t* encode_c(self, seq, Py_ssize_t* length) except? NULL:
+        """Copy ``seq`` into a new array of 0-4 codes
+        """
+        cdef const char* cstr
+        cdef int8_t* arr
+        seq_buffer = c_util.obj_to_buffer(seq)
+        cstr = c_util.buffer_to_cstr_len(seq_buffer, length)
+        arr = <int8_t*> PyMem_Malloc(length[0] + 1)
+        if arr == NULL:
+            raise MemoryError('Out of Memory')
+        dnaToInt8(cstr, arr, length[0])
+        return arr
+    # end def
+
+    def setRead(self, read):
+        """Set the query read string
+
+        Args:
+            read:  String-like (str or bytestring) that represents the read,
+                    or any object supporting the buffer protocol with 1 byte
+                    items
+        """
+        cdef Py_ssize_t read_length
+        cdef int8_t* read_arr = self.encode_c(read, &read_length)
+        PyMem_Free(self.read_arr)
+        self.read_arr = read_arr
+        self.read_length = read_length
+        self.read = read
+    # end def
+
+    def setReference(self, reference):
+        """Set the query reference string
+
+        Args:
+            reference:  String-like (str or bytestring) that represents the
+                reference sequence, or any object supporting the buffer
+                protocol with 1 byte items
+        """
+        cdef Py_ssize_t ref_length
+        cdef int8_t* ref_arr = self.encode_c(reference, &ref_length)
+        PyMem_Free(self.ref_arr)
+        self.ref_arr = ref_arr
+        self.ref_length = ref_length
+        self.reference = reference
+    # end def
+
+    def align(self,
+        Py_ssize_t start_idx = 0,
+        Py_ssize_t end_idx = 0,
+        str mode = 'cigar',
+        str method = 'search') -> Alignment:
+        """Align the whole read to the reference by edit distance
+
+        Args:
+            start_idx (Py_ssize_t): index to start search. default 0
+            end_idx (Py_ssize_t):   index to end search. default 0 means
+                                    use whole reference length
+            mode (str):             ``'score'``, ``'start'`` or ``'cigar'``
+                                    as for :meth:`SSW.align`. default 'cigar'
+            method (str):           ``'global'`` aligns the read to the
+                                    whole searched reference, ``'search'`` to
+                                    the stretch of it closest in edit
+                                    distance, the first one on a tie.
+                                    default 'search'
+
+        Returns:
+            Alignment with the edit distance as `optimal_score`,
+            `sub_optimal_score` 0 and the read spanning `read_start` 0 to
+            `read_end` ``len(read) - 1``.  Reference positions are relative
+            to `start_idx`, as for :meth:`SSW.align`, and `reference_end` is
+            -1 if no reference was searched.  The CIGAR uses M for matches
+            and mismatches alike and may start or end with I or D
+
+        Raises:
+            ValueError
+        """
+        cdef int32_t search_length
+        cdef align_opts_t opts
+        cdef edit_result_t result
+        cdef int emode, status
+        cdef Alignment out
+
+        if self.read is None:
+            raise ValueError("call setRead first")
+        if self.reference is None:
+            raise ValueError("call setReference first")
+        if method not in EDIT_METHODS:
+            raise ValueError("method must be one of {}, not {!r}".format(EDIT_METHODS, method))
+        search_length = search_length_c(self.ref_length, start_idx, end_idx)
+        align_opts_c(mode, None, None, &opts)
+        emode = EDIT_GLOBAL if method == 'global' else EDIT_SEARCH
+        with nogil:
+            status = edit_align(self.read_arr,
+                                self.read_length,
+                                &self.ref_arr[start_idx],
+                                search_length,
+                                4,
+                                emode,
+                                opts.flag,
+                                &result)
+        if status != 0:
+            raise MemoryError('Out of Memory')
+        out = Alignment.__new__(Alignment)
+        out.strand = '+'
+        if result.cigar != NULL:
+            out.cigar_bytes = (<char*> result.cigar)[:result.cigar_len*sizeof(uint32_t)]
+            free(result.cigar)
+        out.optimal_score = result.distance
+        out.sub_optimal_score = 0
+        out.reference_start = result.ref_begin
+        out.reference_end = result.ref_end
+        out.read_start = 0 if opts.flag else -1
+        out.read_end = self.read_length - 1
+        return out
+    # end def
+# end class
+
+SIMD_BACKENDS = ('sse2', 'avx2', 'avx512')
+
+# resolve the backend once up front rather than on the first alignment
+ssw_simd_backend()
+
+def simd_backend() -> str:
+    '''Name of the instruction set the striped kernels run with, one of
+    ``'sse2'``, ``'avx2'`` or ``'avx512'``.  The widest one the CPU supports
+    is picked at import time, unless the ``SSW_SIMD`` environment variable
+    names another supported one.  Reads shorter than four vectors of it
+    step down to the next narrower one
+
+    Returns:
+        backend name
     '''
-    a: SSW = SSW() if aligner is None else aligner
-    a.setRead(read)
-    a.setReference(reference)
-    len_x: int = len(read)
-    # set the gap_open penalty high to drop all splits in alignment
-    # pick the first max hit
-    res: Alignment = a.align(gap_open=len_x)
+    return ssw_simd_backend().decode('ascii')
+# end def
+
+def set_simd_backend(name: str):
+    '''Run read profiles built from now on with another instruction set.
+    Profiles already built, including cached ones, keep their backend
+
+    Args:
+        name: one of ``'sse2'``, ``'avx2'`` or ``'avx512'``
+
+    Raises:
+        ValueError: unknown backend or not supported by this CPU
+    '''
+    if name not in SIMD_BACKENDS:
+        raise ValueError("backend must be one of {}, not {!r}".format(SIMD_BACKENDS, name))
+    if ssw_simd_set_backend(name.encode('ascii')) != 0:
+        raise ValueError("this CPU does not support {}".format(name))
+# end def
+
+cdef Alignment force_align_c(const int8_t* score_matrix,
+                            const char* read_cstr,
+                            Py_ssize_t read_length,
+                            const char* ref_cstr,
+                            Py_ssize_t ref_length,
+                            int8_t* seq_arr):
+    """Best ungapped alignment of a read to a reference.  ``seq_arr``
+    must hold ``read_length + ref_length`` codes
+    """
+    cdef s_align* result
+    cdef Alignment out
+    cdef int32_t mask_len = read_length // 2
+    mask_len = 15 if mask_len < 15 else mask_len
+
+    dnaToInt8(read_cstr, seq_arr, <int32_t> read_length)
+    dnaToInt8(ref_cstr, seq_arr + read_length, <int32_t> ref_length)
+    with nogil:
+        result = ssw_ungapped(  seq_arr, <int32_t> read_length,
+                                seq_arr + read_length, <int32_t> ref_length,
+                                score_matrix, 5, mask_len)
+    if result == NULL:
+        raise MemoryError('Out of Memory')
+    out = make_alignment(result)
+    align_destroy(result)
+    return out
+# end def
+
+cdef str force_error_c(Alignment res, Py_ssize_t ref_length, bint force_overhang):
+    """Why a :func:`force_align` result is rejected, or None
+    """
     if res.optimal_score < 4:
-        raise ValueError("No solution found")
+        return "No solution found"
     if force_overhang:
         # read must align to either the beginning or end of the reference string
         if (res.reference_start != 0 or
-            res.reference_end != len(reference) - 1):
-            raise ValueError("Read does not align to one overhang")
+            res.reference_end != ref_length - 1):
+            return "Read does not align to one overhang"
+    return None
+# end def
+
+cdef int force_matrix_c(SSW aligner, int8_t* score_matrix) except -1:
+    """Fill ``score_matrix`` with the scores of ``aligner``, or the default
+    ones of :class:`SSW` if it is None
+    """
+    if aligner is None:
+        dna_score_matrix_c(2, 2, score_matrix)
+    elif aligner.score_matrix == NULL:
+        raise ValueError("aligner is not initialized")
+    else:
+        memcpy(score_matrix, aligner.score_matrix, 25*sizeof(int8_t))
+    return 0
+# end def
+
+def force_align( read: STR_T,
+                reference: STR_T,
+                force_overhang: bool = False,
+                aligner: SSW = None) -> Alignment:
+    '''Align without gaps: the best scoring diagonal stretch of the read
+    and the reference, picking the first one on a tie
+
+    Args:
+        read:
+        reference:
+        force_overhang: Make sure only one end overhangs
+        aligner: take the match and mismatch scores of an existing
+            :class:`SSW` object.  Its read and reference are left alone
+
+    Returns:
+        Alignment with a single ``M`` operation.  `sub_optimal_score` is the
+        best score of another diagonal stretch ending more than
+        ``max(15, len(read)//2)`` bases from `reference_end`, so it never
+        counts a gapped alignment.  Before the ungapped engine it came from
+        the column maxima of the gapped kernel, which can be higher
+
+    Raises:
+        ValueError for no solution found
+    '''
+    cdef int8_t score_matrix[25]
+    cdef Py_ssize_t read_length, ref_length
+    cdef const char* read_cstr
+    cdef const char* ref_cstr
+    cdef int8_t* seq_arr
+
+    force_matrix_c(aligner, score_matrix)
+    read_buffer = c_util.obj_to_buffer(read)
+    read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+    ref_buffer = c_util.obj_to_buffer(reference)
+    ref_cstr = c_util.buffer_to_cstr_len(ref_buffer, &ref_length)
+    seq_arr = <int8_t*> PyMem_Malloc(read_length + ref_length + 1)
+    if seq_arr == NULL:
+        raise MemoryError('Out of Memory')
+    try:
+        res = force_align_c(score_matrix, read_cstr, read_length, ref_cstr, ref_length, seq_arr)
+    finally:
+        PyMem_Free(seq_arr)
+    err = force_error_c(res, ref_length, force_overhang)
+    if err is not None:
+        raise ValueError(err)
     return res
 # end def
 
+def force_align_batch(  reads,
+                        references,
+                        force_overhang: bool = False,
+                        aligner: SSW = None) -> list:
+    ''':func:`force_align` each read to its reference, reusing one
+    encoding buffer for all pairs
+
+    Args:
+        reads: sequence of reads
+        references: sequence of references, one per read
+        force_overhang: Make sure only one end overhangs
+        aligner: take the match and mismatch scores of an existing
+            :class:`SSW` object.  Its read and reference are left alone
+
+    Returns:
+        list of one Alignment per pair, or None for a pair that
+        :func:`force_align` finds no solution for
+
+    Raises:
+        ValueError: ``reads`` and ``references`` differ in length
+    '''
+    cdef int8_t score_matrix[25]
+    cdef Py_ssize_t read_length, ref_length, capacity = 0
+    cdef const char* read_cstr
+    cdef const char* ref_cstr
+    cdef int8_t* seq_arr = NULL
+    cdef int8_t* grown
+    cdef Alignment res
+    cdef list out = []
+
+    if len(reads) != len(references):
+        raise ValueError("got {} reads but {} references".format(len(reads), len(references)))
+    force_matrix_c(aligner, score_matrix)
+    try:
+        for read, reference in zip(reads, references):
+            read_buffer = c_util.obj_to_buffer(read)
+            read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+            ref_buffer = c_util.obj_to_buffer(reference)
+            ref_cstr = c_util.buffer_to_cstr_len(ref_buffer, &ref_length)
+            if read_length + ref_length + 1 > capacity:
+                capacity = 2*(read_length + ref_length + 1)
+                grown = <int8_t*> PyMem_Realloc(seq_arr, capacity)
+                if grown == NULL:
+                    raise MemoryError('Out of Memory')
+                seq_arr = grown
+            res = force_align_c(score_matrix, read_cstr, read_length, ref_cstr, ref_length, seq_arr)
+            out.append(res if force_error_c(res, ref_length, force_overhang) is None else None)
+    finally:
+        PyMem_Free(seq_arr)
+    return out
+# end def
+
 def format_force_align(  read: STR_T,
                         reference: STR_T,
-                        alignment: Alignment,
+                        alignment,
                         do_print: bool = False):
     '''Does not truncate strings
 
@@ -429,3 +3223,951 @@ def format_force_align(  read: STR_T,
         print(read_out)
     return ref_out, read_out
 # end def
+
+def cigar_to_str(cigar) -> str:
+    '''Convert packed BAM style CIGAR operations, as found in
+    :attr:`BatchAlignment.cigars`, to a CIGAR string
+
+    Args:
+        cigar: sequence of uint32 CIGAR operations
+
+    Returns:
+        CIGAR string
+    '''
+    cdef uint32_t op
+    return ''.join(["%d%s" % (<int> cigar_int_to_len(op), chr(cigar_int_to_op(op)))
+                    for op in cigar])
+# end def
+
+# bytes render_alignments collects before writing them to its file
+RENDER_CHUNK = 1 << 20
+
+cdef object render_buffer_c(seq):
+    """Buffer of the bases of a reference or read of
+    :func:`render_alignments`, decoding an :class:`EncodedReference`
+    """
+    if isinstance(seq, EncodedReference):
+        return (<EncodedReference> seq).decode().encode('ascii')
+    return c_util.obj_to_buffer(seq)
+# end def
+
+cdef int render_write_c(out, const char* buf, int64_t length) except -1:
+    """Write ``length`` rendered bytes to the text or binary file ``out``
+    """
+    chunk = buf[:length]
+    if isinstance(out, io.TextIOBase):
+        out.write(chunk.decode('utf8'))
+    else:
+        out.write(chunk)
+    return 0
+# end def
+
+def render_alignments(  alignments,
+                        references,
+                        reads,
+                        int width=60,
+                        Py_ssize_t start_idx=0,
+                        out=None,
+                        bint as_bytes=False,
+                        str labels='target'):
+    '''Render alignments BLAST style, as :meth:`SSW.printResult` does.
+    Each block is built into one buffer in C straight from the packed CIGAR.
+    An alignment with a zero score or no reference start, as :meth:`SSW.align`
+    returns when nothing aligns, gets just its scores and ends
+
+    Args:
+        alignments: an :class:`Alignment`, or a sequence of them or of
+            tuples of their fields
+        references: the reference of all the alignments, or a list or tuple
+            of one per alignment.  String-like, any 1 byte buffer or an
+            :class:`EncodedReference`
+        reads: the read of all the alignments, or a list or tuple of one per
+            alignment, as passed to :meth:`SSW.setRead`.  ``'-'`` strand
+            alignments are rendered against its reverse complement
+        width (int): alignment columns per block. default 60
+        start_idx (Py_ssize_t): the ``start_idx`` the alignments were
+            aligned with, which their reference positions are relative to.
+            default 0
+        out: text or binary file object to write the rendering to instead
+            of returning it. default None
+        as_bytes (bool): return bytes rather than str. default False
+        labels (str): ``'target'`` for the ``Target:``/``Query:`` rows and
+            ``target_begin:`` style fields of :meth:`SSW.printResult`, or
+            ``'reference'`` for the ``Refer:``/``Read:`` rows and
+            ``reference_start:`` style fields of :func:`ssw.printer.printer`.
+            default ``'target'``
+
+    Returns:
+        the rendering as str or bytes, or None if ``out`` is given
+
+    Raises:
+        ValueError
+    '''
+    cdef Alignment alignment
+    cdef s_align result
+    cdef const char* ref_cstr = NULL
+    cdef const char* read_cstr = NULL
+    cdef Py_ssize_t ref_length = 0, read_length = 0, i, num
+    cdef int64_t size, used = 0, capacity = 0
+    cdef char* buf = NULL
+    cdef char* grown
+    cdef bint ref_per_alignment = isinstance(references, (list, tuple))
+    cdef bint read_per_alignment = isinstance(reads, (list, tuple))
+    cdef int8_t label_set
+
+    if width < 1:
+        raise ValueError("width must be >= 1")
+    if labels == 'target':
+        label_set = SSW_LABELS_TARGET
+    elif labels == 'reference':
+        label_set = SSW_LABELS_REFERENCE
+    else:
+        raise ValueError("labels must be 'target' or 'reference', not {!r}".format(labels))
+    if start_idx < 0:
+        raise ValueError("start_idx must be >= 0")
+    if isinstance(alignments, Alignment):
+        alignments = [alignments]
+    num = len(alignments)
+    if ref_per_alignment and len(references) != num:
+        raise ValueError("got {} references for {} alignments".format(len(references), num))
+    if read_per_alignment and len(reads) != num:
+        raise ValueError("got {} reads for {} alignments".format(len(reads), num))
+    if not ref_per_alignment:
+        ref_buffer = render_buffer_c(references)
+        ref_cstr = c_util.buffer_to_cstr_len(ref_buffer, &ref_length)
+    if not read_per_alignment:
+        read_buffer = render_buffer_c(reads)
+        read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+    try:
+        for i in range(num):
+            item = alignments[i]
+            alignment = item if isinstance(item, Alignment) else Alignment(*item)
+            if ref_per_alignment:
+                ref_buffer = render_buffer_c(references[i])
+                ref_cstr = c_util.buffer_to_cstr_len(ref_buffer, &ref_length)
+            if read_per_alignment:
+                read_buffer = render_buffer_c(reads[i])
+                read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+            if alignment.cigar_array is not None:
+                result.cigar = <uint32_t*> <char*> alignment.cigar_bytes
+                result.cigarLen = len(alignment.cigar_bytes) // sizeof(uint32_t)
+            else:
+                result.cigar = NULL
+                result.cigarLen = 0
+            result.score1 = alignment.optimal_score
+            result.score2 = alignment.sub_optimal_score
+            result.ref_begin1 = alignment.reference_start
+            result.ref_end1 = alignment.reference_end
+            result.read_begin1 = alignment.read_start
+            result.read_end1 = alignment.read_end
+            size = -1
+            if start_idx <= ref_length:
+                size = ssw_render_size(&result, ref_length - start_idx, read_length, width)
+            if size < 0:
+                raise ValueError("alignment {} runs past its reference or read".format(i))
+            if used + size > capacity:
+                capacity = max(2*capacity, used + size)
+                grown = <char*> PyMem_Realloc(buf, capacity)
+                if grown == NULL:
+                    raise MemoryError('Out of Memory')
+                buf = grown
+            used += ssw_render( &result,
+                                &ref_cstr[start_idx],
+                                read_cstr,
+                                read_length,
+                                alignment.strand == '-',
+                                width,
+                                label_set,
+                                &buf[used])
+            if out is not None and used >= RENDER_CHUNK:
+                render_write_c(out, buf, used)
+                used = 0
+        if out is not None:
+            render_write_c(out, buf, used)
+            return None
+        rendered = buf[:used]
+        return rendered if as_bytes else rendered.decode('utf8')
+    finally:
+        PyMem_Free(buf)
+# end def
+
+cdef class _SeqReader:
+    """Streams FASTA/FASTQ records, gzipped or plain, in chunks using the
+    bundled kseq parser.  Records of the current chunk stay in C buffers
+    """
+    cdef seq_reader_t* reader
+    cdef seq_chunk_t chunk
+    cdef const char** seq_ptrs
+    cdef int32_t* seq_lengths
+    cdef object path
+
+    def __cinit__(self, path):
+        self.reader = NULL
+        self.seq_ptrs = NULL
+        self.seq_lengths = NULL
+        seq_chunk_init(&self.chunk)
+        self.path = path
+        self.reader = seq_reader_open(os.fsencode(path))
+        if self.reader == NULL:
+            raise OSError("Could not open {}".format(path))
+    # end def
+
+    def __dealloc__(self):
+        seq_reader_close(self.reader)
+        seq_chunk_destroy(&self.chunk)
+        PyMem_Free(self.seq_ptrs)
+        PyMem_Free(self.seq_lengths)
+    # end def
+
+    cdef int32_t readChunk_c(self, int32_t max_records, int64_t max_bases) except -1:
+        """Read the next chunk of records, filling :attr:`seq_ptrs` and
+        :attr:`seq_lengths`
+
+        Returns:
+            number of records read, 0 at the end of the file
+        """
+        cdef int32_t i, n
+        with nogil:
+            n = seq_reader_read_chunk(self.reader, &self.chunk, max_records, max_bases)
+        if n == -2:
+            raise ValueError("Truncated quality string in {}".format(self.path))
+        elif n < 0:
+            raise MemoryError('Out of Memory')
+        PyMem_Free(self.seq_ptrs)
+        PyMem_Free(self.seq_lengths)
+        self.seq_ptrs = <const char**> PyMem_Malloc((n + 1)*sizeof(char*))
+        self.seq_lengths = <int32_t*> PyMem_Malloc((n + 1)*sizeof(int32_t))
+        if self.seq_ptrs == NULL or self.seq_lengths == NULL:
+            raise MemoryError('Out of Memory')
+        for i in range(n):
+            self.seq_ptrs[i] = &self.chunk.seqs[self.chunk.seq_off[i]]
+            self.seq_lengths[i] = <int32_t> (self.chunk.seq_off[i + 1] - self.chunk.seq_off[i])
+        return n
+    # end def
+
+    cdef str name_c(self, int32_t i):
+        return self.chunk.names[self.chunk.name_off[i]:self.chunk.name_off[i + 1]].decode('utf8')
+
+    cdef bytes seq_c(self, int32_t i):
+        return self.chunk.seqs[self.chunk.seq_off[i]:self.chunk.seq_off[i + 1]]
+
+    cdef int checkChunk_c(self, int32_t n) except -1:
+        """Raise a ValueError naming the first empty query of the chunk
+        """
+        cdef int32_t i
+        for i in range(n):
+            if self.seq_lengths[i] == 0:
+                raise ValueError("Query {} is empty".format(self.name_c(i)))
+        return 0
+# end class
+
+def align_file( query_path,
+                target_path,
+                int match_score=2,
+                int mismatch_penalty=2,
+                int gap_open=3,
+                int gap_extension=1,
+                int chunk_size=4096,
+                threads: int = 1,
+                str score_size='both'):
+    '''Align every read of a FASTA/FASTQ file to every sequence of a
+    target FASTA/FASTQ file.  Both files may be gzipped.  Targets are loaded
+    once, queries are parsed in C and aligned ``chunk_size`` records at a
+    time so memory use stays bounded whatever the size of the query file
+
+    Args:
+        query_path:             path of the query reads
+        target_path:            path of the target (reference) sequences,
+                                or of an index written by
+                                :func:`build_reference_index`
+        match_score (int):      for scoring matches. default 2
+        mismatch_penalty (int): for scoring mismatches. default 2
+        gap_open (int):         penalty for gap_open. default 3
+        gap_extension (int):    penalty for gap_extension. default 1
+        chunk_size (int):       number of query records aligned per chunk.
+                                default 4096
+        threads (int):          number of threads to align each chunk with.
+                                0 or None uses every core. default 1
+        score_size (str):       score size policy of :class:`SSW`.
+                                default 'both'
+
+    Yields:
+        AlignmentChunk of `target_name`, `query_names` and the
+        :class:`BatchAlignment` of the chunk against that target, in file
+        order
+    '''
+    cdef _SeqReader reader
+    cdef SSW aligner
+    cdef int32_t i, n
+    cdef int num_threads = _num_threads(threads)
+    cdef align_opts_t opts
+    align_opts_c('cigar', None, None, &opts)
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+
+    targets = load_targets_c(target_path, match_score, mismatch_penalty, score_size)
+    reader = _SeqReader(query_path)
+    while True:
+        n = reader.readChunk_c(chunk_size, CHUNK_BASES)
+        if n == 0:
+            break
+        query_names = [reader.name_c(i) for i in range(n)]
+        reader.checkChunk_c(n)
+        for target_name, aligner in targets:
+            yield AlignmentChunk(
+                target_name,
+                query_names,
+                aligner.alignReads_c(   reader.seq_ptrs,
+                                        reader.seq_lengths,
+                                        n,
+                                        0,
+                                        <int32_t> aligner.ref_length,
+                                        gap_open,
+                                        gap_extension,
+                                        num_threads,
+                                        False,
+                                        &opts)
+            )
+# end def
+
+cdef list load_targets_c(   target_path,
+                            int match_score,
+                            int mismatch_penalty,
+                            str score_size):
+    """Load the targets of :func:`align_file`
+
+    Returns:
+        list of (name, :class:`SSW`) of each target
+    """
+    cdef _SeqReader reader
+    cdef SSW aligner
+    targets = []
+    if is_reference_index(target_path):
+        for reference in ReferenceIndex(target_path):
+            aligner = SSW(match_score, mismatch_penalty, score_size=score_size)
+            aligner.setReference(reference)
+            targets.append((reference.name, aligner))
+    else:
+        reader = _SeqReader(target_path)
+        while reader.readChunk_c(1, 1) > 0:
+            aligner = SSW(match_score, mismatch_penalty, score_size=score_size)
+            aligner.setReference(reader.seq_c(0))
+            targets.append((reader.name_c(0), aligner))
+    return targets
+# end def
+
+cdef object sam_reference_c(reference, int8_t* encoded):
+    """Buffer of the bases of a reference of :class:`SAMWriter`, leaving
+    an :class:`EncodedReference` encoded
+    """
+    if isinstance(reference, EncodedReference):
+        encoded[0] = 1
+        return (<EncodedReference> reference).data
+    encoded[0] = 0
+    return c_util.obj_to_buffer(reference)
+# end def
+
+cdef class SAMWriter:
+    """Writes alignments as SAM records.  Each record is built in C, with
+    an ``=``/``X`` CIGAR, soft clips and the ``AS``, ``NM`` and ``ZS`` tags
+    of the ``ssw_test`` program, into a buffer that goes to the file
+    ``buffer_size`` bytes at a time.  Usable as a context manager
+    """
+    cdef object out
+    cdef bint owned
+    cdef bint closed
+    cdef char* buf
+    cdef int64_t used
+    cdef int64_t capacity
+    cdef int64_t buffer_size
+    cdef readonly Py_ssize_t records
+
+    def __cinit__(self):
+        self.buf = NULL
+        self.owned = False
+        self.closed = True
+    # end def
+
+    def __init__(self,
+                out,
+                references=None,
+                Py_ssize_t buffer_size=1 << 20):
+        """
+        Args:
+            out: path to write to, or a text or binary file object
+            references: (name, length) pairs of the reference sequences to
+                write a header with ``@SQ`` lines for, or None to write no
+                header. default None
+            buffer_size: bytes collected before each write. default 1 MiB
+
+        Raises:
+            ValueError
+        """
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be >= 1")
+        self.buffer_size = buffer_size
+        self.capacity = buffer_size + 4096
+        self.buf = <char*> PyMem_Malloc(self.capacity)
+        if self.buf == NULL:
+            raise MemoryError('Out of Memory')
+        if isinstance(out, (str, bytes, os.PathLike)):
+            self.out = open(out, 'wb')
+            self.owned = True
+        else:
+            self.out = out
+        self.closed = False
+        self.used = 0
+        self.records = 0
+        if references is not None:
+            self.write_header(references)
+    # end def
+
+    def __dealloc__(self):
+        # a writer dropped without close() still writes out its records
+        # and closes the file it opened
+        try:
+            if not self.closed and self.buf != NULL:
+                self.close()
+        finally:
+            PyMem_Free(self.buf)
+    # end def
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    # end def
+
+    cdef int reserve_c(self, int64_t size) except -1:
+        """Make room for ``size`` more bytes, writing out the buffer first
+        if it is too full
+        """
+        cdef char* grown
+        if self.closed:
+            raise ValueError("write to a closed SAMWriter")
+        if self.used + size <= self.capacity:
+            return 0
+        self.writeBuffer_c()
+        if size > self.capacity:
+            grown = <char*> PyMem_Realloc(self.buf, size)
+            if grown == NULL:
+                raise MemoryError('Out of Memory')
+            self.buf = grown
+            self.capacity = size
+        return 0
+    # end def
+
+    cdef int writeBuffer_c(self) except -1:
+        if self.used > 0:
+            render_write_c(self.out, self.buf, self.used)
+            self.used = 0
+        return 0
+    # end def
+
+    cdef int writeRecord_c(self,
+                        const s_align* result,
+                        const char* qname,
+                        int32_t qname_len,
+                        const char* rname,
+                        int32_t rname_len,
+                        const char* ref_seq,
+                        int8_t ref_encoded,
+                        int64_t ref_offset,
+                        int64_t ref_length,
+                        const char* read_seq,
+                        const char* qual,
+                        int32_t read_len,
+                        int8_t reverse) except -1:
+        """Add the record of ``result`` to the buffer.  ``ref_length`` is
+        the number of bases of ``ref_seq`` after ``ref_offset``
+        """
+        cdef int64_t size = -1
+        if ref_length >= 0:
+            size = ssw_sam_size(result, <int32_t> ref_length, read_len, qname_len, rname_len)
+        if size < 0:
+            raise ValueError("alignment runs past its reference or read")
+        self.reserve_c(size)
+        self.used += ssw_sam_record(result,
+                                    qname, qname_len,
+                                    rname, rname_len,
+                                    ref_seq, ref_encoded, ref_offset,
+                                    read_seq, qual, read_len,
+                                    reverse,
+                                    &self.buf[self.used])
+        self.records += 1
+        if self.used >= self.buffer_size:
+            self.writeBuffer_c()
+        return 0
+    # end def
+
+    def write_header(self, references):
+        """Write a SAM header with an ``@SQ`` line per reference
+
+        Args:
+            references: (name, length) pairs of the reference sequences
+        """
+        lines = ["@HD\tVN:1.6\tSO:unsorted\n"]
+        for name, length in references:
+            lines.append("@SQ\tSN:{}\tLN:{:d}\n".format(name, length))
+        header = ''.join(lines).encode('utf8')
+        self.reserve_c(len(header))
+        memcpy(&self.buf[self.used], <const char*> header, len(header))
+        self.used += len(header)
+    # end def
+
+    def write(self,
+            Alignment alignment,
+            read: STR_T,
+            reference,
+            str query_name,
+            str reference_name,
+            quality: STR_T = None,
+            Py_ssize_t start_idx=0):
+        """Write the record of an alignment of :meth:`SSW.align`.
+        Alignments with no CIGAR or score are written unmapped
+
+        Args:
+            alignment: the alignment
+            read: the read as passed to :meth:`SSW.setRead`, not encoded
+            reference: the reference aligned to, string-like or an
+                :class:`EncodedReference`
+            query_name: QNAME of the read
+            reference_name: RNAME of the reference
+            quality: Phred+33 qualities of the read. default None
+            start_idx: the ``start_idx`` the alignment was aligned with.
+                default 0
+
+        Raises:
+            ValueError
+        """
+        cdef s_align result
+        cdef const char* ref_cstr
+        cdef const char* read_cstr
+        cdef const char* qual_cstr = NULL
+        cdef Py_ssize_t ref_length, read_length, qual_length
+        cdef int8_t ref_encoded
+
+        if start_idx < 0:
+            raise ValueError("start_idx must be >= 0")
+        ref_buffer = sam_reference_c(reference, &ref_encoded)
+        ref_cstr = c_util.buffer_to_cstr_len(ref_buffer, &ref_length)
+        read_buffer = c_util.obj_to_buffer(read)
+        read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+        if quality is not None:
+            qual_buffer = c_util.obj_to_buffer(quality)
+            qual_cstr = c_util.buffer_to_cstr_len(qual_buffer, &qual_length)
+            if qual_length != read_length:
+                raise ValueError("got {} qualities for a read of length {}".format(
+                                qual_length, read_length))
+        qname = query_name.encode('utf8')
+        rname = reference_name.encode('utf8')
+        if alignment.cigar_array is not None:
+            result.cigar = <uint32_t*> <char*> alignment.cigar_bytes
+            result.cigarLen = len(alignment.cigar_bytes) // sizeof(uint32_t)
+        else:
+            result.cigar = NULL
+            result.cigarLen = 0
+        result.score1 = alignment.optimal_score
+        result.score2 = alignment.sub_optimal_score
+        result.ref_begin1 = alignment.reference_start
+        result.ref_end1 = alignment.reference_end
+        result.read_begin1 = alignment.read_start
+        result.read_end1 = alignment.read_end
+        self.writeRecord_c( &result,
+                            qname, len(qname),
+                            rname, len(rname),
+                            ref_cstr, ref_encoded, start_idx, ref_length - start_idx,
+                            read_cstr, qual_cstr, <int32_t> read_length,
+                            alignment.strand == '-')
+    # end def
+
+    def write_batch(self,
+                    alignments,
+                    reads,
+                    reference,
+                    query_names,
+                    str reference_name,
+                    qualities=None,
+                    Py_ssize_t start_idx=0):
+        """Write the records of a :class:`BatchAlignment` of
+        :meth:`SSW.align_batch`, all on the forward strand
+
+        Args:
+            alignments: the :class:`BatchAlignment`
+            reads: the reads of the batch, not encoded
+            reference: the reference aligned to, string-like or an
+                :class:`EncodedReference`
+            query_names: QNAME of each read
+            reference_name: RNAME of the reference
+            qualities: Phred+33 qualities of each read, or None. default None
+            start_idx: the ``start_idx`` the batch was aligned with.
+                default 0
+
+        Raises:
+            ValueError
+        """
+        cdef s_align result
+        cdef const char* ref_cstr
+        cdef const char* read_cstr
+        cdef const char* qual_cstr
+        cdef Py_ssize_t ref_length, read_length, qual_length, i
+        cdef Py_ssize_t num = len(reads)
+        cdef int8_t ref_encoded
+        cdef const uint16_t[::1] score1, score2
+        cdef const int32_t[::1] ref_begin1, ref_end1, read_begin1, read_end1
+        cdef const uint32_t[::1] cigars
+        cdef const int64_t[::1] cigar_offsets
+
+        if len(query_names) != num:
+            raise ValueError("got {} query names for {} reads".format(len(query_names), num))
+        if qualities is not None and len(qualities) != num:
+            raise ValueError("got {} qualities for {} reads".format(len(qualities), num))
+        if len(alignments.optimal_score) != num:
+            raise ValueError("got {} alignments for {} reads".format(
+                            len(alignments.optimal_score), num))
+        if start_idx < 0:
+            raise ValueError("start_idx must be >= 0")
+        ref_buffer = sam_reference_c(reference, &ref_encoded)
+        ref_cstr = c_util.buffer_to_cstr_len(ref_buffer, &ref_length)
+        rname = reference_name.encode('utf8')
+        score1 = np.ascontiguousarray(alignments.optimal_score, dtype=np.uint16)
+        score2 = np.ascontiguousarray(alignments.sub_optimal_score, dtype=np.uint16)
+        ref_begin1 = np.ascontiguousarray(alignments.reference_start, dtype=np.int32)
+        ref_end1 = np.ascontiguousarray(alignments.reference_end, dtype=np.int32)
+        read_begin1 = np.ascontiguousarray(alignments.read_start, dtype=np.int32)
+        read_end1 = np.ascontiguousarray(alignments.read_end, dtype=np.int32)
+        cigars = np.ascontiguousarray(alignments.cigars, dtype=np.uint32)
+        cigar_offsets = np.ascontiguousarray(alignments.cigar_offsets, dtype=np.int64)
+        if cigar_offsets.shape[0] != num + 1 or cigar_offsets[num] > cigars.shape[0]:
+            raise ValueError("cigar_offsets do not match the cigars")
+
+        for i in range(num):
+            read_buffer = c_util.obj_to_buffer(reads[i])
+            read_cstr = c_util.buffer_to_cstr_len(read_buffer, &read_length)
+            qual_cstr = NULL
+            if qualities is not None and qualities[i] is not None:
+                qual_buffer = c_util.obj_to_buffer(qualities[i])
+                qual_cstr = c_util.buffer_to_cstr_len(qual_buffer, &qual_length)
+                if qual_length != read_length:
+                    raise ValueError("got {} qualities for read {} of length {}".format(
+                                    qual_length, i, read_length))
+            qname = query_names[i].encode('utf8')
+            result.cigarLen = <int32_t> (cigar_offsets[i + 1] - cigar_offsets[i])
+            result.cigar = <uint32_t*> &cigars[cigar_offsets[i]] if result.cigarLen > 0 else NULL
+            result.score1 = score1[i]
+            result.score2 = score2[i]
+            result.ref_begin1 = ref_begin1[i]
+            result.ref_end1 = ref_end1[i]
+            result.read_begin1 = read_begin1[i]
+            result.read_end1 = read_end1[i]
+            self.writeRecord_c( &result,
+                                qname, len(qname),
+                                rname, len(rname),
+                                ref_cstr, ref_encoded, start_idx, ref_length - start_idx,
+                                read_cstr, qual_cstr, <int32_t> read_length,
+                                False)
+    # end def
+
+    cdef int writeChunk_c(self,
+                        _SeqReader reader,
+                        int32_t n,
+                        alignments,
+                        SSW aligner,
+                        bytes rname) except -1:
+        """Write the records of the current chunk of ``reader`` aligned by
+        :func:`align_file_sam`, straight from the C buffers of the reader
+        """
+        cdef s_align result
+        cdef int32_t i
+        cdef seq_chunk_t* chunk = &reader.chunk
+        cdef const char* qual
+        cdef const uint16_t[::1] score1 = alignments.optimal_score
+        cdef const uint16_t[::1] score2 = alignments.sub_optimal_score
+        cdef const int32_t[::1] ref_begin1 = alignments.reference_start
+        cdef const int32_t[::1] ref_end1 = alignments.reference_end
+        cdef const int32_t[::1] read_begin1 = alignments.read_start
+        cdef const int32_t[::1] read_end1 = alignments.read_end
+        cdef const uint32_t[::1] cigars = alignments.cigars
+        cdef const int64_t[::1] cigar_offsets = alignments.cigar_offsets
+
+        for i in range(n):
+            qual = NULL
+            if chunk.qual_off[i + 1] > chunk.qual_off[i]:
+                qual = &chunk.quals[chunk.qual_off[i]]
+            result.cigarLen = <int32_t> (cigar_offsets[i + 1] - cigar_offsets[i])
+            result.cigar = <uint32_t*> &cigars[cigar_offsets[i]] if result.cigarLen > 0 else NULL
+            result.score1 = score1[i]
+            result.score2 = score2[i]
+            result.ref_begin1 = ref_begin1[i]
+            result.ref_end1 = ref_end1[i]
+            result.read_begin1 = read_begin1[i]
+            result.read_end1 = read_end1[i]
+            self.writeRecord_c( &result,
+                                &chunk.names[chunk.name_off[i]],
+                                <int32_t> (chunk.name_off[i + 1] - chunk.name_off[i]),
+                                rname, len(rname),
+                                <const char*> aligner.ref_arr, 1, 0, aligner.ref_length,
+                                reader.seq_ptrs[i], qual, reader.seq_lengths[i],
+                                False)
+        return 0
+    # end def
+
+    def flush(self):
+        """Write out the buffered records and flush the file
+        """
+        self.writeBuffer_c()
+        if hasattr(self.out, 'flush'):
+            self.out.flush()
+    # end def
+
+    def close(self):
+        """Write out the buffered records, and close the file if it was
+        opened from a path.  Closing again does nothing
+        """
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.closed = True
+            if self.owned:
+                self.out.close()
+    # end def
+# end class
+
+def align_file_sam( query_path,
+                    target_path,
+                    out,
+                    int match_score=2,
+                    int mismatch_penalty=2,
+                    int gap_open=3,
+                    int gap_extension=1,
+                    int chunk_size=4096,
+                    threads: int = 1,
+                    str score_size='both',
+                    bint header=True) -> int:
+    '''Align as :func:`align_file` and write the alignments as SAM with a
+    :class:`SAMWriter`, built straight from the parsed reads and their
+    qualities.  Records are grouped by query chunk, then by target
+
+    Args:
+        query_path:             path of the query reads
+        target_path:            path of the target (reference) sequences,
+                                or of an index written by
+                                :func:`build_reference_index`
+        out:                    path to write to, or a text or binary file
+                                object
+        match_score (int):      for scoring matches. default 2
+        mismatch_penalty (int): for scoring mismatches. default 2
+        gap_open (int):         penalty for gap_open. default 3
+        gap_extension (int):    penalty for gap_extension. default 1
+        chunk_size (int):       number of query records aligned per chunk.
+                                default 4096
+        threads (int):          number of threads to align each chunk with.
+                                0 or None uses every core. default 1
+        score_size (str):       score size policy of :class:`SSW`.
+                                default 'both'
+        header (bool):          write the SAM header. default True
+
+    Returns:
+        number of records written
+    '''
+    cdef _SeqReader reader
+    cdef SAMWriter writer
+    cdef int32_t n
+    cdef int num_threads = _num_threads(threads)
+    cdef align_opts_t opts
+    align_opts_c('cigar', None, None, &opts)
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+
+    targets = load_targets_c(target_path, match_score, mismatch_penalty, score_size)
+    names = [target_name.encode('utf8') for target_name, aligner in targets]
+    reader = _SeqReader(query_path)
+    writer = SAMWriter(out)
+    try:
+        if header:
+            writer.write_header([(target_name, (<SSW> aligner).ref_length)
+                                for target_name, aligner in targets])
+        while True:
+            n = reader.readChunk_c(chunk_size, CHUNK_BASES)
+            if n == 0:
+                break
+            reader.checkChunk_c(n)
+            for rname, (target_name, aligner) in zip(names, targets):
+                alignments = (<SSW> aligner).alignReads_c(
+                                                reader.seq_ptrs,
+                                                reader.seq_lengths,
+                                                n,
+                                                0,
+                                                <int32_t> (<SSW> aligner).ref_length,
+                                                gap_open,
+                                                gap_extension,
+                                                num_threads,
+                                                False,
+                                                &opts)
+                writer.writeChunk_c(reader, n, alignments, aligner, rname)
+    finally:
+        writer.close()
+    return writer.records
+# end def
+
+# Reference index layout, all integers little endian uint64:
+#   header:   magic, number of records, offset of the record table
+#   sequences encoded as 0-4 codes, each starting on a 64 byte boundary
+#   names:    UTF-8, back to back
+#   table:    (name offset, name length, sequence offset, sequence length)
+#             for each record
+REFERENCE_INDEX_MAGIC = b'SSWREF\x00\x01'
+_INDEX_HEADER = struct.Struct('<8sQQ')
+_INDEX_RECORD = struct.Struct('<QQQQ')
+_INDEX_ALIGN = 64
+
+def build_reference_index(fasta_path, out_path) -> int:
+    '''Encode every sequence of a FASTA/FASTQ file, gzipped or not, into
+    a reference index that :class:`ReferenceIndex` memory maps
+
+    Args:
+        fasta_path: path of the reference sequences
+        out_path: path of the index file to write
+
+    Returns:
+        number of sequences written
+    '''
+    cdef _SeqReader reader = _SeqReader(fasta_path)
+    cdef bytearray encoded = bytearray()
+    cdef Py_ssize_t seq_length, offset
+    records = []
+    names = bytearray()
+
+    with open(out_path, 'wb') as fd:
+        fd.write(_INDEX_HEADER.pack(REFERENCE_INDEX_MAGIC, 0, 0))
+        offset = _INDEX_HEADER.size
+        while reader.readChunk_c(1, 1) > 0:
+            padding = -offset % _INDEX_ALIGN
+            fd.write(b'\x00'*padding)
+            offset += padding
+            seq_length = reader.seq_lengths[0]
+            if len(encoded) < seq_length:
+                encoded = bytearray(seq_length)
+            dnaToInt8(reader.seq_ptrs[0], <int8_t*> (<char*> encoded), seq_length)
+            fd.write(memoryview(encoded)[:seq_length])
+            name = reader.name_c(0).encode('utf8')
+            records.append((len(names), len(name), offset, seq_length))
+            names += name
+            offset += seq_length
+        names_offset = offset
+        fd.write(names)
+        table_offset = names_offset + len(names)
+        for name_offset, name_length, seq_offset, seq_length in records:
+            fd.write(_INDEX_RECORD.pack(names_offset + name_offset,
+                                        name_length,
+                                        seq_offset,
+                                        seq_length))
+        fd.seek(0)
+        fd.write(_INDEX_HEADER.pack(REFERENCE_INDEX_MAGIC, len(records), table_offset))
+    return len(records)
+# end def
+
+class ReferenceIndex(object):
+    '''Read-only memory map of a file written by
+    :func:`build_reference_index`.  Records are :class:`EncodedReference`
+    views into the mapping, so any number of processes share the same page
+    cache and loading costs no parsing or encoding
+    '''
+    def __init__(self, path):
+        '''
+        Args:
+            path: path of the index file
+
+        Raises:
+            ValueError for a file that is not a reference index or is
+            truncated
+        '''
+        self.path = path
+        self._mmap = None
+        self._records = []
+        self._names = {}
+        with open(path, 'rb') as fd:
+            file_size = os.fstat(fd.fileno()).st_size
+            header = fd.read(_INDEX_HEADER.size)
+            if (len(header) < _INDEX_HEADER.size or
+                header[:len(REFERENCE_INDEX_MAGIC)] != REFERENCE_INDEX_MAGIC):
+                raise ValueError("{} is not a reference index".format(path))
+            _, num_records, table_offset = _INDEX_HEADER.unpack(header)
+            if table_offset + num_records*_INDEX_RECORD.size > file_size:
+                raise ValueError("{} is truncated".format(path))
+            self._mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        for i in range(num_records):
+            name_offset, name_length, seq_offset, seq_length = _INDEX_RECORD.unpack_from(
+                view, table_offset + i*_INDEX_RECORD.size)
+            if (name_offset + name_length > file_size or
+                seq_offset + seq_length > file_size):
+                self.close()
+                raise ValueError("{} is truncated".format(path))
+            name = bytes(view[name_offset:name_offset + name_length]).decode('utf8')
+            self._records.append(EncodedReference(
+                view[seq_offset:seq_offset + seq_length], name, validate=False))
+            self._names.setdefault(name, i)
+    # end def
+
+    def close(self):
+        '''Drop the records and unmap the file.  Records still held
+        elsewhere, for instance by an :class:`SSW` aligning against one,
+        keep the mapping alive until they are released
+        '''
+        self._records = []
+        self._names = {}
+        if self._mmap is not None:
+            mapping, self._mmap = self._mmap, None
+            try:
+                mapping.close()
+            except BufferError:
+                pass
+    # end def
+
+    @property
+    def closed(self) -> bool:
+        return self._mmap is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def names(self) -> list:
+        return [record.name for record in self._records]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __getitem__(self, key) -> EncodedReference:
+        '''
+        Args:
+            key: record index or name
+        '''
+        if self._mmap is None:
+            raise ValueError("ReferenceIndex is closed")
+        if isinstance(key, str):
+            key = self._names[key]
+        return self._records[key]
+    # end def
+# end class
+
+def is_reference_index(path) -> bool:
+    '''
+    Returns:
+        True if ``path`` is a file written by :func:`build_reference_index`
+    '''
+    with open(path, 'rb') as fd:
+        return fd.read(len(REFERENCE_INDEX_MAGIC)) == REFERENCE_INDEX_MAGIC
+# end def
@@ -1,19 +1,66 @@
 # -*- coding: utf-8 -*-
+import contextlib
+import io
+import os
+import pickle
+import random
+import tempfile
 import unittest
 
+import numpy as np
+
 try:
     from ssw import (
         SSW,
+        Alignment,
+        EditAligner,
+        EncodedReference,
+        ProfileCache,
+        ReferenceIndex,
+        SAMWriter,
+        SIMD_BACKENDS,
+        align_file,
+        align_file_sam,
+        build_reference_index,
+        cigar_to_str,
         force_align,
-        format_force_align
+        force_align_batch,
+        format_force_align,
+        global_stats,
+        render_alignments,
+        set_simd_backend,
+        simd_backend
     )
+    from ssw import cli
+    from ssw.printer import printer
 except:
     import _setup
     from ssw import (
         SSW,
+        Alignment,
+        EditAligner,
+        EncodedReference,
+        ProfileCache,
+        ReferenceIndex,
+        SAMWriter,
+        SIMD_BACKENDS,
+        align_file,
+        align_file_sam,
+        build_reference_index,
+        cigar_to_str,
         force_align,
-        format_force_align
+        force_align_batch,
+        format_force_align,
+        global_stats,
+        render_alignments,
+        set_simd_backend,
+        simd_backend
     )
+    from ssw import cli
+    from ssw.printer import printer
+
+DEMO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'lib', 'CSSWL', 'demo')
 
 class TestSSW(unittest.TestCase):
 
@@ -61,3 +108,1025 @@ class TestSSW(unittest.TestCase):
         ref = b"TTTTCTGCCCCCACG"
         res = force_align(read, ref)
         format_force_align(read, ref, res)
+
+class TestForceAlign(unittest.TestCase):
+
+    def test_ungapped(self):
+        read = "ACGTACGTTTGACCA"
+        ref = "GGGGG" + read[:7] + "A" + read[7:] + "CCC"
+        res = force_align(read, ref)
+        self.assertEqual(res.CIGAR, "10M")
+        self.assertEqual(res.optimal_score, 16)
+        self.assertEqual((res.reference_start, res.read_start), (5, 0))
+        a = SSW()
+        a.setRead(read)
+        a.setReference(ref)
+        gapped = a.align(gap_open=len(read))
+        self.assertEqual(tuple(res)[3:], tuple(gapped)[3:])
+        self.assertEqual(force_align(read, ref, aligner=SSW(3, 1)).optimal_score, 26)
+        # the read and reference of the aligner are left alone
+        a.setRead("TTTTTTTTTTTTTTTTTT")
+        expected = a.align()
+        self.assertEqual(force_align(read, ref, aligner=a), res)
+        self.assertEqual(force_align_batch([read], [ref], aligner=a), [res])
+        self.assertEqual(a.align(), expected)
+
+    def test_sub_optimal(self):
+        # the best other diagonal ends at 20, inside the mask of 15 around
+        # reference_end 6, and the best beyond it scores 4
+        read = "TAGCCTAAAGCATAGGGG"
+        ref = "TACGAAACCTTCCTCCCCGGGATTTGGTGTACAACTCTCCCA"
+        res = force_align(read, ref)
+        self.assertEqual((res.optimal_score, res.reference_end), (6, 6))
+        self.assertEqual(res.sub_optimal_score, 4)
+        self.assertEqual(force_align(read, ref[:22]).sub_optimal_score, 0)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            force_align("ACG", "TTTTTT")
+        with self.assertRaises(ValueError):
+            force_align("ACGTACGT", "TTACGTACGTTT", force_overhang=True)
+        res = force_align("ACGTACGT", "GTACGT", force_overhang=True)
+        self.assertEqual(res.reference_start, 0)
+
+    def test_batch(self):
+        reads = ["ACGTACGT", "ACG", "GGCATTAC"]
+        refs = ["TTACGTACGTTT", "TTTTTT", "CATTACAAAA"]
+        out = force_align_batch(reads, refs)
+        self.assertEqual(out[0], force_align(reads[0], refs[0]))
+        self.assertIsNone(out[1])
+        self.assertEqual(out[2], force_align(reads[2], refs[2]))
+        with self.assertRaises(ValueError):
+            force_align_batch(reads, refs[:2])
+
+class TestAlignBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.a = SSW()
+        self.a.setReference(b"TTTTACGTCCCCCACGTAAAAACGTGGG")
+        self.reads = [b"ACGT", b"CCCCA", b"ACAGT"]
+
+    def test_matches_align(self):
+        a = self.a
+        res = a.align_batch(self.reads)
+        for i, read in enumerate(self.reads):
+            a.setRead(read)
+            single = a.align()
+            self.assertEqual(res.optimal_score[i], single.optimal_score)
+            self.assertEqual(res.sub_optimal_score[i], single.sub_optimal_score)
+            self.assertEqual(res.reference_start[i], single.reference_start)
+            self.assertEqual(res.reference_end[i], single.reference_end)
+            self.assertEqual(res.read_start[i], single.read_start)
+            self.assertEqual(res.read_end[i], single.read_end)
+
+    def test_offsets(self):
+        a = self.a
+        res = a.align_batch(self.reads)
+        res_cat = a.align_batch(b"".join(self.reads), offsets=[0, 4, 9, 14])
+        self.assertEqual(res.cigar_offsets.tolist(), res_cat.cigar_offsets.tolist())
+        self.assertEqual(res.cigars.tolist(), res_cat.cigars.tolist())
+        self.assertEqual(res.cigar_offsets.tolist(), [0, 1, 2, 5])
+
+    def test_empty(self):
+        res = self.a.align_batch([])
+        self.assertEqual(len(res.optimal_score), 0)
+        with self.assertRaises(ValueError):
+            self.a.align_batch([b"ACGT", b""])
+
+    def test_threads(self):
+        a = self.a
+        reads = self.reads*7
+        res = a.align_batch(reads)
+        res_threaded = a.align_batch(reads, threads=3)
+        for x, y in zip(res, res_threaded):
+            self.assertEqual(x.tolist(), y.tolist())
+
+class TestScoreBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.a = SSW()
+        self.a.setReference(b"TTTTACGTCCCCCACGTAAAAACGTGGG")
+        self.reads = [b"ACGT", b"CCCCA", b"ACAGT", b"TTTTACGTCCCCCACGTAAAAACGTGGG"]*5
+
+    def test_matches_align(self):
+        a = self.a
+        res = a.score_batch(self.reads)
+        for i, read in enumerate(self.reads):
+            a.setRead(read)
+            single = a.align(mode='score')
+            self.assertEqual(res.optimal_score[i], single.optimal_score)
+            self.assertEqual(res.reference_end[i], single.reference_end)
+            self.assertEqual(res.read_end[i], single.read_end)
+
+    def test_inputs(self):
+        a = self.a
+        res = a.score_batch(self.reads[:3])
+        res_cat = a.score_batch(b"".join(self.reads[:3]), offsets=[0, 4, 9, 14])
+        res_encoded = a.score_batch([np.array([0, 1, 2, 3], dtype=np.uint8)], encoded=True)
+        self.assertEqual(res_cat.optimal_score.tolist(), res.optimal_score.tolist())
+        self.assertEqual(res_encoded.optimal_score.tolist(), [8])
+        res = a.score_batch([b"NNNN"], start_idx=4, end_idx=20)
+        self.assertEqual((res.optimal_score[0], res.reference_end[0]), (0, -1))
+
+    def test_empty(self):
+        self.assertEqual(len(self.a.score_batch([]).optimal_score), 0)
+        with self.assertRaises(ValueError):
+            self.a.score_batch([b"ACGT", b""])
+
+class TestStrand(unittest.TestCase):
+
+    def setUp(self):
+        self.a = SSW()
+        self.a.setReference("TTTTTGGGCCCATACGACTTTAAAGGG")
+        self.a.setRead("AAAGTCGTATGGG")
+
+    def test_both(self):
+        a = self.a
+        forward = a.align()
+        reverse = a.align(strand='reverse')
+        both = a.align(strand='both')
+        self.assertEqual(forward.strand, '+')
+        self.assertEqual(reverse.strand, '-')
+        self.assertEqual(both, reverse)
+        self.assertEqual(both.strand, '-')
+        self.assertEqual(both.CIGAR, "13M")
+        a.setRead("CCCATACGACTTT")
+        self.assertEqual(a.align(strand='both'), a.align())
+        self.assertEqual(a.align(strand='both').strand, '+')
+
+    def test_strand_field(self):
+        res = self.a.align(strand='reverse')
+        self.assertEqual(len(res), 7)
+        self.assertEqual(tuple(res), tuple(self.a.align(strand='both')))
+        self.assertNotEqual(res, res._replace(strand='+'))
+        self.assertEqual(pickle.loads(pickle.dumps(res)).strand, '-')
+        with self.assertRaises(ValueError):
+            self.a.align(strand='minus')
+
+class TestAlignTiled(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(13)
+        self.ref = ''.join(rng.choice('ACGT') for _ in range(5000))
+        self.a = SSW()
+        self.a.setReference(self.ref)
+
+    def test_matches_align(self):
+        a = self.a
+        for read in (self.ref[3210:3270], self.ref[990:1040] + self.ref[1045:1080],
+                    'ACGTTGCAACGTTGCA'):
+            a.setRead(read)
+            for start_idx in (0, 17):
+                expected = a.align(start_idx=start_idx)
+                for threads in (1, 2):
+                    res = a.align_tiled(start_idx=start_idx, tile_length=700,
+                                        threads=threads)
+                    self.assertEqual(res, expected)
+            self.assertEqual(a.align_tiled(end_idx=600, tile_length=700),
+                            a.align(end_idx=600))
+
+    def test_saturating_read(self):
+        # the 16 bit kernel masks one column fewer after the best end than
+        # the 8 bit kernel, which changes sub_optimal_score here
+        for score_size in ('both', 'word'):
+            a = SSW(score_size=score_size)
+            a.setReference(self.ref)
+            a.setRead(self.ref[2000:2150])
+            expected = a.align()
+            self.assertEqual((expected.optimal_score, expected.sub_optimal_score), (300, 225))
+            self.assertEqual(a.align_tiled(tile_length=1500), expected)
+
+    def test_tile_length(self):
+        a = self.a
+        a.setRead(self.ref[100:200])
+        with self.assertRaises(ValueError):
+            a.align_tiled(tile_length=200)
+        with self.assertRaises(ValueError):
+            a.align_tiled(gap_extension=0, tile_length=1000)
+        self.assertEqual(a.align_tiled(gap_extension=0, tile_length=1000, overlap=300),
+                        a.align(gap_extension=0))
+
+class TestSeedIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(14)
+        self.ref = ''.join(rng.choice('ACGT') for _ in range(20000))
+        self.a = SSW()
+        self.a.setReference(self.ref)
+
+    def test_lookup(self):
+        index = self.a.build_seed_index(k=8)
+        self.assertEqual(index.k, 8)
+        self.assertEqual(len(index), len(self.ref) - 7)
+        kmer = self.ref[500:508]
+        expected = [i for i in range(len(self.ref) - 7) if self.ref[i:i + 8] == kmer]
+        self.assertEqual(index.lookup(kmer).tolist(), expected)
+        self.assertEqual(len(index.lookup('ACGTNACG')), 0)
+        with self.assertRaises(ValueError):
+            index.lookup('ACGT')
+        with self.assertRaises(ValueError):
+            self.a.build_seed_index(k=3)
+
+    def test_align_seeded(self):
+        a = self.a
+        with self.assertRaises(ValueError):
+            a.align_seeded()
+        a.build_seed_index()
+        read = self.ref[12000:12040] + 'N' + self.ref[12041:12060] + self.ref[12065:12090]
+        a.setRead(read)
+        expected = a.align()
+        self.assertEqual(a.align_seeded(), expected)
+        self.assertEqual(a.align_seeded(exhaustive=True), expected)
+        self.assertEqual(a.align_seeded(start_idx=11000, end_idx=13000),
+                        a.align(start_idx=11000, end_idx=13000))
+        res = a.align_seeded(end_idx=11000)
+        self.assertEqual(res.optimal_score, 0)
+        self.assertEqual(res.reference_end, -1)
+        a.setReference(self.ref)
+        with self.assertRaises(ValueError):
+            a.align_seeded()
+
+class TestAlignTop(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(15)
+        seq = lambda n: ''.join(rng.choice('ACGT') for _ in range(n))
+        self.read = read = seq(60)
+        mutant = read[:10] + ('A' if read[10] != 'A' else 'C') + read[11:]
+        self.ref = seq(500) + read + seq(700) + mutant + seq(300) + read[:40] + seq(400)
+        self.a = SSW()
+        self.a.setRead(self.read)
+        self.a.setReference(self.ref)
+
+    def test_hits(self):
+        a = self.a
+        hits = a.align_top(3, min_score=50)
+        self.assertEqual([hit.optimal_score for hit in hits], [120, 116, 81])
+        self.assertEqual([hit.reference_start for hit in hits], [500, 1260, 1620])
+        self.assertEqual([hit.sub_optimal_score for hit in hits], [116, 81, 0])
+        self.assertEqual(hits[1].CIGAR, '60M')
+        self.assertEqual(tuple(hits[0])[3:], tuple(a.align())[3:])
+        score_hits = a.align_top(3, min_score=50, mode='score')
+        self.assertEqual([hit.reference_end for hit in score_hits],
+                        [hit.reference_end for hit in hits])
+        self.assertEqual(len(a.align_top(10, min_score=100)), 2)
+        self.assertEqual(a.align_top(0), [])
+
+    def test_range(self):
+        hits = self.a.align_top(2, min_score=50, start_idx=600)
+        self.assertEqual([hit.reference_start for hit in hits], [660, 1020])
+        with self.assertRaises(ValueError):
+            self.a.align_top(-1)
+
+    def test_tandem_copies(self):
+        # the realignment window of each copy also holds the one before it
+        rng = random.Random(16)
+        seq = lambda n: ''.join(rng.choice('ACGT') for _ in range(n))
+        ref = seq(300) + self.read + seq(10) + self.read + self.read + seq(300)
+        self.a.setReference(ref)
+        for mode in ('cigar', 'score'):
+            hits = self.a.align_top(5, min_score=100, mode=mode)
+            self.assertEqual([hit.reference_end for hit in hits], [359, 429, 489])
+            self.assertEqual([hit.optimal_score for hit in hits], [120]*3)
+        self.assertEqual([hit.reference_start for hit in hits], [-1]*3)
+
+    def test_many_hits(self):
+        # more hits than the first band of candidates holds
+        hits = self.a.align_top(50, min_separation=5)
+        self.assertEqual(len(hits), 50)
+        ends = sorted(hit.reference_end for hit in hits)
+        self.assertTrue(all(b - a >= 5 for a, b in zip(ends, ends[1:])))
+        top = self.a.align_top(3, min_separation=5)
+        self.assertEqual(top[:2], hits[:2])
+        self.assertEqual(tuple(top[2])[3:], tuple(hits[2])[3:])
+
+class TestAnchor(unittest.TestCase):
+
+    def setUp(self):
+        self.a = SSW()
+        self.a.setRead("ACGTTGCAACGT")
+
+    def test_read_global(self):
+        a = self.a
+        a.setReference("TTTTACGTTGCAAC")
+        self.assertEqual(a.align().CIGAR, '10M')
+        res = a.align(anchor='read_global')
+        self.assertEqual(res.CIGAR, '10M2I')
+        self.assertEqual(res.optimal_score, 16)
+        self.assertEqual((res.read_start, res.read_end), (0, 11))
+        self.assertEqual(a.align(anchor='read_global', mode='score').reference_end, 13)
+        a.setRead("GGGGGG")
+        res = a.align(anchor='read_global')
+        self.assertEqual((res.optimal_score, res.reference_end), (0, -1))
+
+    def test_ref_ends(self):
+        a = self.a
+        a.setReference("TTTTACGTTGCAACGTTTTT")
+        res = a.align(anchor='ref_prefix')
+        self.assertEqual(res.CIGAR, '4D12M')
+        self.assertEqual((res.optimal_score, res.reference_start), (18, 0))
+        res = a.align(anchor='ref_suffix')
+        self.assertEqual((res.optimal_score, res.reference_end), (18, 19))
+        res = a.align(anchor='ref_suffix', end_idx=16)
+        self.assertEqual((res.CIGAR, res.reference_end), ('12M', 15))
+        res = a.align(anchor='ref_prefix', strand='both')
+        self.assertEqual(res.CIGAR, '4D12M')
+        with self.assertRaises(ValueError):
+            a.align(anchor='global')
+
+    def test_cheap_gap_open(self):
+        # with gap_open below gap_extension a gap is reopened rather than
+        # extended, and the passes of an anchored alignment must agree
+        a = SSW(2, 2)
+        a.setRead("CCC")
+        a.setReference("GAGTCCGA")
+        res = a.align(1, 2, anchor='ref_suffix')
+        self.assertEqual((res.CIGAR, res.optimal_score), ('2M2D', 2))
+        self.assertEqual((res.reference_start, res.reference_end), (4, 7))
+        self.assertEqual(a.align(1, 2, anchor='ref_suffix'), a.align(1, 1, anchor='ref_suffix'))
+        res = a.align(1, 2, anchor='read_global')
+        self.assertEqual((res.CIGAR, res.optimal_score), ('1I2M', 3))
+
+class TestEditAligner(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(18)
+        self.ref = ''.join(rng.choice('ACGT') for _ in range(400))
+        self.a = EditAligner()
+
+    def test_search(self):
+        a = self.a
+        read = self.ref[100:130]
+        read = read[:10] + ('A' if read[10] != 'A' else 'C') + read[11:20] + read[21:]
+        a.setRead(read)
+        a.setReference(self.ref)
+        res = a.align()
+        self.assertEqual(res.optimal_score, 2)
+        self.assertEqual((res.reference_start, res.reference_end), (100, 129))
+        self.assertEqual((res.read_start, res.read_end), (0, 28))
+        self.assertEqual(res.CIGAR, '20M1D9M')
+        score = a.align(mode='score')
+        self.assertEqual((score.optimal_score, score.reference_end), (2, 129))
+        self.assertEqual((score.CIGAR, score.reference_start), (None, -1))
+        res = a.align(start_idx=50, end_idx=200)
+        self.assertEqual((res.reference_start, res.reference_end), (50, 79))
+        a.setRead("NNNN")
+        self.assertEqual(a.align().optimal_score, 4)
+
+    def test_global(self):
+        a = self.a
+        read = self.ref[:150] + "TT" + self.ref[150:300]
+        a.setRead(read)
+        a.setReference(self.ref[:300])
+        res = a.align(method='global')
+        self.assertEqual(res.optimal_score, 2)
+        self.assertEqual((res.reference_start, res.reference_end), (0, 299))
+        self.assertEqual(res.CIGAR, '149M2I151M')
+        a.setReference(self.ref[:310])
+        res = a.align(method='global')
+        self.assertEqual((res.optimal_score, res.reference_end), (12, 309))
+        self.assertEqual(a.align(method='search').optimal_score, 2)
+        with self.assertRaises(ValueError):
+            a.align(method='local')
+
+class TestWorkspace(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(19)
+        self.ref = ''.join(rng.choice('ACGT') for _ in range(2000))
+
+    def test_reuse(self):
+        a = SSW()
+        a.setReference(self.ref)
+        self.assertEqual(a.workspace_stats()['size'], 0)
+        a.setRead(self.ref[500:540])
+        first = a.align()
+        stats = a.workspace_stats()
+        self.assertGreater(stats['size'], 0)
+        self.assertEqual(a.align(), first)
+        self.assertEqual(a.workspace_stats()['size'], stats['size'])
+        a.setRead(self.ref[1000:1300])
+        res = a.align()
+        self.assertEqual((res.CIGAR, res.reference_start), ('300M', 1000))
+        grown = a.workspace_stats()
+        self.assertGreater(grown['size'], stats['size'])
+        a.setRead(self.ref[500:540])
+        self.assertEqual(a.align(), first)
+        self.assertEqual(a.workspace_stats()['size'], grown['size'])
+        a.release_workspace()
+        stats = a.workspace_stats()
+        self.assertEqual((stats['size'], stats['peak']), (0, grown['peak']))
+        self.assertEqual(a.align(), first)
+
+    def test_reverse_profiles(self):
+        a = SSW()
+        read = self.ref[100:160]
+        a.setRead(read)
+        expected = []
+        refs = [self.ref[i:i + 100] + read + self.ref[i + 100:i + 200]
+                for i in range(1000, 2000, 100)]
+        for ref in refs:
+            a.setReference(ref)
+            expected.append(a.align())
+        stats = a.workspace_stats()
+        # every alignment ends at the end of the read
+        self.assertEqual((stats['reverse_misses'], stats['reverse_hits']), (1, 9))
+        b = SSW()
+        for ref, res in zip(refs, expected):
+            b.setReference(ref)
+            b.setRead(read)
+            self.assertEqual(b.align(), res)
+        self.assertEqual(b.workspace_stats()['reverse_hits'], 0)
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(11)
+        self.ref = ''.join(random.choice('ACGT') for _ in range(2000))
+        self.read = self.ref[500:700]
+
+    def test_counts(self):
+        a = SSW(stats=True)
+        a.setReference(self.ref)
+        a.setRead(self.read)
+        a.align()
+        a.align(mode='score')
+        a.align_batch([self.read, self.ref[100:150]])
+        stats = a.stats()
+        self.assertEqual(stats['calls']['set_read'], 1)
+        self.assertEqual(stats['calls']['set_reference'], 1)
+        self.assertEqual(stats['calls']['align'], 2)
+        self.assertEqual(stats['calls']['align_batch'], 1)
+        self.assertEqual(stats['alignments'], 4)
+        self.assertEqual(stats['calls']['forward'], 4)
+        self.assertEqual(stats['calls']['reverse'], 3)
+        # the 200 nt read scores 400 and overflows the 8 bit kernel, so its
+        # forward passes run twice
+        self.assertEqual(stats['saturations'], 3)
+        self.assertEqual(stats['cells']['forward'], 3*2*200*2000 + 50*2000)
+        self.assertEqual(stats['profiles_built'], 3)
+        self.assertGreater(stats['nanoseconds']['forward'], 0)
+        self.assertGreater(stats['buffer_peak'], 0)
+        self.assertEqual(a.stats(reset=True), stats)
+        self.assertEqual(a.stats()['alignments'], 0)
+
+    def test_global(self):
+        global_stats(reset=True)
+        quiet = SSW()
+        quiet.setReference(self.ref)
+        quiet.setRead(self.read)
+        quiet.align()
+        self.assertEqual(quiet.stats()['calls']['align'], 0)
+        self.assertEqual(global_stats()['alignments'], 0)
+        quiet.enable_stats()
+        self.assertTrue(quiet.stats_enabled)
+        quiet.align()
+        counted = SSW(stats=True)
+        counted.setReference(self.ref)
+        counted.setRead(self.read)
+        counted.align()
+        del counted
+        self.assertEqual(global_stats(reset=True)['calls']['align'], 2)
+        self.assertEqual(global_stats()['calls']['align'], 0)
+
+class TestPickle(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(12)
+        self.ref = ''.join(random.choice('ACGT') for _ in range(5000))
+        self.read = self.ref[1000:1100] + 'N' + self.ref[1101:1150]
+
+    def test_ssw(self):
+        cache = ProfileCache()
+        a = SSW(match_score=3, mismatch_penalty=1, profile_cache=cache,
+                score_size='adaptive')
+        a.setRead(self.read)
+        a.setReference(self.ref)
+        a.build_seed_index(k=8)
+        for protocol in (2, pickle.HIGHEST_PROTOCOL):
+            b = pickle.loads(pickle.dumps(a, protocol=protocol))
+            self.assertEqual(b.score_size, 'adaptive')
+            self.assertEqual(b.align(), a.align())
+            self.assertEqual(b.align(strand='both'), a.align(strand='both'))
+            self.assertEqual(b.align_seeded(), a.align_seeded())
+            self.assertEqual(b.align(gap_open=5, gap_extension=1),
+                            a.align(gap_open=5, gap_extension=1))
+        # caches are pickled empty, and refilled and shared by the aligners
+        cache, a = pickle.loads(pickle.dumps((cache, a)))
+        self.assertEqual((len(cache), cache.misses), (1, 1))
+        cache, a, b = pickle.loads(pickle.dumps((cache, SSW(profile_cache=cache),
+                                                SSW(profile_cache=cache))))
+        a.setRead(self.read)
+        b.setRead(self.read)
+        self.assertEqual((len(cache), cache.hits), (1, 1))
+
+    def test_encoded_reference(self):
+        ref = EncodedReference(bytes([0, 1, 2, 3, 4, 0]), 'chr')
+        for protocol in (2, pickle.HIGHEST_PROTOCOL):
+            copy = pickle.loads(pickle.dumps(ref, protocol=protocol))
+            self.assertEqual(copy.name, 'chr')
+            self.assertEqual(copy.decode(), 'ACGTNA')
+        a = SSW()
+        a.setRead('CGTN')
+        a.setReference(ref)
+        b = pickle.loads(pickle.dumps(a))
+        self.assertEqual(b.align(), a.align())
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.ref = "TTTTACGTACGGACTTTACCCGGGTTAC"
+        self.read = "ACGTACGGTCTTTACCC"
+        self.a = SSW()
+        self.a.setRead(self.read)
+        self.a.setReference(self.ref)
+
+    def test_render(self):
+        res = self.a.align()
+        text = render_alignments(res, self.ref, self.read)
+        lines = text.split('\n')
+        self.assertEqual(lines[0], "optimal_score: %d\tsub-optimal_score: %d\t" %
+                        (res.optimal_score, res.sub_optimal_score))
+        self.assertEqual(lines[4], "Target:        4    ACGTACGGACTTTACCC    20")
+        self.assertEqual(lines[5], "                    ||||||||*||||||||")
+        self.assertEqual(lines[6], "Query:         0    ACGTACGGTCTTTACCC    16")
+        narrow = render_alignments(res, self.ref.encode(), self.read, width=10, as_bytes=True)
+        self.assertEqual(narrow.split(b'\n')[8], b"Target:       14    TTTACCC    20")
+        with self.assertRaises(ValueError):
+            render_alignments(res, self.ref[:10], self.read)
+
+    def test_many(self):
+        res = self.a.align()
+        rc = self.a.align(strand='reverse', start_idx=2)
+        self.assertEqual(rc.strand, '-')
+        single = render_alignments(res, self.ref, self.read)
+        out = io.StringIO()
+        render_alignments([res, tuple(res)], self.ref, [self.read, self.read], out=out)
+        self.assertEqual(out.getvalue(), single*2)
+        buf = io.BytesIO()
+        render_alignments([rc], self.ref, self.read, start_idx=2, out=buf)
+        lines = buf.getvalue().split(b'\n')
+        self.assertEqual(lines[4], b"Target:        3    CGTACG    8")
+        self.assertEqual(lines[6], b"Query:        10    CGTACG    15")
+
+    def test_unaligned(self):
+        res = self.a.align()
+        b = SSW()
+        b.setRead("TTTT")
+        b.setReference("CCCCCC")
+        none = b.align()
+        self.assertEqual(none.optimal_score, 0)
+        self.assertEqual(none.reference_start, -1)
+        text = render_alignments([none, res], ["CCCCCC", self.ref], ["TTTT", self.read])
+        self.assertEqual(text, render_alignments(none, "CCCCCC", "TTTT") +
+                        render_alignments(res, self.ref, self.read))
+        lines = text.split('\n')
+        self.assertEqual(lines[0], "optimal_score: 0\tsub-optimal_score: 0\t")
+        self.assertEqual(lines[1], "target_end: %d\t" % none.reference_end)
+        self.assertTrue(lines[2].endswith("query_end: %d" % none.read_end))
+        self.assertEqual(lines[3], "")
+        self.assertEqual(lines[4], "optimal_score: %d\tsub-optimal_score: %d\t" %
+                        (res.optimal_score, res.sub_optimal_score))
+        self.assertEqual(lines[8], "Target:        4    ACGTACGGACTTTACCC    20")
+
+    def test_labels(self):
+        res = self.a.align()
+        text = render_alignments(res, self.ref, self.read, labels='reference')
+        lines = text.split('\n')
+        self.assertEqual(lines[1], "reference_start: 4\treference_end: 20\t")
+        self.assertEqual(lines[2], "read_start: 0\tread_end: 16")
+        self.assertEqual(lines[4], "Refer:         4    ACGTACGGACTTTACCC    20")
+        self.assertEqual(lines[6], "Read:          0    ACGTACGGTCTTTACCC    16")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            printer(res, self.ref, self.read)
+        self.assertEqual(out.getvalue(), text)
+        with self.assertRaises(ValueError):
+            render_alignments(res, self.ref, self.read, labels='query')
+
+class TestSAMWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.ref = "CCCCAGTACGTACGGGTTTT"
+        self.read = "AGTACNTACG"
+        self.a = SSW()
+        self.a.setRead(self.read)
+        self.a.setReference(self.ref)
+
+    def test_write(self):
+        out = io.StringIO()
+        with SAMWriter(out, references=[('chr', len(self.ref))]) as writer:
+            writer.write(self.a.align(), self.read, self.ref, 'q1', 'chr', quality='ABCDEFGHIJ')
+            self.a.setRead("CGTAATGTACT")
+            writer.write(self.a.align(strand='both'), "CGTAATGTACT", self.ref, 'q2', 'chr')
+            self.a.setRead("NNNN")
+            writer.write(self.a.align(), "NNNN", self.ref, 'q3', 'chr')
+        self.assertEqual(writer.records, 3)
+        lines = out.getvalue().split('\n')
+        self.assertEqual(lines[:2], ["@HD\tVN:1.6\tSO:unsorted", "@SQ\tSN:chr\tLN:20"])
+        self.assertEqual(lines[2].split('\t')[:6], ['q1', '0', 'chr', '5', '254', '5=1X4='])
+        self.assertEqual(lines[2].split('\t')[9:], ['AGTACNTACG', 'ABCDEFGHIJ', 'AS:i:18', 'NM:i:1'])
+        fields = lines[3].split('\t')
+        self.assertEqual(fields[1], '16')
+        self.assertEqual(fields[5], '5=1I1X4=')
+        self.assertEqual(fields[9], 'AGTACATTACG')
+        self.assertEqual(fields[12], 'NM:i:2')
+        self.assertEqual(lines[4], "q3\t4\t*\t0\t0\t*\t*\t0\t0\tNNNN\t*")
+        with self.assertRaises(ValueError):
+            writer.write(self.a.align(), "NNNN", self.ref, 'q4', 'chr')
+
+    def test_batch_and_file(self):
+        reads = ["AGTACNTACG", "CCAGTA", "GTACGGG"]
+        single = io.BytesIO()
+        writer = SAMWriter(single, buffer_size=16)
+        for i, read in enumerate(reads):
+            self.a.setRead(read)
+            writer.write(self.a.align(), read, self.ref, 'r%d' % i, 'chr')
+        writer.close()
+        batch = io.BytesIO()
+        with SAMWriter(batch) as writer:
+            writer.write_batch(self.a.align_batch(reads), reads, self.ref,
+                                ['r0', 'r1', 'r2'], 'chr')
+        self.assertEqual(batch.getvalue(), single.getvalue())
+
+        query_path = os.path.join(DEMO_PATH, '54mer_hap1_1.100.fastq')
+        target_path = os.path.join(DEMO_PATH, 'Virus_genome.fa.gz')
+        with tempfile.TemporaryDirectory() as tmp:
+            sam_path = os.path.join(tmp, 'out.sam')
+            self.assertEqual(align_file_sam(query_path, target_path, sam_path, chunk_size=7), 100)
+            with open(sam_path) as fd:
+                lines = fd.read().splitlines()
+        self.assertEqual(len(lines), 102)
+        self.assertTrue(lines[1].startswith("@SQ\t"))
+        with open(query_path) as fd:
+            records = fd.read().splitlines()
+        fields = lines[2].split('\t')
+        self.assertEqual(fields[0], records[0][1:].split()[0])
+        self.assertEqual(fields[9:11], records[1:4:2])
+
+    def test_unclosed(self):
+        # records buffered by a writer that is dropped without close() are
+        # still written
+        with tempfile.TemporaryDirectory() as tmp:
+            sam_path = os.path.join(tmp, 'out.sam')
+            writer = SAMWriter(sam_path)
+            writer.write(self.a.align(), self.read, self.ref, 'q1', 'chr')
+            del writer
+            with open(sam_path) as fd:
+                lines = fd.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith("q1\t0\tchr\t5\t"))
+        out = io.BytesIO()
+        writer = SAMWriter(out)
+        writer.write(self.a.align(), self.read, self.ref, 'q1', 'chr')
+        del writer
+        self.assertFalse(out.closed)
+        self.assertTrue(out.getvalue().startswith(b"q1\t"))
+
+class TestAlignFile(unittest.TestCase):
+
+    def test_fastq_against_gzip(self):
+        query_path = os.path.join(DEMO_PATH, '54mer_hap1_1.100.fastq')
+        target_path = os.path.join(DEMO_PATH, 'Virus_genome.fa.gz')
+        chunks = list(align_file(query_path, target_path, chunk_size=7))
+        names = [name for chunk in chunks for name in chunk.query_names]
+        self.assertEqual(len(names), 100)
+        self.assertEqual(len(chunks[0].query_names), 7)
+
+        import gzip
+        with gzip.open(target_path, 'rt') as fd:
+            reference = ''.join(line.strip() for line in fd if line[0] != '>')
+        with open(query_path) as fd:
+            reads = [line.strip() for i, line in enumerate(fd) if i % 4 == 1]
+        a = SSW()
+        a.setReference(reference)
+        chunk = chunks[1]
+        res = chunk.alignments
+        for i in range(len(chunk.query_names)):
+            a.setRead(reads[7 + i])
+            single = a.align()
+            self.assertEqual(res.optimal_score[i], single.optimal_score)
+            self.assertEqual(res.reference_end[i], single.reference_end)
+            cigar = res.cigars[res.cigar_offsets[i]:res.cigar_offsets[i + 1]]
+            self.assertEqual(cigar_to_str(cigar), single.CIGAR)
+
+    def test_cli(self):
+        out = io.StringIO()
+        cli.write_chunk(next(align_file(os.path.join(DEMO_PATH, 'query.fa'),
+                                        os.path.join(DEMO_PATH, 'target.fa'))),
+                        out)
+        self.assertEqual(out.getvalue(), "target\tquery\t6\t0\t2\t4\t1\t3\t3M\n")
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            next(align_file('does_not_exist.fa', os.path.join(DEMO_PATH, 'target.fa')))
+
+class TestProfileCache(unittest.TestCase):
+
+    def test_shared_cache(self):
+        cache = ProfileCache()
+        a = SSW(profile_cache=cache)
+        b = SSW(profile_cache=cache)
+        a.setReference(b"TTTTACGTCCCCC")
+        b.setReference(b"TTTTACGTCCCCC")
+        a.setRead(b"ACGT")
+        b.setRead(b"ACGT")
+        a.setRead(b"ACGT")
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(a.align(), b.align())
+        # different scoring must not share a profile
+        c = SSW(match_score=3, profile_cache=cache)
+        c.setRead(b"ACGT")
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_eviction(self):
+        a = SSW(profile_cache=ProfileCache(max_bytes=0))
+        a.setReference(b"TTTTACGTCCCCC")
+        a.setRead(b"ACGT")
+        self.assertEqual(a.align().optimal_score, 8)
+
+        cache = ProfileCache()
+        a = SSW(profile_cache=cache)
+        a.setRead(b"ACGT")
+        cache_size = cache.nbytes
+        cache = ProfileCache(max_bytes=2*cache_size)
+        a = SSW(profile_cache=cache)
+        for read in (b"ACGT", b"CCGT", b"ACGT", b"TTGT"):
+            a.setRead(read)
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 2)
+        self.assertLessEqual(stats['nbytes'], stats['max_bytes'])
+
+class TestReferenceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmpdir.name, 'ref.sswref')
+        fasta_path = os.path.join(self.tmpdir.name, 'ref.fa')
+        with open(fasta_path, 'w') as fd:
+            fd.write(">first\nTTTTACGTCCCCC\n>second\nGGGACAGTGGGnGG\n")
+        self.assertEqual(build_reference_index(fasta_path, self.index_path), 2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load(self):
+        index = ReferenceIndex(self.index_path)
+        self.assertEqual(index.names, ['first', 'second'])
+        self.assertEqual(len(index['second']), 14)
+        self.assertEqual(index[1].decode(), "GGGACAGTGGGNGG")
+        self.assertEqual(index[0].decode(4, 8), "ACGT")
+
+    def test_align(self):
+        index = ReferenceIndex(self.index_path)
+        a = SSW()
+        a.setRead(b"ACGT")
+        for name, ref in ((b"first", b"TTTTACGTCCCCC"), (b"second", b"GGGACAGTGGGNGG")):
+            a.setReference(ref)
+            expected = a.align()
+            a.setReference(index[name.decode()])
+            self.assertEqual(a.align(), expected)
+        del index
+        # the aligner keeps the mapping alive
+        self.assertEqual(a.align(), expected)
+
+    def test_not_an_index(self):
+        with self.assertRaises(ValueError):
+            ReferenceIndex(os.path.join(DEMO_PATH, 'target.fa'))
+        with open(self.index_path, 'rb') as fd:
+            data = fd.read()
+        bad_path = os.path.join(self.tmpdir.name, 'bad.sswref')
+        for size in (0, 10, len(data) - 1):
+            with open(bad_path, 'wb') as fd:
+                fd.write(data[:size])
+            with self.assertRaises(ValueError):
+                ReferenceIndex(bad_path)
+
+    def test_close(self):
+        a = SSW()
+        a.setRead(b"ACGT")
+        with ReferenceIndex(self.index_path) as index:
+            a.setReference(index['first'])
+        self.assertTrue(index.closed)
+        self.assertEqual(len(index), 0)
+        with self.assertRaises(ValueError):
+            index['first']
+        # the record the aligner holds stays mapped
+        self.assertEqual(a.align().reference_start, 4)
+        index = ReferenceIndex(self.index_path)
+        index.close()
+        index.close()
+
+class TestBufferInput(unittest.TestCase):
+
+    def setUp(self):
+        self.aligner = SSW()
+        self.aligner.setRead("ACTG")
+        self.aligner.setReference("ACTCACTG")
+        self.expected = self.aligner.align()
+
+    def test_numpy_ascii(self):
+        a = SSW()
+        a.setRead(np.frombuffer(b"ACTG", dtype=np.uint8))
+        a.setReference(bytearray(b"ACTCACTG"))
+        self.assertEqual(a.align(), self.expected)
+
+    def test_encoded(self):
+        a = SSW()
+        a.setRead(np.array([0, 1, 3, 2], dtype=np.uint8), encoded=True)
+        genome = np.array([3, 3, 0, 1, 3, 1, 0, 1, 3, 2, 3], dtype=np.uint8)
+        # a slice of a larger array is aligned in place
+        a.setReference(genome[2:10], encoded=True)
+        self.assertEqual(a.align(), self.expected)
+        with self.assertRaises(ValueError):
+            a.setReference(np.frombuffer(b"ACTG", dtype=np.uint8), encoded=True)
+
+    def test_align_batch(self):
+        reads = np.array([0, 1, 3, 2, 1, 0, 1, 3, 2], dtype=np.uint8)
+        result = self.aligner.align_batch(reads, offsets=[0, 4, 9], encoded=True)
+        self.assertEqual(result.optimal_score[0], self.expected.optimal_score)
+        ascii_result = self.aligner.align_batch([b"ACTG", bytearray(b"CACTG")])
+        self.assertEqual(list(result.optimal_score), list(ascii_result.optimal_score))
+        with self.assertRaises(ValueError):
+            self.aligner.align_batch([b"ACTG"], encoded=True)
+
+    def test_non_contiguous(self):
+        with self.assertRaises(ValueError):
+            self.aligner.setRead(np.frombuffer(b"AACCTTGG", dtype=np.uint8)[::2])
+
+class TestAlignModes(unittest.TestCase):
+
+    def setUp(self):
+        self.aligner = SSW()
+        self.aligner.setRead("ACTG")
+        self.aligner.setReference("ACTCACTG")
+        self.full = self.aligner.align()
+
+    def test_modes(self):
+        score = self.aligner.align(mode='score')
+        self.assertIsNone(score.CIGAR)
+        self.assertEqual(score.reference_start, -1)
+        self.assertEqual(score.optimal_score, self.full.optimal_score)
+        self.assertEqual(score.reference_end, self.full.reference_end)
+        start = self.aligner.align(mode='start')
+        self.assertIsNone(start.CIGAR)
+        self.assertEqual(start[1:], self.full[1:])
+        with self.assertRaises(ValueError):
+            self.aligner.align(mode='full')
+
+    def test_filters(self):
+        self.assertEqual(self.aligner.align(score_filter=8), self.full)
+        rejected = self.aligner.align(score_filter=9)
+        self.assertIsNone(rejected.CIGAR)
+        self.assertEqual(rejected.reference_start, -1)
+        self.assertEqual(self.aligner.align(distance_filter=3), self.full)
+        rejected = self.aligner.align(distance_filter=2)
+        self.assertIsNone(rejected.CIGAR)
+        self.assertEqual(rejected.reference_start, 4)
+        with self.assertRaises(ValueError):
+            self.aligner.align(mode='score', score_filter=8)
+
+    def test_align_batch(self):
+        result = self.aligner.align_batch(["ACTG", "ACTCA"], mode='score')
+        self.assertEqual(list(result.reference_start), [-1, -1])
+        self.assertEqual(len(result.cigars), 0)
+        result = self.aligner.align_batch(["ACTG", "ACTCA"], score_filter=9)
+        self.assertEqual(list(result.cigar_offsets), [0, 0, 1])
+
+class TestScoreSize(unittest.TestCase):
+
+    def setUp(self):
+        self.reference = "CAGT"*100
+        # scores 400, which saturates the 8 bit kernel
+        self.long_read = self.reference[:200]
+        self.short_read = "CAGTCAGTCA"
+
+    def test_policies(self):
+        expected = []
+        for score_size in ('both', 'word', 'auto', 'adaptive'):
+            a = SSW(score_size=score_size)
+            a.setReference(self.reference)
+            results = []
+            for read in (self.long_read, self.short_read):
+                a.setRead(read)
+                results.append(a.align())
+            if expected:
+                self.assertEqual(results, expected)
+            expected = results
+        self.assertEqual(expected[0].optimal_score, 400)
+        with self.assertRaises(ValueError):
+            SSW(score_size='nibble')
+
+    def test_sub_optimal(self):
+        # only sub_optimal_score depends on the kernel
+        rng = random.Random(5)
+        reference = ''.join(rng.choice('ACGT') for _ in range(2000))
+        reads = [reference[i:i + n] for i, n in ((100, 40), (700, 60), (1500, 200))]
+        expected = []
+        for score_size in ('both', 'word', 'auto'):
+            a = SSW(score_size=score_size)
+            a.setReference(reference)
+            results = []
+            for read in reads:
+                a.setRead(read)
+                res = tuple(a.align())
+                results.append(res[:2] + res[3:])
+            if expected:
+                self.assertEqual(results, expected)
+            expected = results
+
+    def test_stats(self):
+        a = SSW(score_size='auto')
+        a.setReference(self.reference)
+        a.align_batch([self.long_read, self.short_read])
+        stats = a.scoreSizeStats()
+        self.assertEqual((stats['byte'], stats['word'], stats['fallback']), (1, 1, 0))
+        a = SSW()
+        a.setReference(self.reference)
+        a.align_batch([self.long_read, self.short_read])
+        stats = a.scoreSizeStats()
+        self.assertEqual((stats['byte'], stats['word'], stats['fallback']), (1, 0, 1))
+
+    def test_adaptive(self):
+        a = SSW(score_size='adaptive')
+        a.setReference(self.reference)
+        a.setRead(self.long_read)
+        for i in range(3):
+            a.align()
+        stats = a.scoreSizeStats()
+        # the first saturation switches the read to the word kernel
+        self.assertEqual((stats['word'], stats['fallback']), (2, 1))
+
+class TestAlignment(unittest.TestCase):
+
+    def setUp(self):
+        a = SSW()
+        a.setRead("ACTGACTGACTGAAAACTG")
+        a.setReference("TTTACTGACTGACTGACTGAAAAACTGTT")
+        self.result = a.align()
+
+    def test_cigar(self):
+        self.assertEqual(list(self.result.cigar_array), [192, 18, 112])
+        self.assertEqual(self.result.CIGAR, "12M1D7M")
+        self.assertEqual(cigar_to_str(self.result.cigar_array), "12M1D7M")
+        self.assertEqual(list(Alignment("12M1D7M", 0, 0, 0, 0, 0, 0).cigar_array),
+                        [192, 18, 112])
+
+    def test_tuple_compatible(self):
+        res = self.result
+        self.assertEqual(res._fields[0], 'CIGAR')
+        self.assertEqual(len(res), 7)
+        self.assertEqual(res, ("12M1D7M", 35, 16, 7, 26, 0, 18))
+        cigar, optimal_score, *_ = res
+        self.assertEqual((cigar, optimal_score), ("12M1D7M", 35))
+        self.assertEqual(res[-1], 18)
+        self.assertEqual(res._asdict()['reference_start'], 7)
+        self.assertEqual(res._replace(read_end=1).read_end, 1)
+        self.assertEqual(pickle.loads(pickle.dumps(res)), res)
+
+class TestSimdBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = simd_backend()
+
+    def tearDown(self):
+        set_simd_backend(self.backend)
+
+    def test_backend(self):
+        self.assertIn(self.backend, SIMD_BACKENDS)
+        with self.assertRaises(ValueError):
+            set_simd_backend('bogus')
+        self.assertEqual(simd_backend(), self.backend)
+
+    def test_backends_agree(self):
+        rng = np.random.RandomState(0)
+        reference = ''.join(rng.choice(list('ACGT'), 3000))
+        cases = []
+        for read_length in (40, 150, 400, 900):
+            start = rng.randint(0, len(reference) - read_length)
+            read = list(reference[start:start + read_length])
+            for i in rng.randint(0, read_length, read_length // 10):
+                read[i] = 'ACGT'[(('ACGT'.index(read[i])) + 1) % 4]
+            cases.append(''.join(read))
+        expected = None
+        for backend in SIMD_BACKENDS:
+            try:
+                set_simd_backend(backend)
+            except ValueError:  # not supported by this CPU
+                continue
+            self.assertEqual(simd_backend(), backend)
+            a = SSW()
+            a.setReference(reference)
+            results = []
+            for read in cases:
+                a.setRead(read)
+                results.append(a.align(gap_open=3, gap_extension=1))
+                results.append(a.align(gap_open=1, gap_extension=1))
+            if expected is None:
+                expected = results
+            else:
+                self.assertEqual(results, expected, backend)